@@ -0,0 +1,1859 @@
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from last import (FINGER_CHAINS, GESTURES, HAND_LABELS, INDEX_TIP, WRIST, AdaptiveHandTracker, AppIndex, CachedLevelController, CommandExecutor, CommandMatcher,
+                  DetectedHands, EventRecorder, Frame, FrameBufferPool, FrameCompositor, GestureClassifier, IdleGate,
+                  LandmarkRecorder, LazyModule, LandmarkRecording, ProcessHandTracker, RecordingInputBackend,
+                  RecordingSystemController, ReplayHarness, ReplaySource, ScreenshotService, VirtualKeyboard, VirtualMouse,
+                  VoiceActivityDetector, VoiceCommandHandler, WordPredictor, make_pointer_filter, make_speech_backend)
+
+# Only the subcommands that run the models or the recognizer import them
+mp = LazyModule("mediapipe")
+sr = LazyModule("speech_recognition")
+tts = LazyModule("pyttsx3")
+
+def linear_hit_test(keyboard, finger_pos):
+    # The per-call row/key scan get_clicked_key used before KeyboardGeometry
+    current_y = keyboard.window_height - 5 * (keyboard.button_height + keyboard.button_margin) - 20
+    layout = 'shift' if keyboard.shift_pressed else 'normal'
+    x, y = finger_pos
+    for row_idx, row in enumerate(keyboard.keyboard_layout[layout]):
+        current_x = keyboard.keyboard_start_x + 20 * row_idx
+        for key in row:
+            width = keyboard.get_key_width(key)
+            if (current_x < x < current_x + width and
+                current_y < y < current_y + keyboard.button_height):
+                return key
+            current_x += width + keyboard.button_margin
+        current_y += keyboard.button_height + keyboard.button_margin
+    return None
+
+def recording_backend():
+    return RecordingInputBackend(EventRecorder())
+
+def time_per_call(func, points, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for point in points:
+            func(point)
+        best = min(best, time.perf_counter() - start)
+    return best / len(points) * 1e6
+
+def bench_hit_testing(args):
+    keyboard = VirtualKeyboard(None, None, None, 960, 540, recording_backend())
+    rng = random.Random(0)
+    points = [(rng.uniform(0, 960), rng.uniform(keyboard.keyboard_start_y - 20, 540))
+              for _ in range(args.points)]
+
+    mismatches = sum(linear_hit_test(keyboard, p) != keyboard.get_clicked_key(p) for p in points)
+    linear = time_per_call(lambda p: linear_hit_test(keyboard, p), points, args.repeat)
+    compiled = time_per_call(keyboard.get_clicked_key, points, args.repeat)
+    print(f"Linear scan:       {linear:7.2f} us/lookup")
+    print(f"Compiled geometry: {compiled:7.2f} us/lookup ({linear / compiled:.1f}x faster)")
+    print(f"Mismatches: {mismatches} / {len(points)}")
+
+    for width, height in [(640, 360), (1280, 720), (1920, 1080)]:
+        keyboard.set_window_size(width, height)
+        geometry = keyboard.get_geometry('normal')
+        print(f"{width}x{height}: scale {geometry.scale:.2f}, keyboard spans "
+              f"x {geometry.rects[:, 0].min()}-{geometry.rects[:, 2].max()}, "
+              f"y {geometry.rects[:, 1].min()}-{geometry.rects[:, 3].max()}")
+    return mismatches == 0 and compiled < linear
+
+def legacy_gestures(mouse, hand_landmarks, img_shape):
+    # Per-attribute dict building and pairwise math.sqrt from before the landmark arrays
+    h, w, _ = img_shape
+    lm = hand_landmarks.landmark
+    names = {'wrist': 0, 'thumb_tip': 4, 'thumb_mcp': 2, 'index_tip': 8, 'middle_tip': 12,
+             'ring_tip': 16, 'pinky_tip': 20, 'index_mcp': 5, 'middle_mcp': 9, 'ring_mcp': 13, 'pinky_mcp': 17}
+    landmarks = {name: (int(lm[i].x * w), int(lm[i].y * h)) for name, i in names.items()}
+    is_finger_up = {finger: landmarks[f'{finger}_tip'][1] < landmarks[f'{finger}_mcp'][1]
+                    for finger in ['index', 'middle', 'ring', 'pinky']}
+    distance = lambda p1, p2: math.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2)
+    left_click = distance(landmarks['thumb_tip'], landmarks['index_tip']) < mouse.click_distance_threshold * img_shape[1]
+    right_click = distance(landmarks['thumb_tip'], landmarks['middle_tip']) < mouse.click_distance_threshold * img_shape[1]
+    scrolling = is_finger_up['pinky'] and not is_finger_up['ring']
+    dragging = all(distance(landmarks['thumb_tip'], landmarks[f'{finger}_tip']) < mouse.drag_distance_threshold * img_shape[1]
+                   for finger in ['index', 'middle', 'ring', 'pinky'])
+    return left_click, right_click, scrolling, dragging
+
+def legacy_click(hand_landmarks):
+    index_tip = hand_landmarks.landmark[8]
+    thumb_tip = hand_landmarks.landmark[4]
+    return math.sqrt((thumb_tip.x - index_tip.x) ** 2 + (thumb_tip.y - index_tip.y) ** 2) < 0.05
+
+def synthetic_hands(count, seed=0):
+    rng = np.random.default_rng(seed)
+    hands = rng.uniform(0.2, 0.8, size=(count, 21, 3))
+    # Pull the fingertips towards the thumb on a share of frames so every gesture is exercised
+    pinch = rng.uniform(0, 1, size=count) < 0.5
+    pull = rng.uniform(0.8, 1.0, size=(count, 4, 1))
+    tips = hands[:, [8, 12, 16, 20], :]
+    tips[pinch] += (hands[pinch, 4:5, :] - tips[pinch]) * pull[pinch]
+    hands[:, [8, 12, 16, 20], :] = tips
+    return hands
+
+def bench_gesture_parity(args):
+    hands = np.load(args.landmarks).reshape(-1, 21, 3) if args.landmarks else synthetic_hands(args.frames)
+    mouse = VirtualMouse(None, None, None, 960, 540, recording_backend())
+    keyboard = VirtualKeyboard(None, None, None, 960, 540, recording_backend())
+    img_shape = (540, 960, 3)
+    as_proto = [SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in hand])
+                for hand in hands]
+    handedness = SimpleNamespace(classification=[SimpleNamespace(label="Right", score=1.0)])
+
+    mismatches = 0
+    for landmarks, proto in zip(hands, as_proto):
+        points, tip_offsets = mouse.get_finger_positions(landmarks, img_shape)
+        gestures = mouse.detect_gestures(tip_offsets, img_shape)
+        if gestures != legacy_gestures(mouse, proto, img_shape) or keyboard.detect_click(landmarks) != legacy_click(proto):
+            mismatches += 1
+
+    def legacy_frame(proto):
+        legacy_gestures(mouse, proto, img_shape)
+        legacy_gestures(mouse, proto, img_shape)
+        legacy_click(proto)
+
+    def array_frame(proto):
+        # Includes the conversion the inference stage does once per frame
+        landmarks = DetectedHands.from_results(SimpleNamespace(multi_hand_landmarks=[proto],
+                                                               multi_handedness=[handedness])).landmarks[0]
+        points, tip_offsets = mouse.get_finger_positions(landmarks, img_shape)
+        mouse.detect_gestures(tip_offsets, img_shape)
+        keyboard.detect_click(landmarks)
+
+    # Alternating rounds, so a burst of load on the machine hits both paths alike
+    legacy = shared = float('inf')
+    for _ in range(args.repeat):
+        legacy = min(legacy, time_per_call(legacy_frame, as_proto, 1))
+        shared = min(shared, time_per_call(array_frame, as_proto, 1))
+    print(f"Frames checked: {len(hands)}, mismatches: {mismatches}")
+    print(f"Legacy per-hand cost:       {legacy:7.2f} us")
+    print(f"Shared-array per-hand cost: {shared:7.2f} us")
+    passed = True
+    if mismatches:
+        print("The landmark arrays must give the same gestures as the per-landmark code")
+        passed = False
+    if shared >= legacy:
+        print("FAIL: the shared-array path is no faster than the per-landmark code it replaces")
+        passed = False
+    return passed
+
+def synthetic_pose(pose):
+    # Open right hand with fingers up; pinches pull the named fingertips onto the thumb tip
+    hand = np.zeros((21, 3))
+    hand[0] = (0.5, 0.8, 0)
+    hand[1:5] = [(0.42, 0.72, 0), (0.38, 0.66, 0), (0.36, 0.6, 0), (0.35, 0.55, 0)]
+    for finger, x in enumerate((0.45, 0.5, 0.55, 0.6)):
+        base = 5 + finger * 4
+        hand[base:base + 4] = [(x, 0.6 - 0.07 * joint, 0) for joint in range(4)]
+    pinched = {"open": [], "left": [8], "right": [12], "drag": [8, 12, 16, 20], "scroll": []}[pose]
+    for tip in pinched:
+        hand[tip] = hand[4] + (0.005, 0.005, 0)
+    if pose == "scroll":
+        hand[16] = (0.55, 0.65, 0)
+    return hand
+
+# Frame and event for each gesture in the timeline below at 30 fps
+TIMELINE_EVENTS = [(10, "click", []), (17, "double_click", []), (41, "right_click", []), (63, "mouse_down", []),
+                   (78, "mouse_up", []), (81, "click", []), (93, "scroll", [-15]), (96, "scroll", [-15]),
+                   (100, "scroll", [-15]), (104, "scroll", [-15]), (107, "scroll", [-15]),
+                   (113, "mouse_down", []), (123, "mouse_up", [])]
+
+def bench_gesture_timeline(args):
+    recorder = EventRecorder()
+    mouse = VirtualMouse(None, None, None, 960, 540, RecordingInputBackend(recorder))
+    # "gone" frames have no hand at all: a drag must not outlive the hand that started it
+    timeline = [("open", 10), ("left", 4), ("open", 3), ("left", 4), ("open", 20), ("right", 12),
+                ("open", 10), ("drag", 15), ("open", 2), ("left", 3), ("open", 10), ("scroll", 15), ("open", 5),
+                ("drag", 10), ("gone", 5), ("open", 5)]
+    img = np.zeros((540, 960, 3), dtype=np.uint8)
+    frame_times = []
+    index = 0
+    for pose, frames in timeline:
+        hands = DetectedHands() if pose == "gone" else DetectedHands(synthetic_pose(pose)[None], ["Right"], [1.0])
+        for _ in range(frames):
+            frame = Frame(index, img, index / 30)
+            recorder.current_frame = lambda frame=frame: frame
+            start = time.perf_counter()
+            mouse.handle_hand_gestures(hands, hands.index_of("Right"), img, frame.timestamp)
+            frame_times.append(time.perf_counter() - start)
+            index += 1
+
+    events = [(event["frame"], event["action"], event["args"]) for event in recorder.events
+              if event["action"] != "move_to"]
+    for frame, action, event_args in events:
+        print(f"frame {frame:3d} t={frame / 30:.3f}s {action} {event_args}")
+    print(f"Frames: {len(frame_times)}, handler time p50 {np.percentile(frame_times, 50) * 1000:.2f} ms, "
+          f"max {max(frame_times) * 1000:.2f} ms")
+    if events != TIMELINE_EVENTS:
+        missing = [event for event in TIMELINE_EVENTS if event not in events]
+        unexpected = [event for event in events if event not in TIMELINE_EVENTS]
+        print(f"Timeline regressed: missing {missing}, unexpected {unexpected}")
+        return False
+    print("Timeline matches")
+    return True
+
+def landmark_session(path, segments, fps=30):
+    # segments: (frames, right hand or None, left hand or None), written as a LandmarkFileSource .npz
+    landmarks, labels = [], []
+    for frames, right, left in segments:
+        slots = [(hand, label) for hand, label in ((right, "Right"), (left, "Left")) if hand is not None]
+        frame_landmarks = np.zeros((2, 21, 3))
+        frame_labels = ["", ""]
+        for slot, (hand, label) in enumerate(slots):
+            frame_landmarks[slot] = hand
+            frame_labels[slot] = label
+        landmarks += [frame_landmarks] * frames
+        labels += [frame_labels] * frames
+    np.savez(path, timestamps=np.arange(len(landmarks)) / fps, landmarks=np.array(landmarks), labels=np.array(labels))
+
+def pose_at(pose, x, y, window=(960, 540)):
+    # The pose moved so its index fingertip lands on pixel (x, y)
+    hand = synthetic_pose(pose)
+    hand[:, :2] += (x / window[0], y / window[1]) - hand[INDEX_TIP, :2]
+    return hand
+
+def bench_hand_loss(args):
+    # Through ReplayHarness, so the frame loop's handling of a missing hand is what gets checked
+    geometry = VirtualKeyboard(None, None, None, 960, 540, recording_backend()).get_geometry('normal')
+    key_centers = {key: ((x1 + x2) / 2, (y1 + y2) / 2) for key, (x1, y1, x2, y2) in zip(geometry.labels, geometry.rects)}
+    returned = synthetic_pose("open") + (0.2, 0.1, 0)
+    segments = [
+        # Frames 0-19: a drag that ends with the right hand leaving
+        (5, synthetic_pose("open"), None), (10, synthetic_pose("drag"), None), (5, None, None),
+        # Frames 20-24: the right hand comes back elsewhere
+        (5, returned, None),
+        # Frames 25-37: the left hand rests over 'q', leaves, and comes back pinching over 'p'
+        (5, None, pose_at("open", *key_centers['q'])), (5, None, None), (3, None, pose_at("left", *key_centers['p'])),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "hand_loss.npz")
+        landmark_session(path, segments)
+        events = [(event["frame"], event["action"], event["args"]) for event in ReplayHarness(path).run()["events"]]
+
+    # Where a cursor with no history puts the returned hand
+    recorder = EventRecorder()
+    VirtualMouse(None, None, None, 960, 540, RecordingInputBackend(recorder)).handle_hand_gestures(
+        DetectedHands(returned[None], ["Right"], [1.0]), 0, None, 0.0, (540, 960, 3))
+    expected_return = recorder.events[0]["args"]
+
+    passed = True
+    buttons = [(frame, action) for frame, action, _ in events if action in ("mouse_down", "mouse_up")]
+    print(f"Button events: {buttons}")
+    if buttons != [(5, "mouse_down"), (15, "mouse_up")]:
+        print("The button must be released on the first frame without the hand")
+        passed = False
+    moves = [event_args for frame, action, event_args in events if action == "move_to" and frame >= 20]
+    print(f"First cursor position after the hand returns: {moves[:1]}, expected {expected_return}")
+    if moves[:1] != [expected_return]:
+        print("The cursor filter must restart at the returned hand instead of sliding in from the old position")
+        passed = False
+    keys = [(frame, event_args) for frame, action, event_args in events if action == "tap_char"]
+    print(f"Keys typed: {keys}")
+    if keys != [(35, ['p'])]:
+        print("The keyboard filter must restart at the returned hand, pressing 'p' on frame 35")
+        passed = False
+    if passed:
+        print("Hand loss handled")
+    return passed
+
+def make_hands(max_num_hands=2):
+    return mp.solutions.hands.Hands(max_num_hands=max_num_hands, min_detection_confidence=0.8, min_tracking_confidence=0.8)
+
+def preprocess(image):
+    image = cv2.flip(image, 1)
+    image = cv2.convertScaleAbs(image, alpha=1.3, beta=30)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+# Open right hand, palm to the camera, in palm lengths from the wrist; joint widths in the same units
+HAND_OUTLINE = np.array([(0, 0), (-0.35, -0.12), (-0.6, -0.35), (-0.78, -0.58), (-0.92, -0.78),
+                         (-0.28, -0.95), (-0.36, -1.35), (-0.41, -1.6), (-0.45, -1.82),
+                         (-0.02, -1.0), (-0.03, -1.45), (-0.04, -1.73), (-0.05, -1.97),
+                         (0.22, -0.93), (0.28, -1.33), (0.32, -1.58), (0.35, -1.8),
+                         (0.42, -0.8), (0.55, -1.1), (0.62, -1.28), (0.68, -1.45)])
+JOINT_WIDTHS = [0, 0.24, 0.22, 0.2, 0.18, 0, 0.2, 0.18, 0.16, 0, 0.21, 0.19, 0.17, 0, 0.2, 0.18, 0.16, 0, 0.17, 0.15, 0.13]
+
+def draw_hand(image, wrist, size, mirror=False, skin=(92, 115, 150)):
+    # A flat hand and forearm; plain enough to draw, close enough for MediaPipe's palm detector
+    points = HAND_OUTLINE * (-size if mirror else size, size) + wrist
+    across = np.array([0.32 * size, 0])
+    forearm = np.array([wrist - across, wrist + across, wrist + (0.38 * size, 1.5 * size), wrist + (-0.38 * size, 1.5 * size)])
+    cv2.fillConvexPoly(image, np.round(forearm).astype(np.int32), skin, cv2.LINE_AA)
+    palm = np.concatenate([[wrist - across, wrist + across], points[[1, 2, 5, 9, 13, 17]]])
+    cv2.fillConvexPoly(image, cv2.convexHull(np.round(palm).astype(np.int32)), skin, cv2.LINE_AA)
+    for chain in FINGER_CHAINS:
+        for a, b in zip(chain[1:], chain[2:]):
+            width = int(JOINT_WIDTHS[b] * size)
+            cv2.line(image, tuple(np.round(points[a]).astype(int)), tuple(np.round(points[b]).astype(int)), skin, width, cv2.LINE_AA)
+            cv2.circle(image, tuple(np.round(points[b]).astype(int)), width // 2, skin, -1, cv2.LINE_AA)
+
+def synthetic_hand_video(path, frames=300, fps=30, width=960, height=540, seed=0):
+    # One hand sweeping the frame, a second joining partway, then the first leaving and coming back
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for index in range(frames):
+        t = index / fps
+        image = np.full((height, width, 3), (55, 62, 70), dtype=np.uint8)
+        image = cv2.add(image, rng.integers(0, 8, image.shape, dtype=np.uint8))
+        if not 0.8 * frames <= index < 0.9 * frames:
+            draw_hand(image, np.array([width * (0.55 + 0.2 * math.sin(t)), height * (0.8 + 0.05 * math.cos(2 * t))]), 90)
+        if 0.25 * frames <= index < 0.65 * frames:
+            draw_hand(image, np.array([width * (0.25 + 0.05 * math.sin(1.5 * t)), height * 0.85]), 80, mirror=True)
+        writer.write(cv2.GaussianBlur(image, (3, 3), 0))
+    writer.release()
+
+def bench_roi(args):
+    if args.video:
+        return roi_checks(args, args.video)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "hands.avi")
+        synthetic_hand_video(path)
+        return roi_checks(args, path)
+
+def roi_checks(args, path):
+    cap = cv2.VideoCapture(path)
+    full = make_hands()
+    tracker = AdaptiveHandTracker(make_hands(), target_fps=args.target_fps,
+                                  crop_factory=lambda count: make_hands(max_num_hands=count))
+    # Built off the frame thread in the app; here they're waited for so their loading isn't counted
+    for task in tracker.crop_graphs.values():
+        task.result()
+    full_cpu = roi_cpu = 0.0
+    errors = []
+    frames = missed = hands_seen = 0
+    while True:
+        success, image = cap.read()
+        if not success:
+            break
+        rgb = preprocess(image)
+        h, w = rgb.shape[:2]
+
+        start = time.process_time()
+        reference = DetectedHands.from_results(full.process(rgb))
+        full_cpu += time.process_time() - start
+        start = time.process_time()
+        adaptive = tracker.process(rgb)
+        roi_cpu += time.process_time() - start
+
+        hands_seen += len(reference)
+        missed += max(0, len(reference) - len(adaptive))
+        if len(reference) and len(adaptive):
+            # Paired by position, not handedness label, which the two graphs can call differently for the same hand
+            diff = (reference.landmarks[:, None, :, :2] - adaptive.landmarks[None, :, :, :2]) * (w, h)
+            distances = np.sqrt((diff * diff).sum(axis=3)).mean(axis=2)
+            for _ in range(min(distances.shape)):
+                row, col = np.unravel_index(distances.argmin(), distances.shape)
+                errors.append(distances[row, col])
+                distances[row, :] = distances[:, col] = np.inf
+        frames += 1
+    cap.release()
+
+    if not frames:
+        print("No frames read")
+        return False
+    print(f"Frames: {frames}")
+    print(f"Full-frame CPU: {full_cpu / frames * 1000:6.2f} ms/frame")
+    print(f"Adaptive CPU:   {roi_cpu / frames * 1000:6.2f} ms/frame "
+          f"({(1 - roi_cpu / full_cpu) * 100 if full_cpu else 0:.0f}% saved, "
+          f"full-frame pass every {tracker.full_frame_interval} frames at the end)")
+    print(f"Hands missed by adaptive mode: {missed} of {hands_seen} found on full frames")
+    passed = True
+    if roi_cpu >= full_cpu:
+        print("FAIL: adaptive inference costs no less CPU than full frames")
+        passed = False
+    if errors:
+        error = np.mean(errors)
+        print(f"Landmark error vs full frame: mean {error:.2f} px, p95 {np.percentile(errors, 95):.2f} px")
+        if error > args.max_error:
+            print(f"FAIL: mean landmark error is over {args.max_error:g} px")
+            passed = False
+    return passed
+
+def voice_load(stop, duty, burst=0.02):
+    # Pure-Python bursts holding the GIL, like the recognizer thread chewing through audio
+    while not stop.is_set():
+        deadline = time.perf_counter() + burst
+        total = 0
+        while time.perf_counter() < deadline:
+            total += sum(i * i for i in range(200))
+        time.sleep(burst * (1 - duty) / duty)
+
+def bench_inference_process(args):
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        success, image = cap.read()
+        if not success:
+            break
+        frames.append(preprocess(image))
+    cap.release()
+    if not frames:
+        print("No frames read")
+        return False
+
+    p99 = {}
+    for mode in ("in-process", "worker process"):
+        for threads in (0, args.voice_threads):
+            if mode == "in-process":
+                hands = make_hands()
+                infer = lambda rgb: DetectedHands.from_results(hands.process(rgb))
+            else:
+                hands = ProcessHandTracker()
+                hands.process(frames[0])
+                if not hands.wait_ready():
+                    print("Hand inference worker did not start")
+                    return False
+                infer = hands.process
+            stop = threading.Event()
+            load = [threading.Thread(target=voice_load, args=(stop, args.duty), daemon=True) for _ in range(threads)]
+            for thread in load:
+                thread.start()
+            times = []
+            detected = 0
+            next_frame = time.perf_counter()
+            for rgb in frames:
+                start = time.perf_counter()
+                detected += len(infer(rgb))
+                times.append(time.perf_counter() - start)
+                next_frame += 1 / args.fps
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
+            stop.set()
+            for thread in load:
+                thread.join()
+            hands.close()
+            times = np.array(times) * 1000
+            p99[mode, threads] = np.percentile(times, 99)
+            print(f"{mode:>14}, {threads} voice threads: p50 {np.percentile(times, 50):6.2f} ms, "
+                  f"p99 {p99[mode, threads]:6.2f} ms, max {times.max():6.2f} ms, "
+                  f"std {times.std():5.2f} ms, hands {detected}")
+    # The worker exists to keep the voice threads from stretching inference
+    if p99["worker process", args.voice_threads] >= p99["in-process", args.voice_threads]:
+        print("FAIL: the worker process has no lower p99 frame time under voice load than in-process inference")
+        return False
+    return True
+
+def legacy_compose(image, layer, window_width=960, window_height=540):
+    # Preprocessing and compositing as the original start() loop did it
+    camera_img = cv2.flip(image, 1)
+    camera_img = cv2.convertScaleAbs(camera_img, alpha=1.3, beta=30)
+    rgb = cv2.cvtColor(camera_img, cv2.COLOR_BGR2RGB)
+    img = np.zeros((window_height, window_width, 3), dtype=np.uint8)
+    np.copyto(img, layer)
+    camera_img = cv2.resize(camera_img, (int(window_height * camera_img.shape[1] / camera_img.shape[0]), window_height))
+    combined_img = np.zeros((window_height, window_width + camera_img.shape[1], 3), dtype=np.uint8)
+    combined_img[:, :camera_img.shape[1]] = camera_img
+    combined_img[:, camera_img.shape[1]:] = img
+    return rgb, combined_img
+
+def preallocated_compose(image, layer, pool, compositor):
+    buffers = pool.acquire()
+    cv2.flip(image, 1, dst=buffers.flipped)
+    bgr = cv2.LUT(buffers.flipped, pool.lut, dst=buffers.bgr)
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=buffers.rgb)
+    combined_img, camera_pane, img = compositor.panes(bgr.shape)
+    np.copyto(img, layer)
+    cv2.resize(bgr, (camera_pane.shape[1], camera_pane.shape[0]), dst=camera_pane)
+    pool.release(buffers)
+    return rgb, combined_img
+
+def measure_frames(compose, frames):
+    tracemalloc.start()
+    transient = []
+    for image in frames:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        compose(image)
+        transient.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    # Timing without tracemalloc's bookkeeping
+    start = time.perf_counter()
+    for image in frames:
+        compose(image)
+    return (time.perf_counter() - start) / len(frames) * 1000, np.mean(transient) / 1024
+
+def bench_preprocessing(args):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8) for _ in range(args.frames)]
+    layer = np.zeros((540, 960, 3), dtype=np.uint8)
+    VirtualKeyboard(None, None, None, 960, 540, recording_backend()).render_keyboard(layer)
+
+    pool = FrameBufferPool()
+    pool.set_shape(frames[0].shape)
+    compositor = FrameCompositor(960, 540)
+    legacy_ms, legacy_kib = measure_frames(lambda image: legacy_compose(image, layer), frames)
+    prealloc_ms, prealloc_kib = measure_frames(lambda image: preallocated_compose(image, layer, pool, compositor), frames)
+
+    reference = cv2.convertScaleAbs(frames[0], alpha=1.3, beta=30)
+    differing = np.count_nonzero(cv2.LUT(frames[0], pool.lut) != reference)
+    print(f"Legacy loop:   {legacy_ms:6.2f} ms/frame, {legacy_kib:9.1f} KiB allocated per frame")
+    print(f"Preallocated:  {prealloc_ms:6.2f} ms/frame, {prealloc_kib:9.1f} KiB allocated per frame "
+          f"({pool.allocated} buffer set(s) in total)")
+    print(f"LUT vs convertScaleAbs: {differing} differing values out of {reference.size}")
+    if differing:
+        print("FAIL: the LUT must reproduce convertScaleAbs exactly")
+        return False
+    return prealloc_kib < legacy_kib
+
+def load_wav(path):
+    with wave.open(path, 'rb') as f:
+        return sr.AudioData(f.readframes(f.getnframes()), f.getframerate(), f.getsampwidth())
+
+def write_wav(path, samples, sample_rate):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.clip(samples, -32768, 32767).astype(np.int16).tobytes())
+
+VOICE_FIXTURES = ["increase volume", "mute", "take a screenshot", "scroll down", "close recent", "open notepad",
+                  "double click", "help"]
+
+def speak_fixtures(directory, commands):
+    # Spoken by the system text-to-speech voice: SAPI on Windows, eSpeak elsewhere
+    try:
+        engine = tts.init()
+    except Exception as e:
+        print(f"Cannot synthesize voice fixtures: {e}")
+        return []
+    paths = [os.path.join(directory, command.replace(" ", "_") + ".wav") for command in commands]
+    for command, path in zip(commands, paths):
+        engine.save_to_file(command, path)
+    engine.runAndWait()
+    return [path for path in paths if os.path.exists(path)]
+
+def speech_end(audio, frame_seconds=0.02, threshold_ratio=0.1):
+    # Last 20 ms frame whose RMS is within 10% of the loudest one
+    samples = np.frombuffer(audio.get_raw_data(convert_width=2), dtype=np.int16).astype(np.float64)
+    frame_len = max(1, int(audio.sample_rate * frame_seconds))
+    frames = samples[:len(samples) // frame_len * frame_len].reshape(-1, frame_len)
+    rms = np.sqrt((frames * frames).mean(axis=1))
+    voiced = np.nonzero(rms >= rms.max() * threshold_ratio)[0]
+    return (voiced[-1] + 1) * frame_seconds if len(voiced) else len(samples) / audio.sample_rate
+
+def time_to_queue(handler, audio, chunk_samples=1024, tail=2.0):
+    # Seconds from the start of the clip until the command is queued, on a clock that advances with
+    # the audio as it would arrive from the microphone plus the recognizer's own processing time
+    backend = handler.backend
+    handler.last_queued = handler.last_command = None
+    if not backend.streaming:
+        # Endpointed by Recognizer.listen on the clip and some trailing silence, as listen_in_background is
+        pcm = audio.get_raw_data(convert_width=2) + bytes(2 * int(tail * audio.sample_rate))
+        source = buffer_source(pcm, audio.sample_rate, chunk_samples)
+        try:
+            phrase = handler.recognizer.listen(source, timeout=1, phrase_time_limit=5)
+        except sr.WaitTimeoutError:
+            return None
+        clock = source.position / (2 * audio.sample_rate)
+        start = time.perf_counter()
+        try:
+            handler.handle_transcript(backend.recognize(handler.recognizer, phrase))
+        except (sr.UnknownValueError, sr.RequestError) as e:
+            print(f"Recognition failed: {e!r}")
+            return None
+        return clock + time.perf_counter() - start if handler.last_command else None
+
+    pcm = audio.get_raw_data(convert_rate=backend.sample_rate, convert_width=2)
+    stream = backend.new_stream()
+    handler.stream_fired = False
+    chunk_bytes = chunk_samples * 2
+    clock = 0.0
+    for offset in range(0, len(pcm), chunk_bytes):
+        clock = max(clock, (offset + chunk_bytes) / (backend.sample_rate * 2))
+        start = time.perf_counter()
+        handler.feed_stream(stream, pcm[offset:offset + chunk_bytes])
+        clock += time.perf_counter() - start
+        if handler.last_command:
+            return clock
+    start = time.perf_counter()
+    final = backend.finish(stream)
+    if final and not handler.stream_fired:
+        handler.handle_transcript(final)
+    return clock + time.perf_counter() - start if handler.last_command else None
+
+def bench_voice(args):
+    with tempfile.TemporaryDirectory() as directory:
+        if args.fixtures:
+            fixtures = sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+        else:
+            fixtures = speak_fixtures(directory, VOICE_FIXTURES)
+        if not fixtures:
+            print(f"No .wav fixtures in {args.fixtures}" if args.fixtures else "No voice fixtures synthesized")
+            return False
+        return all([voice_backend_checks(args, backend_name, fixtures) for backend_name in args.backends])
+
+def voice_backend_checks(args, backend_name, fixtures):
+    recorder = EventRecorder()
+    handler = VoiceCommandHandler(RecordingSystemController(recorder), RecordingInputBackend(recorder))
+    handler.backend = make_speech_backend(backend_name, handler.vocabulary(), args.vosk_model)
+    latencies = []
+    correct = 0
+    for path in fixtures:
+        expected = handler.match_command(os.path.splitext(os.path.basename(path))[0].replace("_", " "))
+        audio = load_wav(path)
+        queued_at = time_to_queue(handler, audio)
+        if queued_at is None:
+            print(f"{backend_name:>7} {os.path.basename(path)}: nothing queued")
+            continue
+        latency = (queued_at - speech_end(audio)) * 1000
+        latencies.append(latency)
+        correct += handler.last_command == expected
+        print(f"{backend_name:>7} {os.path.basename(path)}: {handler.last_command!r} "
+              f"{latency:+7.0f} ms after end of speech")
+    if not latencies:
+        print(f"FAIL: {backend_name} queued no commands")
+        return False
+    p95 = np.percentile(latencies, 95)
+    print(f"{backend_name:>7}: {correct}/{len(fixtures)} correct, end-of-speech to queued "
+          f"mean {np.mean(latencies):.0f} ms, p95 {p95:.0f} ms")
+    passed = True
+    if correct < args.min_accuracy * len(fixtures):
+        print(f"FAIL: {backend_name} got fewer than {args.min_accuracy:.0%} of the commands right")
+        passed = False
+    if p95 > args.max_latency:
+        print(f"FAIL: {backend_name} p95 latency is over {args.max_latency:g} ms")
+        passed = False
+    return passed
+
+MATCHER_CASES = [
+    ("close recent", ("close recent", "")),
+    ("close the window", ("close", "")),
+    ("open task manager", ("open", "task manager")),
+    ("please open whatsapp", ("open", "whatsapp")),
+    ("task manager", ("task manager", "")),
+    ("increase the volume", None),
+    ("increase volume a bit", ("increase volume", "")),
+    ("increase valume", ("increase volume", "")),
+    ("scrol down", ("scroll down", "")),
+    ("take a screenshot", ("screenshot", "")),
+    ("take screenshots", ("screenshot", "")),
+    ("screenshots", ("screenshot", "")),
+    ("save screenshots", ("save screenshots", "")),
+    ("save screenshot", ("save screenshots", "")),
+    ("close recently opened", ("close recent", "")),
+    ("scrolling up", ("scroll up", "")),
+    ("Open Notepad.", ("open", "notepad")),
+    ("open teams", ("open", "teams")),
+    ("double click here", ("double click", "")),
+    ("mute", ("mute", "")),
+    ("dragon", None),
+    ("helpful", None),
+    ("what time is it", None),
+]
+
+# Whether a partial transcript may fire before the recognizer finalizes it
+COMPLETE_CASES = [
+    ("close", False),
+    ("close recent", True),
+    ("screenshot", True),
+    ("save screenshot", True),
+    ("take a screenshot", True),
+    ("open notepad", False),
+    ("mute", True),
+]
+
+def buffer_source(pcm, sample_rate, chunk=1024):
+    # Recognizer.listen only accepts AudioSource subclasses, so the class is built once speech_recognition is loaded
+    class BufferSource(sr.AudioSource):
+        # In-memory stand-in for the microphone, so Recognizer.listen runs on a prepared stream
+        def __init__(self):
+            self.SAMPLE_RATE = sample_rate
+            self.SAMPLE_WIDTH = 2
+            self.CHUNK = chunk
+            self.pcm = pcm
+            self.position = 0
+            self.stream = self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            pass
+
+        def read(self, size):
+            data = self.pcm[self.position:self.position + size * 2]
+            self.position += len(data)
+            return data
+
+    return BufferSource()
+
+def noisy_stream(audio, sample_rate, noise, bursts, rng, lead=2.0, tail=4.0):
+    # Lead-in, the command, then a tail; background noise throughout and short loud bursts spread evenly
+    # through the padding, far enough apart that each is a separate non-speech event
+    clip = np.frombuffer(audio.get_raw_data(convert_rate=sample_rate, convert_width=2), dtype=np.int16)
+    lead_samples = int(lead * sample_rate)
+    samples = np.concatenate([np.zeros(lead_samples), clip, np.zeros(int(tail * sample_rate))])
+    samples += rng.normal(0, noise, len(samples)) if noise else 0
+    burst = int(0.06 * sample_rate)
+    padding = [(0, lead_samples - burst), (lead_samples + len(clip), len(samples) - burst)]
+    for side, (low, high) in enumerate(padding):
+        count = len(range(side, bursts, 2))
+        for index in range(count):
+            start = low + (index + 1) * (high - low) // (count + 1)
+            samples[start:start + burst] += rng.normal(0, 6000, burst)
+    pcm = np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+    return pcm, lead + speech_end(audio)
+
+def listener_endpoints(pcm, sample_rate):
+    # listen_in_background's settings; each returned phrase is one recognizer call
+    recognizer = sr.Recognizer()
+    recognizer.energy_threshold = 300
+    recognizer.dynamic_energy_threshold = True
+    source = buffer_source(pcm, sample_rate)
+    ends = []
+    while source.position < len(pcm):
+        try:
+            audio = recognizer.listen(source, timeout=1, phrase_time_limit=5)
+        except sr.WaitTimeoutError:
+            continue
+        # A phrase cut off by the end of the buffer is an artifact; a microphone never runs dry
+        if audio.frame_data and source.position < len(pcm):
+            ends.append(source.position / (2 * sample_rate))
+    return ends
+
+def vad_endpoints(pcm, sample_rate, chunk=1024):
+    vad = VoiceActivityDetector(sample_rate)
+    ends = []
+    for offset in range(0, len(pcm), chunk * 2):
+        for kind, _ in vad.feed(pcm[offset:offset + chunk * 2]):
+            if kind == "end":
+                ends.append(min(offset + chunk * 2, len(pcm)) / (2 * sample_rate))
+    return ends, vad.dropped
+
+def synthetic_speech(duration, sample_rate, rng, level=4000):
+    # Voiced harmonics on a drifting pitch, gated into syllables about four times a second
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = rng.uniform(110, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 8))
+    envelope = 0.3 + 0.7 * np.abs(np.sin(np.pi * 4 * t))
+    return voice / np.sqrt((voice * voice).mean()) * envelope * level
+
+def synthesize_vad_fixtures(directory, sample_rate, rng):
+    clips = {f"speech_{duration:g}s": synthetic_speech(duration, sample_rate, rng) for duration in (0.5, 1.0, 1.8)}
+    clips["noise_steady"] = rng.normal(0, 1500, 4 * sample_rate)
+    clicks = rng.normal(0, 30, 4 * sample_rate)
+    for start in np.arange(0.5, 3.6, 0.6) * sample_rate:
+        start = int(start)
+        clicks[start:start + int(0.06 * sample_rate)] += rng.normal(0, 8000, int(0.06 * sample_rate))
+    clips["noise_clicks"] = clicks
+    clips["silence"] = np.zeros(3 * sample_rate)
+    paths = []
+    for name, samples in clips.items():
+        paths.append(os.path.join(directory, name + ".wav"))
+        write_wav(paths[-1], samples, sample_rate)
+    return paths
+
+def is_speech_fixture(path):
+    return not os.path.basename(path).startswith(("noise", "silence"))
+
+def bench_vad(args):
+    sample_rate = 16000
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.fixtures:
+            fixtures = sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+        else:
+            fixtures = synthesize_vad_fixtures(directory, sample_rate, rng)
+        if not any(map(is_speech_fixture, fixtures)):
+            print(f"No speech .wav fixtures in {args.fixtures}")
+            return False
+        return vad_checks(args, fixtures, sample_rate, rng)
+
+def vad_checks(args, fixtures, sample_rate, rng):
+    results = {"energy threshold": ([], 0), "vad": ([], 0)}
+    dropped = 0
+    passed = True
+    for path in fixtures:
+        name = os.path.basename(path)
+        if not is_speech_fixture(path):
+            # Played as they are: the recognizer must never be called
+            pcm = load_wav(path).get_raw_data(convert_rate=sample_rate, convert_width=2)
+            vad_ends, vad_dropped = vad_endpoints(pcm, sample_rate)
+            dropped += vad_dropped
+            # Their calls still count towards the totals: skipping them is most of what the VAD saves
+            calls = {"energy threshold": len(listener_endpoints(pcm, sample_rate)), "vad": len(vad_ends)}
+            for label, count in calls.items():
+                latencies, total = results[label]
+                results[label] = (latencies, total + count)
+            print(f"{name}: energy threshold {calls['energy threshold']} calls, vad {calls['vad']} calls")
+            if vad_ends:
+                print(f"FAIL: VAD sent {name} to the recognizer")
+                passed = False
+            continue
+        pcm, spoken_until = noisy_stream(load_wav(path), sample_rate, args.noise, args.bursts, rng)
+        vad_ends, vad_dropped = vad_endpoints(pcm, sample_rate)
+        dropped += vad_dropped
+        line = []
+        for label, ends in (("energy threshold", listener_endpoints(pcm, sample_rate)), ("vad", vad_ends)):
+            latencies, calls = results[label]
+            after = [end - spoken_until for end in ends if end >= spoken_until]
+            if after:
+                latencies.append(after[0])
+            results[label] = (latencies, calls + len(ends))
+            line.append(f"{label} {after[0] * 1000 if after else float('nan'):6.0f} ms / {len(ends)} calls")
+        print(f"{name}: " + ", ".join(line))
+        # One command, one recognizer call, endpointed within the bound; the bursts around it are dropped
+        if len(vad_ends) != 1 or vad_ends[0] < spoken_until or vad_ends[0] - spoken_until > args.max_endpoint:
+            print(f"FAIL: VAD made {len(vad_ends)} recognizer calls for {name} or endpointed it "
+                  f"more than {args.max_endpoint * 1000:.0f} ms after speech ended")
+            passed = False
+
+    commands = sum(map(is_speech_fixture, fixtures))
+    for label, (latencies, calls) in results.items():
+        summary = (f"endpoint p50 {np.percentile(latencies, 50) * 1000:.0f} ms, "
+                   f"max {max(latencies) * 1000:.0f} ms after end of speech" if latencies else "never endpointed")
+        print(f"{label:>16}: {summary}, {calls} recognizer calls for {commands} commands")
+    print(f"VAD dropped {dropped} short bursts before recognition; "
+          f"{results['energy threshold'][1] - results['vad'][1]} recognizer calls avoided")
+    return passed
+
+def legacy_match(commands, text):
+    # The original first-substring-wins scan with "open" special-cased ahead of it
+    if "open" in text:
+        return "open"
+    for command in commands:
+        if command in text:
+            return command
+    return None
+
+def bench_matcher(args):
+    recorder = EventRecorder()
+    handler = VoiceCommandHandler(RecordingSystemController(recorder), RecordingInputBackend(recorder))
+    matcher = handler.matcher
+    failures = 0
+    for text, expected in MATCHER_CASES:
+        got = matcher.match(text)
+        if got != expected:
+            failures += 1
+            print(f"MISMATCH {text!r}: expected {expected}, got {got}")
+    for text, expected in COMPLETE_CASES:
+        if matcher.is_complete(text) != expected:
+            failures += 1
+            print(f"MISMATCH is_complete({text!r}): expected {expected}")
+    print(f"Correctness: {len(MATCHER_CASES) + len(COMPLETE_CASES) - failures}/"
+          f"{len(MATCHER_CASES) + len(COMPLETE_CASES)} checks")
+
+    rng = random.Random(0)
+    words = [f"word{i}" for i in range(200)]
+    transcripts = [text for text, _ in MATCHER_CASES]
+    costs = []
+    for size in args.sizes:
+        commands = list(handler.commands)
+        while len(commands) < size:
+            commands.append(" ".join(rng.sample(words, rng.randint(1, 3))))
+        start = time.perf_counter()
+        compiled = CommandMatcher(commands, handler.argument_commands)
+        build = (time.perf_counter() - start) * 1000
+        legacy = time_per_call(lambda text: legacy_match(commands, text), transcripts, args.repeat)
+        costs.append(time_per_call(compiled.match, transcripts, args.repeat))
+        print(f"{size:5d} commands: substring scan {legacy:8.2f} us/utterance, token trie {costs[-1]:6.2f} us/utterance, "
+              f"built in {build:.1f} ms")
+    # The trie walks the transcript, so a table many times larger must not make matching much slower
+    if costs[-1] > args.max_growth * costs[0]:
+        print(f"FAIL: matching cost grew {costs[-1] / costs[0]:.1f}x from {args.sizes[0]} to {args.sizes[-1]} commands")
+        return False
+    return failures == 0
+
+class SlowSystemController(RecordingSystemController):
+    def __init__(self, recorder, delay):
+        super().__init__(recorder)
+        self.delay = delay
+
+    def open_app(self, app_name):
+        time.sleep(self.delay)
+        super().open_app(app_name)
+
+    def take_screenshot(self):
+        time.sleep(self.delay)
+        super().take_screenshot()
+
+def bench_commands(args):
+    script = {10: "open notepad", 20: "drag", 22: "screenshot", 30: "drop", 40: "increase volume"}
+    runs = {}
+    for synchronous in (True, False):
+        recorder = EventRecorder()
+        handler = VoiceCommandHandler(SlowSystemController(recorder, args.delay), RecordingInputBackend(recorder),
+                                      executor=CommandExecutor(synchronous=synchronous))
+        stalls = []
+        for index in range(args.frames):
+            if index in script:
+                handler.handle_transcript(script[index])
+            start = time.perf_counter()
+            handler.process_commands()
+            stalls.append(time.perf_counter() - start)
+            time.sleep(1 / args.fps)
+        handler.executor.close()
+        time.sleep(args.delay * 2)
+        order = [event["action"] for event in recorder.events]
+        stalls = np.array(stalls) * 1000
+        runs[synchronous] = (stalls.max(), order)
+        print(f"{'inline' if synchronous else 'executor':>8}: worst frame stall {stalls.max():7.1f} ms, "
+              f"p99 {np.percentile(stalls, 99):6.2f} ms | events {order}")
+    stall, order = runs[False]
+    passed = True
+    if stall > args.max_stall:
+        print(f"FAIL: the executor stalled a frame for more than {args.max_stall:g} ms")
+        passed = False
+    if sorted(order) != sorted(runs[True][1]):
+        print("FAIL: the executor must run every command the inline loop ran")
+        passed = False
+    elif order.index("mouse_down") > order.index("mouse_up"):
+        print("FAIL: drag and drop share a lane and must stay in order")
+        passed = False
+    return passed
+
+class StubProcess:
+    pid = 0
+
+def fake_app_tree(root, packages):
+    # A WindowsApps-style directory of versioned packages plus a couple of plain installs
+    apps = os.path.join(root, "WindowsApps")
+    for index in range(packages):
+        os.makedirs(os.path.join(apps, f"Vendor{index}.Package{index}_1.{index}.0_x64"))
+    for name, exe in (("5319275A.WhatsAppDesktop_2.2401.0_x64", "WhatsApp.exe"),
+                      ("5319275A.WhatsAppDesktop_2.2405.0_x64", "WhatsApp.exe"),
+                      ("Microsoft.Windows.Photos_2024.1.0_x64", "Microsoft.Photos.exe")):
+        os.makedirs(os.path.join(apps, name))
+        open(os.path.join(apps, name, exe), 'w').close()
+    tools = os.path.join(root, "Tools", "Editors")
+    os.makedirs(tools)
+    for exe in ("notepadplusplus.exe", "sublime_text.exe", "vlc.exe"):
+        open(os.path.join(tools, exe), 'w').close()
+    return {
+        "whatsapp": (os.path.join(apps, "5319275A.WhatsAppDesktop_2*", "WhatsApp.exe"), "WhatsApp.exe"),
+        "photos": (os.path.join(apps, "Microsoft.Windows.Photos_*", "Microsoft.Photos.exe"), "Microsoft.Photos.exe"),
+        "notepad": ("/usr/bin/notepad", "notepad.exe"),
+    }, [os.path.join(root, "Tools")]
+
+def legacy_resolve(mappings, app_name):
+    # What open_app did on every call: glob wildcard entries afresh
+    path, exe_name = mappings[app_name]
+    if '*' in path:
+        possible_files = glob.glob(path)
+        return (possible_files[0], exe_name) if possible_files else None
+    return path, exe_name
+
+def bench_apps(args):
+    launched = []
+    launcher = lambda command: launched.append(command) or StubProcess()
+    with tempfile.TemporaryDirectory() as root:
+        mappings, roots = fake_app_tree(root, args.packages)
+        cache_path = os.path.join(root, "index.json")
+        make_index = lambda: AppIndex(mappings, cache_path=cache_path, roots=roots, launcher=launcher)
+
+        start = time.perf_counter()
+        index = make_index()
+        index.build()
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        make_index().build()
+        warm = time.perf_counter() - start
+        os.makedirs(os.path.join(root, "WindowsApps", "Vendor.New_1.0.0_x64"))
+        start = time.perf_counter()
+        make_index().build()
+        invalidated = time.perf_counter() - start
+        print(f"{args.packages} packages: cold build {cold * 1000:.1f} ms, cached {warm * 1000:.1f} ms, "
+              f"after an install {invalidated * 1000:.1f} ms")
+        # An install below a root only changes its own subfolder's mtime
+        open(os.path.join(roots[0], "Editors", "gimp.exe"), 'w').close()
+        index = make_index()
+        index.build()
+        if not index.lookup("gimp"):
+            print("An app added to a subfolder of a root must invalidate the cache")
+            return False
+
+        names = list(mappings)
+        legacy = time_per_call(lambda name: legacy_resolve(mappings, name), names, args.repeat)
+        indexed = time_per_call(index.lookup, names, args.repeat)
+        print(f"Lookup per spoken name: per-call glob {legacy:8.1f} us, index {indexed:6.2f} us")
+
+        passed = indexed < legacy
+        expected = {"whatsapp": "WhatsApp.exe", "whats app": "WhatsApp.exe", "photo": "Microsoft.Photos.exe",
+                    "vlc": "vlc.exe", "sublime text": "sublime_text.exe", "notepad": "notepad.exe",
+                    "unknown thing": "unknown thing.exe"}
+        for spoken, exe_name in expected.items():
+            launched.clear()
+            result = index.launch(spoken)
+            print(f"  {spoken!r:16} -> {launched[0] if launched else None} ({result[0] if result else None})")
+            if not result or result[0] != exe_name:
+                print(f"FAIL: {spoken!r} should launch {exe_name}")
+                passed = False
+        # Versioned package directories resolve to the newest install
+        if "2.2405.0" not in index.lookup("whatsapp")[0]:
+            print("FAIL: whatsapp must resolve to the newest package version")
+            passed = False
+        return passed
+
+class FakeLevelDevice:
+    # Stands in for DDC/CI brightness or the audio endpoint: slow reads and writes
+    def __init__(self, level=50, read_delay=0.3, write_delay=0.1):
+        self.level = level
+        self.read_delay = read_delay
+        self.write_delay = write_delay
+        self.reads = self.writes = 0
+        self.failures = 0
+
+    def read(self):
+        time.sleep(self.read_delay)
+        if self.failures:
+            # A monitor or audio endpoint that isn't ready yet
+            self.failures -= 1
+            raise OSError("device not ready")
+        self.reads += 1
+        return self.level
+
+    def write(self, level):
+        time.sleep(self.write_delay)
+        self.writes += 1
+        self.level = level
+
+def bench_levels(args):
+    steps = [10 if index % 3 else -10 for index in range(args.changes)]
+    expected = 50
+    for step in steps:
+        expected = max(0, min(100, expected + step))
+
+    device = FakeLevelDevice(read_delay=args.read_delay, write_delay=args.write_delay)
+    blocked = []
+    for step in steps:
+        # The original read-modify-write on the calling thread
+        start = time.perf_counter()
+        device.write(max(0, min(100, device.read() + step)))
+        blocked.append(time.perf_counter() - start)
+        time.sleep(args.spacing)
+    print(f"synchronous: worst call {max(blocked) * 1000:6.1f} ms, {device.reads} reads, "
+          f"{device.writes} writes, final {device.level}")
+
+    device = FakeLevelDevice(read_delay=args.read_delay, write_delay=args.write_delay)
+    controller = CachedLevelController(device, "Fake", min_interval=args.min_interval)
+    blocked = []
+    for step in steps:
+        start = time.perf_counter()
+        controller.adjust(step)
+        blocked.append(time.perf_counter() - start)
+        time.sleep(args.spacing)
+    start = time.perf_counter()
+    controller.close(timeout=5)
+    settle = time.perf_counter() - start
+    print(f"write-behind: worst call {max(blocked) * 1000:6.3f} ms, {device.reads} reads, "
+          f"{device.writes} writes, final {device.level} (expected {expected}), settled {settle * 1000:.0f} ms after the last change")
+    if device.level != expected or max(blocked) * 1000 > args.max_block:
+        print(f"FAIL: write-behind must land on {expected} without blocking a caller for more than {args.max_block:g} ms")
+        return False
+
+    # A change made while the first read is failing lands on the retry, not on the next resync
+    device = FakeLevelDevice(read_delay=0, write_delay=0)
+    device.failures = 2
+    controller = CachedLevelController(device, "Fake", retry_interval=0.05)
+    start = time.perf_counter()
+    controller.adjust(10)
+    while not device.writes and time.perf_counter() - start < 2:
+        time.sleep(0.01)
+    controller.close()
+    print(f"first read failing twice: change applied after {(time.perf_counter() - start) * 1000:.0f} ms, final {device.level}")
+    if device.level != 60:
+        print("A change queued before the first successful read must be applied once a read succeeds")
+        return False
+
+    # A device that never answers (no audio endpoint off Windows) is given up on instead of polled forever
+    device = FakeLevelDevice(read_delay=0, write_delay=0)
+    device.failures = 100
+    controller = CachedLevelController(device, "Fake", retry_interval=0.01, max_failures=3)
+    controller.adjust(10)
+    start = time.perf_counter()
+    while controller.thread is not None and time.perf_counter() - start < 2:
+        time.sleep(0.01)
+    attempts = 100 - device.failures
+    controller.close()
+    print(f"device never answering: gave up after {attempts} reads")
+    if attempts != 3:
+        print("The level controller must stop after max_failures failed reads")
+        return False
+    return True
+
+def synthetic_screen(width, height, seed=0):
+    # Flat windows with sparse detail compress like a desktop rather than like camera noise
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 235, dtype=np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, width - 200), rng.integers(0, height - 100)
+        image[y:y + rng.integers(20, 400), x:x + rng.integers(50, 800)] = rng.integers(0, 256, 3)
+    image[rng.random((height, width)) < 0.02] = 0
+    return image
+
+def bench_screenshots(args):
+    width, height = args.size
+    screen = synthetic_screen(width, height)
+    grab = lambda: screen.copy()
+    with tempfile.TemporaryDirectory() as directory:
+        blocked = []
+        start = time.perf_counter()
+        for index in range(args.captures):
+            call = time.perf_counter()
+            # The original grab-and-save on the calling thread, at PIL's default PNG level
+            cv2.imwrite(os.path.join(directory, f"inline_{index}.png"), grab(), [cv2.IMWRITE_PNG_COMPRESSION, 6])
+            blocked.append(time.perf_counter() - call)
+        rate = args.captures / (time.perf_counter() - start)
+        inline = np.mean(blocked)
+        print(f"{'inline png':>14}: caller blocked {inline * 1000:7.2f} ms/capture, {rate:6.1f} captures/s")
+        passed = True
+
+        for image_format in args.formats:
+            for workers in args.workers:
+                service = ScreenshotService(directory, image_format, workers=workers, max_pending=args.captures, grab=grab)
+                blocked = []
+                start = time.perf_counter()
+                for _ in range(args.captures):
+                    call = time.perf_counter()
+                    service.take()
+                    blocked.append(time.perf_counter() - call)
+                service.close(timeout=60)
+                rate = service.saved / (time.perf_counter() - start)
+                print(f"{image_format:>5} x{workers} pool: caller blocked {np.mean(blocked) * 1000:7.2f} ms/capture, "
+                      f"{rate:6.1f} captures/s sustained")
+                if service.saved != args.captures or np.mean(blocked) >= inline:
+                    print(f"FAIL: the {image_format} x{workers} pool must save every capture and block less than inline")
+                    passed = False
+
+        service = ScreenshotService(directory, "png", burst=args.burst, grab=grab)
+        for _ in range(args.captures):
+            service.take()
+        start = time.perf_counter()
+        service.save_burst()
+        service.close(timeout=60)
+        print(f"burst of {args.burst}: {service.saved} written {(time.perf_counter() - start) * 1000:.0f} ms after the request, "
+              f"{args.burst * screen.nbytes / 2 ** 20:.0f} MiB held in memory")
+        if service.saved != args.burst:
+            print(f"FAIL: the burst must write its last {args.burst} captures")
+            passed = False
+        return passed
+
+def synthetic_trace(seconds, fps, noise, seed=0):
+    # Screen-space index-tip path of holds, slow precise moves and fast flicks, plus landmark jitter
+    rng = np.random.default_rng(seed)
+    truth = [np.array([960.0, 540.0])]
+    while len(truth) < seconds * fps:
+        hold = int(rng.uniform(0.3, 1.0) * fps)
+        truth.extend([truth[-1]] * hold)
+        duration = rng.choice([rng.uniform(0.8, 1.5), rng.uniform(0.12, 0.25)])
+        target = truth[-1] + rng.uniform(-1, 1, 2) * (60 if duration > 0.5 else 700)
+        target = np.clip(target, 0, (1919, 1079))
+        steps = max(int(duration * fps), 2)
+        tau = np.arange(1, steps + 1) / steps
+        # Minimum-jerk profile, the shape of a natural reaching movement
+        profile = 10 * tau ** 3 - 15 * tau ** 4 + 6 * tau ** 5
+        truth.extend(truth[-1] + profile[:, None] * (target - truth[-1]))
+    truth = np.array(truth[:int(seconds * fps)])
+    return np.arange(len(truth)) / fps, truth + rng.normal(0, noise, truth.shape), truth
+
+def recorded_trace(path, screen=(1920, 1080)):
+    # Right-hand index tip from a .npz or .lmk landmark recording; frames without the hand are skipped
+    if path.endswith('.lmk'):
+        records = LandmarkRecording(path).records
+        timestamps, landmarks, present = records['timestamp'], records['landmarks'], records['labels'] == 2
+    else:
+        data = np.load(path)
+        timestamps, landmarks, present = data['timestamps'], data['landmarks'], data['labels'] == 'Right'
+    frames, slots = np.nonzero(present)
+    _, first = np.unique(frames, return_index=True)
+    frames, slots = frames[first], slots[first]
+    points = landmarks[frames, slots, INDEX_TIP, :2] * screen
+    return timestamps[frames], points, None
+
+def trace_lag(timestamps, output, reference, fps, max_lag=0.4):
+    # Shift (in 1 ms steps) that best aligns the output with the reference
+    best_shift, best_error = 0.0, float('inf')
+    for shift in np.arange(-0.1, max_lag, 0.001):
+        shifted = np.stack([np.interp(timestamps - shift, timestamps, reference[:, axis]) for axis in range(2)], axis=1)
+        valid = slice(int(max_lag * fps) + 1, None)
+        error = ((output[valid] - shifted[valid]) ** 2).sum(axis=1).mean()
+        if error < best_error:
+            best_shift, best_error = shift, error
+    return best_shift * 1000
+
+def trace_jitter(output, reference, fps, still_speed=30):
+    # RMS frame-to-frame wobble of the output while the hand is essentially still
+    kernel = np.ones(5) / 5
+    smooth = np.stack([np.convolve(reference[:, axis], kernel, mode='same') for axis in range(2)], axis=1)
+    speed = np.linalg.norm(np.gradient(smooth, axis=0), axis=1) * fps
+    still = speed[1:-1] < still_speed
+    wobble = np.linalg.norm(np.diff(output, 2, axis=0), axis=1)
+    return float(np.sqrt((wobble[still] ** 2).mean())) if still.any() else float('nan')
+
+def bench_pointer(args):
+    if args.landmarks:
+        timestamps, measured, truth = recorded_trace(args.landmarks)
+        fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+    else:
+        fps = args.fps
+        timestamps, measured, truth = synthetic_trace(args.seconds, fps, args.noise)
+    reference = truth if truth is not None else measured
+    candidates = [
+        ("exponential /10 (mouse, before)", "exponential", {"smoothening": 10}),
+        ("exponential /15 (keyboard, before)", "exponential", {"smoothening": 15}),
+        ("one-euro", "one-euro", {}),
+        ("one-euro + 30 ms lead", "one-euro", {"lead": 0.03}),
+        ("kalman", "kalman", {}),
+        ("kalman + 30 ms lead", "kalman", {"lead": 0.03}),
+    ]
+    print(f"{len(timestamps)} frames at {fps:.0f} fps ({'recorded' if args.landmarks else 'synthetic'} trace)")
+    print(f"{'filter':36} {'lag ms':>7} {'still jitter px':>16} {'error px':>9} {'us/frame':>9}")
+    results = {}
+    for label, name, params in candidates:
+        pointer_filter = make_pointer_filter(name, **params)
+        start = time.perf_counter()
+        output = np.array([pointer_filter(point, now) for point, now in zip(measured, timestamps)])
+        cost = (time.perf_counter() - start) / len(timestamps) * 1e6
+        error = np.sqrt(((output - truth) ** 2).sum(axis=1).mean()) if truth is not None else float('nan')
+        lag, jitter = trace_lag(timestamps, output, reference, fps), trace_jitter(output, reference, fps)
+        results[label] = (lag, jitter, error)
+        print(f"{label:36} {lag:7.1f} {jitter:16.2f} {error:9.1f} {cost:9.1f}")
+    # The default filter must follow the hand more closely than the fixed smoothing it replaced, and stay steady
+    lag, jitter, error = results["one-euro"]
+    before_lag, _, before_error = results["exponential /10 (mouse, before)"]
+    passed = lag < before_lag and not error >= before_error
+    if not passed:
+        print("FAIL: one-euro must have less lag and error than the old exponential smoothing")
+    if jitter > args.max_jitter:
+        print(f"FAIL: one-euro still jitter is over {args.max_jitter:g} px")
+        passed = False
+    return passed
+
+def augmented_poses(count, rng, img_shape=(540, 960)):
+    # Synthetic poses at random roll (up to sideways), tilt, distance and position with landmark noise
+    h, w = img_shape
+    poses = {"open": "open", "left_click": "left", "right_click": "right", "drag": "drag", "scroll": "scroll"}
+    landmarks, labels = [], []
+    for _ in range(count):
+        gesture = GESTURES[rng.integers(len(GESTURES))]
+        hand = synthetic_pose(poses[gesture])
+        # Real pinches leave a gap and real open hands curl a little
+        hand[[8, 12, 16, 20]] += rng.normal(0, 0.012, (4, 3))
+        hand = hand * (w, h, w)
+        hand[:, 2] += rng.normal(0, 3, 21)
+        roll, tilt = rng.uniform(-1.4, 1.4), rng.uniform(-0.6, 0.6)
+        rotation = np.array([[math.cos(roll), -math.sin(roll), 0], [math.sin(roll), math.cos(roll), 0], [0, 0, 1]])
+        rotation = rotation @ np.array([[math.cos(tilt), 0, math.sin(tilt)], [0, 1, 0], [-math.sin(tilt), 0, math.cos(tilt)]])
+        centered = (hand - hand[WRIST]) @ rotation.T * rng.uniform(0.3, 1.6)
+        hand = centered + (rng.uniform(0.3, 0.7) * w, rng.uniform(0.5, 0.8) * h, 0) + rng.normal(0, 2.5, (21, 3))
+        landmarks.append(hand / (w, h, w))
+        labels.append(gesture)
+    return np.array(landmarks), labels
+
+def rule_gesture(mouse, landmarks, img_shape):
+    points, tip_offsets = mouse.get_finger_positions(landmarks, img_shape)
+    left_click, right_click, scrolling, dragging = mouse.detect_gestures(tip_offsets, img_shape)
+    return ("drag" if dragging else "left_click" if left_click else "right_click" if right_click else
+            "scroll" if scrolling else "open")
+
+def bench_gestures(args):
+    rng = np.random.default_rng(0)
+    img_shape = (540, 960, 3)
+    aspect = img_shape[1] / img_shape[0]
+    if args.profile:
+        data = np.load(args.profile)
+        landmarks, labels = data['landmarks'], [str(label) for label in data['labels']]
+        aspect = float(data['aspect'])
+        order = rng.permutation(len(labels))
+        split = len(order) // 2
+        train, test = order[:split], order[split:]
+        train_landmarks, train_labels = landmarks[train], [labels[i] for i in train]
+        test_landmarks, test_labels = landmarks[test], [labels[i] for i in test]
+    else:
+        train_landmarks, train_labels = augmented_poses(args.samples, rng, img_shape[:2])
+        test_landmarks, test_labels = augmented_poses(args.samples, rng, img_shape[:2])
+    classifier = GestureClassifier.fit(train_landmarks, train_labels, aspect)
+    mouse = VirtualMouse(None, None, None, img_shape[1], img_shape[0], recording_backend())
+
+    predicted = classifier.predict(test_landmarks, aspect)
+    rules = [rule_gesture(mouse, hand, img_shape) for hand in test_landmarks]
+    print(f"{len(test_labels)} held-out hands ({'calibration profile' if args.profile else 'synthetic, rotated and scaled'})")
+    print(f"{'gesture':>12} {'rules':>7} {'model':>7}")
+    for gesture in classifier.classes:
+        rows = [i for i, label in enumerate(test_labels) if label == gesture]
+        if rows:
+            print(f"{gesture:>12} {np.mean([rules[i] == gesture for i in rows]):7.1%} "
+                  f"{np.mean([predicted[i] == gesture for i in rows]):7.1%}")
+    rules_accuracy = np.mean([r == l for r, l in zip(rules, test_labels)])
+    model_accuracy = np.mean([p == l for p, l in zip(predicted, test_labels)])
+    print(f"{'overall':>12} {rules_accuracy:7.1%} {model_accuracy:7.1%}")
+
+    # Per frame with two hands: the rules run once per hand, the model once for both
+    frames = [test_landmarks[i:i + 2] for i in range(0, len(test_landmarks) - 1, 2)]
+    legacy = time_per_call(lambda hands: [rule_gesture(mouse, hand, img_shape) for hand in hands], frames, args.repeat)
+    vectorized = time_per_call(lambda hands: classifier.predict(hands, aspect), frames, args.repeat)
+    print(f"Per-frame cost (two hands): rules {legacy:6.1f} us, model {vectorized:6.1f} us")
+    passed = True
+    if model_accuracy < rules_accuracy:
+        print("FAIL: the classifier is less accurate than the rules it replaces")
+        passed = False
+    if vectorized > args.max_cost:
+        print(f"FAIL: classifying a two-hand frame costs more than {args.max_cost:g} us")
+        passed = False
+    return passed
+
+def bench_idle(args):
+    passed = True
+    for path in args.videos:
+        wakes, cpu_per_minute = {}, {}
+        for label, gate in (("full rate", IdleGate(args.idle_after, observe_only=True)),
+                            ("idle gate", IdleGate(args.idle_after, args.idle_fps))):
+            harness = ReplayHarness(path)
+            harness.app.idle_gate = gate
+            cpu = time.process_time()
+            report = harness.run()
+            cpu = time.process_time() - cpu
+            minutes = harness.source.frame_index / harness.source.fps / 60
+            wakes[label] = [t for t, state in gate.transitions if state == "active"]
+            cpu_per_minute[label] = cpu / minutes
+            print(f"{os.path.basename(path)} {label:>9}: {cpu / minutes:6.1f} CPU s per recorded minute, "
+                  f"{report['frames']} frames processed, {gate.skipped_inferences} inferences skipped")
+        # A full-rate wake is the first frame a hand is back after idle_after without one
+        latencies = []
+        for appeared in wakes["full rate"]:
+            later = [t for t in wakes["idle gate"] if t >= appeared]
+            if later:
+                latencies.append(later[0] - appeared)
+        if latencies:
+            print(f"    wake-up latency over {len(latencies)} returns: mean {np.mean(latencies) * 1000:.0f} ms, "
+                  f"max {max(latencies) * 1000:.0f} ms ({len(wakes['full rate']) - len(latencies)} missed)")
+        else:
+            print("    no hand returned after an idle period in this recording")
+        # A returning hand is seen within two idle-rate frames, and idling costs less CPU than running full rate
+        if len(latencies) < len(wakes["full rate"]) or (latencies and max(latencies) > 2 / args.idle_fps):
+            print(f"FAIL: a returning hand was missed or seen more than {2000 / args.idle_fps:.0f} ms late")
+            passed = False
+        if cpu_per_minute["idle gate"] >= cpu_per_minute["full rate"]:
+            print("FAIL: the idle gate saved no CPU")
+            passed = False
+    return passed
+
+def bench_display(args):
+    modes = [("every frame", {}), (f"every {args.every}th", {"every": args.every}),
+             (f"{args.fps:g} fps cap", {"fps": args.fps}), ("headless", {"headless": True})]
+    reports = {}
+    for label, options in modes:
+        harness = ReplayHarness(args.recording)
+        harness.app.configure_display(**options)
+        if harness.app.display:
+            harness.app.setup_window()
+        report = harness.run(pipelined=args.pipelined)
+        if harness.app.display:
+            cv2.destroyAllWindows()
+        reports[label] = report
+        latency = report["latency_ms"]
+        print(f"{label:>14}: {report['fps']:6.1f} dispatch fps, per-frame p50 {latency.get('p50', 0):5.1f} ms, "
+              f"p99 {latency.get('p99', 0):5.1f} ms, {len(report['events'])} input events")
+    # Throttling the preview must not change what is dispatched, only how fast
+    every_frame = reports["every frame"]
+    passed = True
+    for label, report in reports.items():
+        if report["events"] != every_frame["events"]:
+            print(f"FAIL: {label} dispatched different input events than every frame")
+            passed = False
+    if reports["headless"]["fps"] < every_frame["fps"]:
+        print("FAIL: headless dispatches slower than drawing every frame")
+        passed = False
+    return passed
+
+def bench_recording(args):
+    rng = np.random.default_rng(0)
+    hands = DetectedHands(rng.random((2, 21, 3)), ["Left", "Right"], [0.9, 0.95])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.lmk")
+        recorder = LandmarkRecorder(path)
+        costs = []
+        for index in range(args.frames):
+            start = time.perf_counter()
+            recorder.append(index / 30, hands, (540, 960))
+            costs.append(time.perf_counter() - start)
+        recorder.close()
+        costs = np.array(costs) * 1e6
+        recording = LandmarkRecording(path)
+        # Replays of a recording must see exactly the landmarks the live frame had
+        if not np.array_equal(recording.hands(0).landmarks, hands.landmarks):
+            print("Recorded landmarks differ from the live ones")
+            return False
+        per_frame = recording.dtype.itemsize
+        print(f"Append: p50 {np.percentile(costs, 50):.1f} us, p99 {np.percentile(costs, 99):.1f} us, "
+              f"max {costs.max():.0f} us | {per_frame:.0f} bytes/frame, "
+              f"{per_frame * 30 * 3600 / 2 ** 20:.0f} MiB per hour at 30 fps")
+
+        npz_path = os.path.join(directory, "session.npz")
+        records = LandmarkRecording(path).records
+        np.savez(npz_path, timestamps=records['timestamp'], landmarks=records['landmarks'],
+                 labels=np.array(HAND_LABELS)[records['labels']], scores=records['scores'])
+        loads = {}
+        for label, load in (("memory-mapped .lmk", lambda: LandmarkRecording(path).records['landmarks']),
+                            (".npz", lambda: np.load(npz_path)['landmarks'])):
+            tracemalloc.start()
+            start = time.perf_counter()
+            landmarks = load()
+            opened = time.perf_counter() - start
+            # One analysis pass: mean right-index-tip height over the whole session
+            mean_height = float(landmarks[:, 1, INDEX_TIP, 1].mean())
+            scanned = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label:>18}: open {opened * 1000:7.2f} ms, open+scan {scanned * 1000:7.1f} ms, "
+                  f"peak Python heap {peak / 2 ** 20:7.1f} MiB (mean y {mean_height:.3f})")
+            loads[label] = scanned
+        return loads["memory-mapped .lmk"] < loads[".npz"]
+
+def bench_prediction(args):
+    with open(args.corpus, encoding="utf-8", errors="ignore") as f:
+        words = [word.strip("'") for word in re.findall(r"[a-z']+", f.read().lower())]
+    words = [word for word in words if word]
+    split = int(len(words) * args.train)
+    predictor = WordPredictor(max_words=args.max_words, suggestions=args.suggestions)
+    for word in words[:split]:
+        predictor.learn(word)
+
+    # Each letter is one pinch, as is accepting a suggestion, which also types the space
+    plain = typed = 0
+    lookups, learns = [], []
+    for word in words[split:]:
+        plain += len(word) + 1
+        cost = len(word) + 1
+        for typed_letters in range(1, len(word)):
+            start = time.perf_counter()
+            suggestions = predictor.complete(word[:typed_letters])
+            lookups.append(time.perf_counter() - start)
+            if word in suggestions:
+                cost = typed_letters + 1
+                break
+        typed += cost
+        start = time.perf_counter()
+        predictor.learn(word)
+        learns.append(time.perf_counter() - start)
+    if not lookups:
+        print("Corpus too small to evaluate")
+        return False
+    lookups = np.array(lookups) * 1e6
+    learns = np.array(learns) * 1e6
+    print(f"Corpus: {len(words)} words, learned from the first {split}, typed the remaining {len(words) - split}")
+    print(f"Keystrokes: {plain} letter by letter, {typed} with {args.suggestions} suggestions "
+          f"({(1 - typed / plain) * 100:.1f}% saved)")
+    print(f"Lookup: p50 {np.percentile(lookups, 50):.1f} us, p99 {np.percentile(lookups, 99):.1f} us, "
+          f"max {lookups.max():.0f} us | learn: p50 {np.percentile(learns, 50):.1f} us, max {learns.max():.0f} us")
+
+    passed = typed < plain
+    if not passed:
+        print("FAIL: suggestions saved no keystrokes")
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for vocabulary in (args.max_words // 2, args.max_words * 5):
+        tracemalloc.start()
+        predictor = WordPredictor(max_words=args.max_words, suggestions=args.suggestions)
+        for _ in range(vocabulary):
+            predictor.learn("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        prefixes = ["".join(rng.choice(letters) for _ in range(rng.randint(1, 3))) for _ in range(10000)]
+        start = time.perf_counter()
+        for prefix in prefixes:
+            predictor.complete(prefix)
+        per_lookup = (time.perf_counter() - start) / len(prefixes) * 1e6
+        print(f"{vocabulary:>7} distinct words learned: {len(predictor.words)} kept, {predictor.evicted} evicted, "
+              f"{memory / 2 ** 20:.1f} MiB, {per_lookup:.1f} us/lookup")
+        if len(predictor.words) > args.max_words:
+            print(f"FAIL: the predictor kept more than {args.max_words} words")
+            passed = False
+    return passed
+
+STARTUP_PROBE = """
+import json, sys, time
+offset = time.time() - time.perf_counter()
+mode, video, voice = sys.argv[1], sys.argv[2], sys.argv[3] == "voice"
+if mode == "eager":
+    import mediapipe, speech_recognition
+from last import IMPORT_TIMES, EventRecorder, MouseAndKeyboard, RecordingInputBackend, RecordingSystemController, VideoFileSource
+imported = time.time()
+recorder = EventRecorder()
+app = MouseAndKeyboard(RecordingInputBackend(recorder), RecordingSystemController(recorder), enable_voice=voice)
+app.configure_display(headless=True)
+if mode == "eager":
+    # The original order: model and voice calibration finish before the camera is opened
+    app.initialize(wait=True)
+    if app.voice_init:
+        app.voice_init.result()
+app.start(source=VideoFileSource(video, realtime=True))
+marks = {name: when + offset for name, when in app.startup.items()}
+marks["imported"] = imported
+print("STARTUP " + json.dumps({"marks": marks, "imports": IMPORT_TIMES}))
+"""
+
+def import_breakdown(statement, top=8):
+    # Top-level entries of -X importtime, by cumulative microseconds
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):
+            entries.append((int(cumulative), name.strip()))
+    entries.sort(reverse=True)
+    return sum(cumulative for cumulative, _ in entries), entries[:top]
+
+def bench_startup(args):
+    for statement in ("import mediapipe, speech_recognition, last", "import last"):
+        total, entries = import_breakdown(statement)
+        print(f"{statement}: {total / 1000:.0f} ms")
+        for cumulative, name in entries:
+            print(f"  {name:<24} {cumulative / 1000:7.1f} ms")
+
+    order = ("imported", "camera_open", "first_frame", "hands_ready", "first_gesture", "voice_ready")
+    first_frame = {}
+    for mode in ("eager", "lazy"):
+        runs = []
+        deferred = {}
+        for _ in range(args.repeat):
+            launched = time.time()
+            result = subprocess.run([sys.executable, "-c", STARTUP_PROBE, mode, args.video,
+                                     "voice" if args.voice else "quiet"], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            line = next((line for line in result.stdout.splitlines() if line.startswith("STARTUP ")), None)
+            if line is None:
+                print(f"{mode} run failed:\n{result.stderr[-2000:]}")
+                return False
+            report = json.loads(line[len("STARTUP "):])
+            runs.append({name: (when - launched) * 1000 for name, when in report["marks"].items()})
+            deferred = report["imports"]
+        columns = []
+        for name in order:
+            values = [run[name] for run in runs if name in run]
+            if values:
+                columns.append(f"{name} {np.median(values):6.0f} ms")
+        print(f"{mode:>5}: " + ", ".join(columns))
+        first_frame[mode] = np.median([run.get("first_frame", float('inf')) for run in runs])
+        if mode == "lazy" and deferred:
+            print("       imported after launch: " + ", ".join(f"{name} {seconds * 1000:.0f} ms"
+                                                          for name, seconds in deferred.items()))
+    if first_frame["lazy"] >= first_frame["eager"]:
+        print("FAIL: lazy startup shows the first frame no sooner than eager startup")
+        return False
+    return True
+
+def gesture_session(path, cycles=6, fps=30, hold=1):
+    # Right hand sweeping, clicking, dragging and scrolling, then the left hand typing a key, per cycle;
+    # hold stretches every pose over that many frames
+    geometry = VirtualKeyboard(None, None, None, 960, 540, recording_backend()).get_geometry('normal')
+    key_centers = {key: ((x1 + x2) / 2, (y1 + y2) / 2) for key, (x1, y1, x2, y2) in zip(geometry.labels, geometry.rects)}
+    segments = []
+    for cycle in range(cycles):
+        segments += [(1, pose_at("open", 300 + 12 * step, 150 + 20 * cycle), None) for step in range(20)]
+        segments += [(4, synthetic_pose("left"), None), (10, synthetic_pose("open"), None),
+                     (15, synthetic_pose("drag"), None), (5, synthetic_pose("open"), None),
+                     (15, synthetic_pose("scroll"), None), (5, None, pose_at("open", *key_centers["qwerty"[cycle]])),
+                     (3, None, pose_at("left", *key_centers["qwerty"[cycle]])), (5, None, None)]
+    landmark_session(path, [(frames * hold, right, left) for frames, right, left in segments], fps)
+
+def synthetic_camera(width=640, height=480, seed=0):
+    # Smooth gradients with some texture, so the JPEG decodes like a webcam frame rather than flat color
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    image = image + rng.integers(0, 24, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+# Brightness levels of the frame-index pixels; below 100 the preprocessing LUT keeps them distinct
+INDEX_LEVELS = {int(level): value for value, level in
+                enumerate(cv2.convertScaleAbs(np.arange(100, dtype=np.uint8), alpha=1.3, beta=30).ravel())}
+
+class PacedCamera(ReplaySource):
+    # A webcam delivering MJPEG frames at fps into a small driver ring: a reader that falls behind gets
+    # the oldest frame still buffered, and older ones are overwritten. The frame index rides in the top
+    # pixel row so StandInHands can tell which frame it was given
+    def __init__(self, image, frames, fps, ring=4):
+        super().__init__(fps, realtime=True)
+        self.jpeg = cv2.imencode('.jpg', image)[1]
+        self.frames = frames
+        self.ring = ring
+        self.overwritten = 0
+
+    def delivered(self, index):
+        return self.started + index / self.fps
+
+    def pace(self):
+        if self.started is not None:
+            newest = int((time.perf_counter() - self.started) * self.fps)
+            if newest - self.frame_index >= self.ring:
+                self.overwritten += newest - self.ring + 1 - self.frame_index
+                self.frame_index = newest - self.ring + 1
+        super().pace()
+
+    def read(self, out=None):
+        if self.frame_index >= self.frames:
+            self.finished = True
+            return None
+        image = cv2.imdecode(self.jpeg, cv2.IMREAD_COLOR)
+        if out is not None and out.shape == image.shape:
+            np.copyto(out, image)
+            image = out
+        image[0, :, 0] = self.frame_index % 100
+        image[0, :, 1] = self.frame_index // 100
+        return self.make_frame(image, self.frame_index / self.fps)
+
+class StandInHands:
+    # In place of the MediaPipe graph: waits as long as an inference takes, without the GIL as the real
+    # graph does, and returns the session's hands for the frame it was given
+    def __init__(self, path, seconds):
+        data = np.load(path)
+        self.seconds = seconds
+        self.results = []
+        for landmarks, labels in zip(data['landmarks'], data['labels']):
+            present = [slot for slot, label in enumerate(labels) if label]
+            self.results.append(SimpleNamespace(
+                multi_hand_landmarks=[SimpleNamespace(landmark=[SimpleNamespace(x=x, y=y, z=z) for x, y, z in
+                                                                landmarks[slot].tolist()]) for slot in present],
+                multi_handedness=[SimpleNamespace(classification=[SimpleNamespace(label=str(labels[slot]), score=1.0)])
+                                  for slot in present]))
+
+    def process(self, rgb):
+        time.sleep(self.seconds)
+        return self.results[INDEX_LEVELS[int(rgb[0, 0, 2])] + 100 * INDEX_LEVELS[int(rgb[0, 0, 1])]]
+
+def paced_replay(path, frames, args, pipelined):
+    harness = ReplayHarness(path)
+    harness.source = camera = PacedCamera(synthetic_camera(), frames, args.fps)
+    harness.app.hands = StandInHands(path, args.inference_ms / 1000)
+    ages = []
+    render_frame = harness.app.render_frame
+
+    def timed_render(frame):
+        # Age at dispatch: from the camera delivering the frame to its gestures going out
+        keep_running = render_frame(frame)
+        ages.append(time.perf_counter() - camera.delivered(frame.index))
+        return keep_running
+
+    harness.app.render_frame = timed_render
+    report = harness.run(pipelined=pipelined)
+    report["age_ms"] = np.array(ages) * 1000
+    report["overwritten"] = camera.overwritten
+    return report
+
+def print_replay(mode, report):
+    latency = report["latency_ms"]
+    print(f"{mode:>9}: {report['frames']:5d} frames | {report['fps']:6.1f} fps | "
+          f"p50 {latency['p50']:6.1f} ms | p95 {latency['p95']:6.1f} ms | p99 {latency['p99']:6.1f} ms | "
+          f"{len(report['events'])} events")
+
+def bench_replay(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.input
+        if path is None:
+            path = os.path.join(directory, "session.npz")
+            gesture_session(path)
+        reports = {mode: ReplayHarness(path).run(pipelined=mode == "pipelined") for mode in ("serial", "pipelined")}
+    for mode, report in reports.items():
+        print_replay(mode, report)
+    # Unpaced replay drops nothing, so the pipelined loop must inject exactly what the serial one did
+    passed = True
+    if reports["pipelined"]["events"] != reports["serial"]["events"]:
+        print("FAIL: the pipelined loop injected different events than the serial one on the same replay")
+        passed = False
+
+    # A camera faster than the serial loop: serial falls behind until the driver overwrites frames,
+    # the pipelined loop drops stale frames itself and dispatches the newest one
+    print(f"Paced {args.fps:g} fps camera, {args.inference_ms:g} ms inference:")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "paced.npz")
+        gesture_session(path, cycles=3, fps=args.fps, hold=max(1, round(args.fps / 30)))
+        frames = len(np.load(path)['labels'])
+        paced = {mode: paced_replay(path, frames, args, mode == "pipelined") for mode in ("serial", "pipelined")}
+    gestures = {}
+    for mode, report in paced.items():
+        print_replay(mode, report)
+        print(f"{'':>9}  frame age at dispatch p50 {np.percentile(report['age_ms'], 50):6.1f} ms, "
+              f"p95 {np.percentile(report['age_ms'], 95):6.1f} ms | {report['overwritten']} frames overwritten in the driver")
+        # Dropped frames change how many moves and repeated scrolls go out, not which gestures fire
+        actions = [(event["action"], event["args"]) for event in report["events"] if event["action"] != "move_to"]
+        gestures[mode] = [action for position, action in enumerate(actions)
+                          if action[0] != "scroll" or actions[position - 1:position] != [action]]
+    serial, pipelined = paced["serial"], paced["pipelined"]
+    if pipelined["fps"] < serial["fps"] * (1 - args.tolerance):
+        print("FAIL: the pipelined loop dispatched fewer frames per second than the serial one")
+        passed = False
+    if np.percentile(pipelined["age_ms"], 95) >= np.percentile(serial["age_ms"], 95):
+        print("FAIL: the pipelined loop dispatched frames no fresher than the serial one")
+        passed = False
+    if gestures["pipelined"] != gestures["serial"]:
+        print(f"FAIL: the modes fired different gestures: serial {gestures['serial']}, pipelined {gestures['pipelined']}")
+        passed = False
+    return passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the virtual mouse and keyboard")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hit_testing = subparsers.add_parser("hit-testing", help="keyboard hit-testing: compiled geometry vs linear scan")
+    hit_testing.add_argument("--points", type=int, default=20000)
+    hit_testing.add_argument("--repeat", type=int, default=5)
+    hit_testing.set_defaults(func=bench_hit_testing)
+
+    parity = subparsers.add_parser("gesture-parity", help="parity of landmark-array gestures with the per-landmark implementation")
+    parity.add_argument("--landmarks", help=".npy file of recorded (frames, 21, 3) normalized landmarks")
+    parity.add_argument("--frames", type=int, default=5000, help="synthetic frames when no recording is given")
+    parity.add_argument("--repeat", type=int, default=5)
+    parity.set_defaults(func=bench_gesture_parity)
+
+    timeline = subparsers.add_parser("gesture-timeline",
+                                     help="synthetic gesture timeline through VirtualMouse; fails if the events change")
+    timeline.set_defaults(func=bench_gesture_timeline)
+
+    hand_loss = subparsers.add_parser("hand-loss", help="replay check: hand loss releases the button and restarts the pointer filters")
+    hand_loss.set_defaults(func=bench_hand_loss)
+
+    roi = subparsers.add_parser("roi", help="adaptive ROI inference vs full-frame inference on a video")
+    roi.add_argument("video", nargs="?", help="recording to replay (default: a synthesized two-hand clip)")
+    roi.add_argument("--target-fps", type=float, default=30)
+    roi.add_argument("--max-error", type=float, default=4.0, help="mean landmark error in pixels that fails the run")
+    roi.set_defaults(func=bench_roi)
+
+    inference = subparsers.add_parser("inference-process",
+                                      help="hand inference frame-time jitter in-process vs in a worker under voice load")
+    inference.add_argument("video")
+    inference.add_argument("--frames", type=int, default=300)
+    inference.add_argument("--fps", type=float, default=30)
+    inference.add_argument("--voice-threads", type=int, default=2)
+    inference.add_argument("--duty", type=float, default=0.5, help="share of time each voice thread spends busy")
+    inference.set_defaults(func=bench_inference_process)
+
+    preprocessing = subparsers.add_parser("preprocessing", help="per-frame allocations: preallocated buffers vs the original loop")
+    preprocessing.add_argument("--frames", type=int, default=200)
+    preprocessing.add_argument("--width", type=int, default=960)
+    preprocessing.add_argument("--height", type=int, default=540)
+    preprocessing.set_defaults(func=bench_preprocessing)
+
+    voice = subparsers.add_parser("voice", help="end-of-speech to command-queued latency per speech backend")
+    voice.add_argument("fixtures", nargs="?", help="directory of mono .wav files named after the spoken command, "
+                       "e.g. increase_volume.wav; synthesized with pyttsx3 when omitted")
+    voice.add_argument("--backends", nargs="+", default=["google", "vosk"], choices=["google", "vosk"])
+    voice.add_argument("--vosk-model", metavar="DIR")
+    voice.add_argument("--min-accuracy", type=float, default=0.9, help="share of commands each backend must get right")
+    voice.add_argument("--max-latency", type=float, default=1500, help="p95 end-of-speech to queued bound in ms")
+    voice.set_defaults(func=bench_voice)
+
+    vad = subparsers.add_parser("vad", help="endpointing latency and recognizer calls: energy threshold vs VAD")
+    vad.add_argument("fixtures", nargs="?", help="directory of mono .wav commands, as for the voice benchmark; "
+                     "files named noise* or silence* must not reach the recognizer. Synthesized when omitted")
+    vad.add_argument("--max-endpoint", type=float, default=0.6, help="seconds after end of speech the VAD must endpoint by")
+    vad.add_argument("--noise", type=float, default=400, help="background noise RMS; the old threshold is 300")
+    vad.add_argument("--bursts", type=int, default=4, help="short loud noises added around each command")
+    vad.set_defaults(func=bench_vad)
+
+    matcher = subparsers.add_parser("matcher", help="voice command matcher correctness and cost as the table grows")
+    matcher.add_argument("--sizes", type=int, nargs="+", default=[24, 100, 1000, 5000])
+    matcher.add_argument("--max-growth", type=float, default=2.0,
+                         help="fail if matching at the largest size is this many times slower than at the smallest")
+    matcher.add_argument("--repeat", type=int, default=20)
+    matcher.set_defaults(func=bench_matcher)
+
+    commands = subparsers.add_parser("commands", help="render-loop stall from slow voice commands: inline vs executor")
+    commands.add_argument("--delay", type=float, default=0.5, help="seconds a slow system command blocks")
+    commands.add_argument("--frames", type=int, default=60)
+    commands.add_argument("--fps", type=float, default=30)
+    commands.add_argument("--max-stall", type=float, default=5, help="worst frame stall in ms the executor may cause")
+    commands.set_defaults(func=bench_commands)
+
+    apps = subparsers.add_parser("apps", help="app-resolution index on a fake package tree with the launcher stubbed")
+    apps.add_argument("--packages", type=int, default=2000)
+    apps.add_argument("--repeat", type=int, default=20)
+    apps.set_defaults(func=bench_apps)
+
+    levels = subparsers.add_parser("levels", help="volume/brightness bursts against a slow fake device")
+    levels.add_argument("--changes", type=int, default=12)
+    levels.add_argument("--spacing", type=float, default=0.05, help="seconds between spoken changes")
+    levels.add_argument("--read-delay", type=float, default=0.3)
+    levels.add_argument("--write-delay", type=float, default=0.1)
+    levels.add_argument("--min-interval", type=float, default=0.1, help="minimum seconds between device writes")
+    levels.add_argument("--max-block", type=float, default=5, help="ms a write-behind change may block the caller")
+    levels.set_defaults(func=bench_levels)
+
+    screenshots = subparsers.add_parser("screenshots", help="caller blocking and sustained rate of screenshot saving")
+    screenshots.add_argument("--size", type=int, nargs=2, default=[3840, 2160], metavar=("WIDTH", "HEIGHT"))
+    screenshots.add_argument("--captures", type=int, default=20)
+    screenshots.add_argument("--formats", nargs="+", default=["png", "jpg"], choices=sorted(ScreenshotService.extensions))
+    screenshots.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    screenshots.add_argument("--burst", type=int, default=5)
+    screenshots.set_defaults(func=bench_screenshots)
+
+    pointer = subparsers.add_parser("pointer", help="lag vs jitter of the cursor filters on a hand trace")
+    pointer.add_argument("--landmarks", help=".npz or .lmk landmark recording; synthetic if omitted")
+    pointer.add_argument("--seconds", type=float, default=60)
+    pointer.add_argument("--fps", type=float, default=30)
+    pointer.add_argument("--noise", type=float, default=4.0, help="synthetic landmark jitter in screen pixels")
+    pointer.add_argument("--max-jitter", type=float, default=3.0, help="still jitter in pixels the default filter may show")
+    pointer.set_defaults(func=bench_pointer)
+
+    gestures = subparsers.add_parser("gestures", help="gesture classifier accuracy and cost vs the fixed thresholds")
+    gestures.add_argument("--profile", help="gesture profile from --calibrate; its samples are split into train/test")
+    gestures.add_argument("--samples", type=int, default=2000)
+    gestures.add_argument("--repeat", type=int, default=5)
+    gestures.add_argument("--max-cost", type=float, default=100,
+                          help="model cost in us per two-hand frame that fails the run")
+    gestures.set_defaults(func=bench_gestures)
+
+    idle = subparsers.add_parser("idle", help="CPU per minute and wake-up latency of the idle gate on recordings")
+    idle.add_argument("videos", nargs="+", help="recordings, e.g. an empty scene and one where a hand comes and goes")
+    idle.add_argument("--idle-after", type=float, default=5.0)
+    idle.add_argument("--idle-fps", type=float, default=4)
+    idle.set_defaults(func=bench_idle)
+
+    display = subparsers.add_parser("display", help="dispatch rate with the preview on, throttled and headless")
+    display.add_argument("recording", help="video, or .npz landmarks to leave inference out of the comparison")
+    display.add_argument("--every", type=int, default=3)
+    display.add_argument("--fps", type=float, default=10)
+    display.add_argument("--pipelined", action="store_true")
+    display.set_defaults(func=bench_display)
+
+    recording = subparsers.add_parser("recording", help="landmark recorder cost and memory-mapped replay vs .npz")
+    recording.add_argument("--frames", type=int, default=108000, help="default is an hour at 30 fps")
+    recording.set_defaults(func=bench_recording)
+
+    prediction = subparsers.add_parser("prediction", help="word prediction keystroke savings and lookup cost")
+    prediction.add_argument("corpus", help="plain text; the first part trains, the rest is typed")
+    prediction.add_argument("--train", type=float, default=0.5, help="share of the corpus learned before typing")
+    prediction.add_argument("--suggestions", type=int, default=3)
+    prediction.add_argument("--max-words", type=int, default=20000)
+    prediction.set_defaults(func=bench_prediction)
+
+    startup = subparsers.add_parser("startup", help="time to first frame and first gesture, eager vs lazy startup")
+    startup.add_argument("video", help="clip standing in for the camera, with a hand in view from the start")
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.add_argument("--voice", action="store_true", help="include microphone calibration (needs a microphone)")
+    startup.set_defaults(func=bench_startup)
+
+    replay = subparsers.add_parser("replay", help="serial vs pipelined loop on the same recorded input")
+    replay.add_argument("input", nargs="?", help="video file or .npz/.lmk landmark recording (default: a synthesized session)")
+    replay.add_argument("--fps", type=float, default=60, help="rate of the paced camera, above the serial loop's")
+    replay.add_argument("--inference-ms", type=float, default=20, help="time the stand-in hand model takes per frame")
+    replay.add_argument("--tolerance", type=float, default=0.02,
+                        help="share of the serial frame rate the pipelined loop may fall short by")
+    replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    # Benchmarks that double as checks return False when a check fails
+    if args.func(args) is False:
+        sys.exit(1)
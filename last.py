@@ -1,49 +1,1115 @@
 import cv2
 import numpy as np
-import mediapipe as mp
-import pyautogui
 import math
 import time
-from pynput.keyboard import Controller, Key
 from enum import Enum, auto
-import speech_recognition as sr
 import queue
 import threading
 import subprocess
-import screen_brightness_control as sbc
-import pycaw.pycaw as pycaw
 from ctypes import cast, POINTER
-from comtypes import CLSCTX_ALL
 import os
 import glob
+import argparse
+import bisect
+import difflib
+import functools
+import importlib
+import itertools
+import operator
+import json
+import re
+import sys
+import multiprocessing
+import multiprocessing.shared_memory
+from collections import deque
 
-# Initialize mediapipe
-mp_hands = mp.solutions.hands
-mp_drawing = mp.solutions.drawing_utils
+IMPORT_TIMES = {}
+
+class LazyModule:
+    # Imported on first attribute access so startup only pays for the backends it reaches
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def load(self):
+        if self.module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self.name)
+            IMPORT_TIMES.setdefault(self.name, time.perf_counter() - start)
+            self.module = module
+        return self.module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+mp = LazyModule("mediapipe")
+sr = LazyModule("speech_recognition")
+sbc = LazyModule("screen_brightness_control")
+pycaw = LazyModule("pycaw.pycaw")
+comtypes = LazyModule("comtypes")
+
+# Display and Windows-only backends are optional so headless replay runs on a plain Linux box
+try:
+    import pyautogui
+except Exception:
+    pyautogui = None
+try:
+    from pynput.keyboard import Controller, Key
+except Exception:
+    Controller = Key = None
+
+WRIST = 0
+THUMB_TIP = 4
+INDEX_TIP = 8
+PINKY_TIP = 20
+# Index arrays rather than lists: numpy fancy indexing with a list converts it on every call
+FINGER_TIPS = np.array([4, 8, 12, 16, 20])
+FINGER_MCPS = np.array([2, 5, 9, 13, 17])
+# Rows 0-3: thumb tip to the index, middle, ring and pinky tips; rows 4-8: each fingertip to its knuckle
+GESTURE_OFFSETS = np.zeros((9, 21), dtype=np.int64)
+GESTURE_OFFSETS[np.arange(4), FINGER_TIPS[1:]] = 1
+GESTURE_OFFSETS[np.arange(4), THUMB_TIP] = -1
+GESTURE_OFFSETS[np.arange(4, 9), FINGER_TIPS] = 1
+GESTURE_OFFSETS[np.arange(4, 9), FINGER_MCPS] = -1
+LANDMARK_COORDS = operator.attrgetter("x", "y", "z")
+# mediapipe's HAND_CONNECTIONS, sorted; spelled out so drawing doesn't import mediapipe
+HAND_CONNECTIONS = [(0, 1), (0, 5), (0, 17), (1, 2), (2, 3), (3, 4), (5, 6), (5, 9), (6, 7), (7, 8), (9, 10),
+                    (9, 13), (10, 11), (11, 12), (13, 14), (13, 17), (14, 15), (15, 16), (17, 18), (18, 19), (19, 20)]
+FINGER_CHAINS = np.array([[0, 1, 2, 3, 4], [0, 5, 6, 7, 8], [0, 9, 10, 11, 12], [0, 13, 14, 15, 16], [0, 17, 18, 19, 20]])
+MIDDLE_MCP = 9
+# Classifier vectors as landmark differences. Row 0: wrist to middle knuckle (the palm); rows 1-4: thumb tip to
+# the other tips; rows 5-9: wrist to each tip; rows 10-24 and 25-39: each bone and the next one along its finger
+HAND_VECTORS = np.zeros((40, 21))
+HAND_VECTORS[0, [WRIST, MIDDLE_MCP]] = -1, 1
+HAND_VECTORS[np.arange(1, 5), FINGER_TIPS[1:]] = 1
+HAND_VECTORS[np.arange(1, 5), THUMB_TIP] = -1
+HAND_VECTORS[np.arange(5, 10), FINGER_TIPS] = 1
+HAND_VECTORS[np.arange(5, 10), WRIST] -= 1
+HAND_VECTORS[np.arange(10, 25).reshape(5, 3), FINGER_CHAINS[:, 1:4]] = 1
+HAND_VECTORS[np.arange(10, 25).reshape(5, 3), FINGER_CHAINS[:, :3]] = -1
+HAND_VECTORS[np.arange(25, 40).reshape(5, 3), FINGER_CHAINS[:, 2:]] = 1
+HAND_VECTORS[np.arange(25, 40).reshape(5, 3), FINGER_CHAINS[:, 1:4]] = -1
+# Left and right sides of one dot product per column: every vector with itself, then each bone with the next
+HAND_PAIRS = np.concatenate([HAND_VECTORS, HAND_VECTORS[10:25], HAND_VECTORS, HAND_VECTORS[25:]])
+APP_INDEX_CACHE = os.path.join(os.path.expanduser("~"), ".last_app_index.json")
+GESTURE_PROFILE = os.path.join(os.path.expanduser("~"), ".last_gestures.npz")
+WORD_PROFILE = os.path.join(os.path.expanduser("~"), ".last_words.json")
+HAND_OPTIONS = dict(max_num_hands=2, min_detection_confidence=0.8, min_tracking_confidence=0.8)
 
 class HandType(Enum):
     LEFT = auto()
     RIGHT = auto()
 
-class SystemController:
+class DetectedHands:
+    def __init__(self, landmarks=None, labels=None, scores=None):
+        self.landmarks = landmarks if landmarks is not None else np.empty((0, 21, 3))
+        self.labels = labels if labels is not None else []
+        self.scores = scores if scores is not None else []
+        self.gestures = None
+
+    @classmethod
+    def from_results(cls, results):
+        if not results or not results.multi_hand_landmarks:
+            return cls()
+        count = len(results.multi_hand_landmarks)
+        points = itertools.chain.from_iterable(hand_landmarks.landmark for hand_landmarks in results.multi_hand_landmarks)
+        landmarks = np.fromiter(itertools.chain.from_iterable(map(LANDMARK_COORDS, points)),
+                                dtype=np.float64, count=count * 63).reshape(count, 21, 3)
+        classifications = [handedness.classification[0] for handedness in results.multi_handedness]
+        return cls(landmarks, [c.label for c in classifications], [c.score for c in classifications])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def index_of(self, label):
+        index = None
+        for idx, hand_label in enumerate(self.labels):
+            if hand_label == label:
+                index = idx
+        return index
+
+class AdaptiveHandTracker:
+    # Full frames go to the app's graph, periodically or once tracking is lost. In between, a second graph allowed
+    # exactly as many hands as the last full frame found tracks them through a fixed crop: a graph allowed more hands
+    # than it sees runs palm detection on every frame looking for the rest. The crop graph never sees a full frame,
+    # and is reset whenever the crop moves so it never tracks from landmarks placed in a different view
+    def __init__(self, hands, target_fps=30, margin=0.6, min_side=160, min_interval=10, max_interval=90,
+                 budget_share=0.5, crop_factory=None):
+        self.hands = hands
+        self.margin = margin
+        self.min_side = min_side
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.full_frame_interval = min_interval
+        self.budget = budget_share / target_fps
+        self.process_time = None
+        self.roi = None
+        self.tracked = 0
+        self.frames_since_full = 0
+        # One crop graph per hand count, built off the frame thread; until they're in every frame is a full frame
+        crop_factory = crop_factory or (lambda count: mp.solutions.hands.Hands(**dict(HAND_OPTIONS, max_num_hands=count)))
+        self.crop_graphs = {count: BackgroundTask(f"{count}-hand crop tracking", functools.partial(crop_factory, count))
+                            for count in range(1, HAND_OPTIONS["max_num_hands"] + 1)}
+
+    def crop_graph(self):
+        if self.roi is None or self.frames_since_full >= self.full_frame_interval:
+            return None
+        task = self.crop_graphs.get(self.tracked)
+        return task.value if task is not None and task.ready() else None
+
+    def process(self, rgb):
+        h, w = rgb.shape[:2]
+        graph = self.crop_graph()
+        full = graph is None
+        if full:
+            x0, y0, x1, y1 = 0, 0, w, h
+            self.frames_since_full = 0
+            graph = self.hands
+        else:
+            x0, y0, x1, y1 = self.roi
+            self.frames_since_full += 1
+        crop_w, crop_h = x1 - x0, y1 - y0
+
+        start = time.perf_counter()
+        hands = DetectedHands.from_results(graph.process(np.ascontiguousarray(rgb[y0:y1, x0:x1])))
+        self.adapt(time.perf_counter() - start)
+
+        if not len(hands):
+            self.roi = None
+            return hands
+        # Back to full-frame normalized coordinates; z shares x's scale
+        hands.landmarks[:, :, 0] = (hands.landmarks[:, :, 0] * crop_w + x0) / w
+        hands.landmarks[:, :, 1] = (hands.landmarks[:, :, 1] * crop_h + y0) / h
+        hands.landmarks[:, :, 2] *= crop_w / w
+        if full:
+            self.roi = self.region_around(hands.landmarks, w, h, self.margin)
+            self.tracked = len(hands)
+            task = self.crop_graphs.get(self.tracked)
+            if self.roi is not None and task is not None and task.ready():
+                task.value.reset()
+            return hands
+        # Half the margin may be used up before the crop moves
+        region = self.region_around(hands.landmarks, w, h, self.margin / 2)
+        if region is None or not self.contains(self.roi, region) or len(hands) < self.tracked:
+            # A hand is nearing the crop edge or was lost: re-anchor on a full frame next time
+            self.frames_since_full = self.full_frame_interval
+        return hands
+
+    def region_around(self, landmarks, w, h, margin):
+        x_min, y_min = landmarks[:, :, :2].min(axis=(0, 1)) * (w, h)
+        x_max, y_max = landmarks[:, :, :2].max(axis=(0, 1)) * (w, h)
+        pad = margin * max(x_max - x_min, y_max - y_min, self.min_side)
+        x0, y0 = max(0, int(x_min - pad)), max(0, int(y_min - pad))
+        x1, y1 = min(w, int(x_max + pad) + 1), min(h, int(y_max + pad) + 1)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def contains(outer, inner):
+        return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+    def adapt(self, seconds):
+        # MediaPipe resizes every input to fixed tensor sizes, so a smaller crop or a downscaled frame barely changes
+        # model cost. What does is how often palm detection runs, on every full frame, so their spacing is the knob
+        self.process_time = seconds if self.process_time is None else 0.9 * self.process_time + 0.1 * seconds
+        if self.process_time > self.budget:
+            self.full_frame_interval = min(self.max_interval, int(self.full_frame_interval * 1.25) + 1)
+        elif self.process_time < 0.6 * self.budget:
+            self.full_frame_interval = max(self.min_interval, int(self.full_frame_interval * 0.9))
+
+def hand_inference_worker(shm_name, shape, max_hands, connection, options):
+    shm = multiprocessing.shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((2,) + shape, dtype=np.uint8, buffer=shm.buf)
+    results = np.ndarray((2,), dtype=landmark_record_dtype(max_hands), buffer=shm.buf, offset=frames.nbytes)
+    hands = mp.solutions.hands.Hands(**options)
+    connection.send("ready")
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            slot, sequence = request
+            store_hands(results, slot, DetectedHands.from_results(hands.process(frames[slot])))
+            connection.send((slot, sequence))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        hands.close()
+        del frames, results
+        shm.close()
+
+class ProcessHandTracker:
+    def __init__(self, options=None, max_hands=2, timeout=1.0, backoff=0.5, max_backoff=8.0, max_failures=5):
+        # Spawned rather than forked so the worker never inherits the listener and input threads
+        self.context = multiprocessing.get_context("spawn")
+        self.options = options or HAND_OPTIONS
+        self.max_hands = max_hands
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.dtype = landmark_record_dtype(max_hands)
+        self.shape = None
+        self.shm = None
+        self.worker = None
+        self.connection = None
+        self.ready = False
+        self.in_flight = {}
+        self.sequence = 0
+        self.restarts = 0
+        self.timeouts = 0
+        # Restarts since the worker last returned a frame; each doubles the wait before the next one
+        self.failures = 0
+        self.retry_at = None
+        self.fallback = None
+
+    def start(self, shape):
+        self.stop()
+        self.shape = shape
+        frame_bytes = 2 * int(np.prod(shape))
+        self.shm = multiprocessing.shared_memory.SharedMemory(create=True, size=frame_bytes + 2 * self.dtype.itemsize)
+        self.frames = np.ndarray((2,) + shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.results = np.ndarray((2,), dtype=self.dtype, buffer=self.shm.buf, offset=frame_bytes)
+        self.connection, child = self.context.Pipe()
+        self.worker = self.context.Process(target=hand_inference_worker, daemon=True,
+                                           args=(self.shm.name, shape, self.max_hands, child, self.options))
+        self.worker.start()
+        child.close()
+        self.ready = False
+        self.in_flight = {}
+
+    def wait_ready(self, timeout=30):
+        deadline = time.perf_counter() + timeout
+        while not self.ready and time.perf_counter() < deadline:
+            if self.worker is None or not self.worker.is_alive():
+                return False
+            self.check_ready(0.05)
+        return self.ready
+
+    def check_ready(self, timeout=0):
+        try:
+            if self.connection.poll(timeout) and self.connection.recv() == "ready":
+                self.ready = True
+        except (EOFError, OSError):
+            pass
+        return self.ready
+
+    def recover(self):
+        self.stop()
+        self.failures += 1
+        if self.failures > self.max_failures:
+            print(f"Hand inference worker failed {self.failures} times in a row; running inference in-process")
+            self.fallback = BackgroundTask("hand tracking", lambda: mp.solutions.hands.Hands(**self.options))
+            return
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        print(f"Hand inference worker stopped; restarting it in {delay:.1f} s")
+        self.retry_at = time.perf_counter() + delay
+
+    def process(self, rgb):
+        if self.fallback is not None:
+            # Frames arriving while the in-process model loads are passed through without hands
+            if not self.fallback.ready():
+                return DetectedHands()
+            return DetectedHands.from_results(self.fallback.value.process(rgb))
+        if self.worker is None and self.retry_at is not None:
+            if time.perf_counter() < self.retry_at:
+                return DetectedHands()
+            self.restarts += 1
+            self.retry_at = None
+            self.start(rgb.shape)
+        elif self.shape != rgb.shape:
+            self.start(rgb.shape)
+        elif not self.worker.is_alive():
+            self.recover()
+            return DetectedHands()
+        # Frames arriving while the worker loads its model are passed through without hands
+        if not self.ready and not self.check_ready():
+            return DetectedHands()
+        # A slot the worker may still be reading after a timeout is never overwritten
+        free = [slot for slot in (0, 1) if slot not in self.in_flight]
+        if not free:
+            self.collect(0)
+            free = [slot for slot in (0, 1) if slot not in self.in_flight]
+            if not free:
+                return DetectedHands()
+        slot = free[0]
+        np.copyto(self.frames[slot], rgb)
+        self.sequence += 1
+        self.in_flight[slot] = self.sequence
+        try:
+            self.connection.send((slot, self.sequence))
+        except (EOFError, OSError):
+            self.recover()
+            return DetectedHands()
+        hands = self.collect(self.timeout)
+        if hands is None:
+            self.timeouts += 1
+            return DetectedHands()
+        return hands
+
+    def collect(self, timeout):
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                if not self.connection.poll(max(0.0, deadline - time.perf_counter())):
+                    return None
+                slot, sequence = self.connection.recv()
+            except (EOFError, OSError):
+                self.recover()
+                return None
+            del self.in_flight[slot]
+            self.failures = 0
+            if sequence == self.sequence:
+                # Copied out so the slot can take the next frame
+                hands = load_hands(self.results[slot])
+                return DetectedHands(hands.landmarks.astype(np.float64), hands.labels, hands.scores.tolist())
+
+    def stop(self):
+        if self.worker is not None:
+            try:
+                self.connection.send(None)
+            except (EOFError, OSError):
+                pass
+            self.worker.join(1)
+            if self.worker.is_alive():
+                self.worker.terminate()
+                self.worker.join()
+            self.connection.close()
+            self.worker = None
+        if self.shm is not None:
+            del self.frames, self.results
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.stop()
+        if self.fallback is not None and self.fallback.ready():
+            self.fallback.value.close()
+        if self.restarts or self.timeouts:
+            print(f"Hand inference worker: {self.restarts} restarts, {self.timeouts} timed out frames")
+
+class IdleGate:
+    def __init__(self, idle_after=5.0, idle_fps=4, motion_threshold=12, motion_fraction=0.005,
+                 thumbnail_size=(80, 45), observe_only=False):
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        self.motion_threshold = motion_threshold
+        self.motion_fraction = motion_fraction
+        self.thumbnail_size = thumbnail_size
+        # observe_only tracks hand presence without skipping anything, as a baseline for benchmarks
+        self.observe_only = observe_only
+        self.active = True
+        self.last_hand_time = None
+        self.previous = None
+        self.transitions = []
+        self.skipped_inferences = 0
+        self.skipped_frames = 0
+
+    def frames_to_skip(self, source_fps):
+        if self.active or self.observe_only:
+            return 0
+        count = max(int(round(source_fps / self.idle_fps)) - 1, 0)
+        self.skipped_frames += count
+        return count
+
+    def should_infer(self, rgb):
+        if self.active or self.observe_only:
+            self.previous = None
+            return True
+        # A thumbnail difference against the previous poll costs a fraction of a millisecond
+        small = cv2.cvtColor(cv2.resize(rgb, self.thumbnail_size, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+        previous, self.previous = self.previous, small
+        moved = previous is not None and bool(
+            np.count_nonzero(cv2.absdiff(small, previous) > self.motion_threshold) > self.motion_fraction * small.size)
+        if not moved:
+            self.skipped_inferences += 1
+        return moved
+
+    def observe(self, now, hand_count):
+        if hand_count:
+            self.last_hand_time = now
+            if not self.active:
+                self.active = True
+                self.transitions.append((now, "active"))
+        elif self.last_hand_time is None:
+            self.last_hand_time = now
+        elif self.active and now - self.last_hand_time >= self.idle_after:
+            self.active = False
+            self.transitions.append((now, "idle"))
+
+    def report(self):
+        wakes = sum(1 for _, state in self.transitions if state == "active")
+        print(f"Idle gate: {wakes} wake-ups, {self.skipped_frames} frames skipped, "
+              f"{self.skipped_inferences} inferences skipped without motion")
+
+def draw_hands(img, hands):
+    h, w = img.shape[:2]
+    for landmarks in hands.landmarks:
+        points = (landmarks[:, :2] * (w, h)).astype(np.int32).tolist()
+        for start, end in HAND_CONNECTIONS:
+            cv2.line(img, tuple(points[start]), tuple(points[end]), (0,255,0), 2)
+        for point in points:
+            cv2.circle(img, tuple(point), 4, (255,0,255), 2)
+
+class InputBackend:
     def __init__(self):
-        devices = pycaw.AudioUtilities.GetSpeakers()
-        interface = devices.Activate(pycaw.IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-        self.volume = cast(interface, POINTER(pycaw.IAudioEndpointVolume))
+        pyautogui.FAILSAFE = False
+        pyautogui.PAUSE = 0.01
+        self.keyboard = Controller()
+
+    def screen_size(self):
+        return pyautogui.size()
+
+    def move_to(self, x, y):
+        pyautogui.moveTo(x, y)
+
+    def click(self):
+        pyautogui.click()
+
+    def double_click(self):
+        pyautogui.doubleClick()
+
+    def right_click(self):
+        pyautogui.rightClick()
+
+    def mouse_down(self):
+        pyautogui.mouseDown()
+
+    def mouse_up(self):
+        pyautogui.mouseUp()
+
+    def scroll(self, amount):
+        pyautogui.scroll(amount)
+
+    def hotkey(self, *keys):
+        pyautogui.hotkey(*keys)
+
+    def tap_char(self, char):
+        self.keyboard.press(char)
+        self.keyboard.release(char)
+
+    def tap_special(self, name):
+        key = getattr(Key, name)
+        self.keyboard.press(key)
+        self.keyboard.release(key)
+
+class InputInjectionWorker:
+    def __init__(self, backend):
+        self.backend = backend
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.running = True
+        self.latency = StageStats(window=1000)
+        self.coalesced_moves = 0
+        self.max_queue_depth = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, action, *args):
+        with self.condition:
+            # Only a move directly behind another move collapses, so button and key order is kept
+            if action == "move_to" and self.pending and self.pending[-1][0] == "move_to":
+                self.pending[-1] = (action, args, self.pending[-1][2])
+                self.coalesced_moves += 1
+            else:
+                self.pending.append((action, args, time.perf_counter()))
+                self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and self.running:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                action, args, queued = self.pending.popleft()
+            try:
+                getattr(self.backend, action)(*args)
+            except Exception as e:
+                print(f"Input injection failed ({action}): {e}")
+            self.latency.record(action, time.perf_counter() - queued)
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.pending)
+
+    def metrics(self):
+        metrics = {"queue_depth": self.queue_depth(), "max_queue_depth": self.max_queue_depth,
+                   "coalesced_moves": self.coalesced_moves, "latency_ms": {}}
+        for action in list(self.latency.samples):
+            metrics["latency_ms"][action] = dict(zip(("p50", "p95", "p99"), self.latency.percentiles(action).tolist()))
+        return metrics
+
+    def report(self):
+        print(f"Input injection: max queue depth {self.max_queue_depth}, "
+              f"{self.coalesced_moves} moves coalesced")
+        self.latency.report()
+
+    def close(self, timeout=1):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    def screen_size(self):
+        return self.backend.screen_size()
+
+    def move_to(self, x, y):
+        self.submit("move_to", x, y)
+
+    def click(self):
+        self.submit("click")
+
+    def double_click(self):
+        self.submit("double_click")
+
+    def right_click(self):
+        self.submit("right_click")
+
+    def mouse_down(self):
+        self.submit("mouse_down")
+
+    def mouse_up(self):
+        self.submit("mouse_up")
+
+    def scroll(self, amount):
+        self.submit("scroll", amount)
+
+    def hotkey(self, *keys):
+        self.submit("hotkey", *keys)
+
+    def tap_char(self, char):
+        self.submit("tap_char", char)
+
+    def tap_special(self, name):
+        self.submit("tap_special", name)
+
+class EventRecorder:
+    def __init__(self, current_frame=lambda: None):
+        self.events = []
+        self.current_frame = current_frame
+
+    def record(self, action, *args):
+        frame = self.current_frame()
+        index, timestamp = (frame.index, frame.timestamp) if frame else (None, None)
+        args = [round(float(arg), 2) if isinstance(arg, (float, np.floating)) else arg for arg in args]
+        self.events.append({"frame": index, "t": timestamp, "action": action, "args": args})
+
+class RecordingInputBackend:
+    def __init__(self, recorder, screen_size=(1920, 1080)):
+        self.recorder = recorder
+        self.size = screen_size
+
+    def screen_size(self):
+        return self.size
+
+    def move_to(self, x, y):
+        self.recorder.record("move_to", x, y)
+
+    def click(self):
+        self.recorder.record("click")
+
+    def double_click(self):
+        self.recorder.record("double_click")
+
+    def right_click(self):
+        self.recorder.record("right_click")
+
+    def mouse_down(self):
+        self.recorder.record("mouse_down")
+
+    def mouse_up(self):
+        self.recorder.record("mouse_up")
+
+    def scroll(self, amount):
+        self.recorder.record("scroll", amount)
+
+    def hotkey(self, *keys):
+        self.recorder.record("hotkey", *keys)
+
+    def tap_char(self, char):
+        self.recorder.record("tap_char", char)
+
+    def tap_special(self, name):
+        self.recorder.record("tap_special", name)
+
+class AppIndex:
+    def __init__(self, mappings, config_path=None, cache_path=None, roots=(), extensions=(".exe",),
+                 launcher=subprocess.Popen, fuzzy_cutoff=0.75):
+        self.mappings = {name: tuple(entry) for name, entry in mappings.items()}
+        self.config_path = config_path
+        self.cache_path = cache_path
+        self.roots = list(roots)
+        self.extensions = tuple(extensions)
+        self.launcher = launcher
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.entries = {}
+        self.names = []
+        self.ready = threading.Event()
+        self.load_config()
+
+    def load_config(self):
+        # {"apps": {"spoken name": "path" or ["command", "process.exe"]}, "roots": ["dir to scan", ...]}
+        if not self.config_path or not os.path.exists(self.config_path):
+            return
+        try:
+            with open(self.config_path) as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read app config {self.config_path}: {e}")
+            return
+        for name, entry in config.get("apps", {}).items():
+            path, exe_name = (entry, os.path.basename(entry)) if isinstance(entry, str) else entry
+            self.mappings[name.lower().strip()] = (path, exe_name)
+        self.roots.extend(config.get("roots", []))
+
+    @staticmethod
+    def wildcard_at(path):
+        positions = [path.find(char) for char in "*?[" if char in path]
+        return min(positions) if positions else -1
+
+    def watched_paths(self):
+        # Package installs add or remove top-level directories, which bumps the parent's mtime.
+        # Directories below the roots are stamped by scan_roots as it visits them
+        paths = set(self.roots)
+        for path, _ in self.mappings.values():
+            wildcard = self.wildcard_at(path)
+            if wildcard >= 0:
+                paths.add(os.path.dirname(path[:wildcard]))
+        if self.config_path:
+            paths.add(self.config_path)
+        return sorted(paths)
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def load_cache(self, watched):
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        mappings = {name: list(entry) for name, entry in self.mappings.items()}
+        if cache.get("watched") != watched or cache.get("mappings") != mappings:
+            return None
+        # Every directory the last scan visited, so an install deep inside a root is noticed too
+        if any(self.mtime(path) != mtime for path, mtime in cache.get("stamps", {}).items()):
+            return None
+        return {name: tuple(entry) for name, entry in cache.get("entries", {}).items()}
+
+    def save_cache(self, watched, stamps, entries):
+        temp_path = self.cache_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({"watched": watched, "stamps": stamps,
+                           "mappings": {name: list(entry) for name, entry in self.mappings.items()},
+                           "entries": {name: list(entry) for name, entry in entries.items()}}, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write app index cache {self.cache_path}: {e}")
+
+    def resolve_mapping(self, path):
+        if self.wildcard_at(path) < 0:
+            return path
+        # Versioned package directories sort oldest first, so the last match is the newest install
+        matches = sorted(glob.glob(path))
+        return matches[-1] if matches else None
+
+    def scan_roots(self):
+        # Walks in os.walk's order, stamping each directory before listing it so a change made
+        # mid-scan still invalidates the cache
+        entries, stamps = {}, {}
+        pending = list(reversed(self.roots))
+        while pending:
+            directory = pending.pop()
+            stamps[directory] = self.mtime(directory)
+            try:
+                with os.scandir(directory) as listing:
+                    items = list(listing)
+            except OSError:
+                continue
+            subdirectories = []
+            for item in items:
+                if item.is_dir():
+                    if not item.is_symlink():
+                        subdirectories.append(item.path)
+                    continue
+                stem, ext = os.path.splitext(item.name)
+                if ext.lower() in self.extensions:
+                    entries.setdefault(stem.lower(), (item.path, item.name))
+            pending.extend(reversed(subdirectories))
+        return entries, stamps
+
+    def build(self):
+        start = time.perf_counter()
+        watched = self.watched_paths()
+        entries = self.load_cache(watched) if self.cache_path else None
+        source = "cache"
+        if entries is None:
+            source = "scan"
+            stamps = {path: self.mtime(path) for path in watched}
+            entries, scanned = self.scan_roots()
+            stamps.update(scanned)
+            for name, (path, exe_name) in self.mappings.items():
+                resolved = self.resolve_mapping(path)
+                if resolved:
+                    entries[name] = (resolved, exe_name)
+            if self.cache_path:
+                self.save_cache(watched, stamps, entries)
+        self.entries = entries
+        self.names = list(entries)
+        self.ready.set()
+        print(f"App index: {len(entries)} apps from {source} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return entries
+
+    def start(self):
+        threading.Thread(target=self.build, daemon=True).start()
+
+    def lookup(self, app_name):
+        app_name = app_name.lower().strip()
+        if not self.ready.is_set():
+            # Still building: resolve a configured name directly rather than wait on the scan
+            if app_name not in self.mappings:
+                return None
+            path, exe_name = self.mappings[app_name]
+            resolved = self.resolve_mapping(path)
+            return (resolved, exe_name) if resolved else None
+        if app_name in self.entries:
+            return self.entries[app_name]
+        close = difflib.get_close_matches(app_name, self.names, 1, self.fuzzy_cutoff)
+        return self.entries[close[0]] if close else None
+
+    def launch(self, app_name):
+        app_name = app_name.lower().strip()
+        entry = self.lookup(app_name)
+        if entry:
+            command, exe_name = entry
+            try:
+                process = self.launcher(command)
+                print(f"Opened {app_name} at {command}")
+                return exe_name, process.pid
+            except Exception as e:
+                print(f"Failed to open {app_name} from path: {e}")
+
+        try:
+            process = self.launcher(app_name + ".exe")
+            print(f"Opened {app_name} (fallback)")
+            return app_name + ".exe", process.pid
+        except Exception as e:
+            print(f"Failed to open {app_name} as executable: {e}")
+            return None
+
+class PycawVolumeDevice:
+    def __init__(self):
+        self.endpoint = None
+
+    def activate(self):
+        # Only ever called from the level controller's thread, so the endpoint is opened off the startup path
+        if self.endpoint is None:
+            comtypes.CoInitialize()
+            devices = pycaw.AudioUtilities.GetSpeakers()
+            interface = devices.Activate(pycaw.IAudioEndpointVolume._iid_, comtypes.CLSCTX_ALL, None)
+            self.endpoint = cast(interface, POINTER(pycaw.IAudioEndpointVolume))
+        return self.endpoint
+
+    def read(self):
+        return self.activate().GetMasterVolumeLevelScalar() * 100
+
+    def write(self, level):
+        self.activate().SetMasterVolumeLevelScalar(level / 100, None)
+
+class SbcBrightnessDevice:
+    def read(self):
+        return sbc.get_brightness()[0]
+
+    def write(self, level):
+        sbc.set_brightness(level)
+
+class CachedLevelController:
+    def __init__(self, device, name, min_interval=0.1, resync_interval=30, retry_interval=1, max_failures=5):
+        self.device = device
+        self.name = name
+        self.min_interval = min_interval
+        self.resync_interval = resync_interval
+        self.retry_interval = retry_interval
+        self.retry_delay = retry_interval
+        self.max_failures = max_failures
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.level = None
+        self.pending_delta = 0
+        self.dirty = False
+        self.last_write = 0
+        self.next_sync = 0
+        self.requests = 0
+        self.writes = 0
+        self.reads = 0
+        self.running = True
+        self.thread = None
+
+    def start(self):
+        # Caller holds the condition. The device is first opened by the first change, not at startup
+        if self.thread is None and self.running:
+            self.failures = 0
+            self.retry_delay = self.retry_interval
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def set(self, level):
+        with self.condition:
+            self.start()
+            self.level = max(0, min(100, level))
+            self.pending_delta = 0
+            self.mark_dirty()
+            return self.level
+
+    def adjust(self, delta):
+        with self.condition:
+            self.start()
+            if self.level is None:
+                # Not read from the device yet: fold the change in once the first read lands
+                self.pending_delta += delta
+            else:
+                self.level = max(0, min(100, self.level + delta))
+            self.mark_dirty()
+            return self.level
+
+    def mark_dirty(self):
+        self.requests += 1
+        self.dirty = True
+        self.condition.notify()
+
+    def read_device(self):
+        try:
+            level = self.device.read()
+        except Exception as e:
+            print(f"Failed to read {self.name.lower()}: {e}")
+            return None
+        self.reads += 1
+        return level
+
+    def sync(self):
+        level = self.read_device()
+        with self.condition:
+            if level is None and self.level is None:
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    # No such device here (no audio endpoint, no DDC/CI monitor): drop the waiting changes
+                    # and stop until the next command tries again
+                    print(f"{self.name} unavailable after {self.failures} failed reads")
+                    self.pending_delta = 0
+                    self.dirty = False
+                    self.thread = None
+                    return False
+                # Changes are waiting on the first read, so retry soon, backing off while the device stays away
+                self.next_sync = time.perf_counter() + self.retry_delay
+                self.retry_delay = min(self.retry_delay * 2, self.resync_interval)
+                return True
+            self.next_sync = time.perf_counter() + self.resync_interval
+            self.retry_delay = self.retry_interval
+            if level is None:
+                return True
+            if self.level is None:
+                self.level = max(0, min(100, level + self.pending_delta))
+                self.pending_delta = 0
+            elif not self.dirty:
+                # Pick up changes made outside the app (keyboard keys, the OS slider)
+                self.level = level
+        return True
+
+    def run(self):
+        if not self.sync():
+            return
+        while True:
+            with self.condition:
+                while self.running and not (self.dirty and self.level is not None):
+                    remaining = self.next_sync - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.dirty and self.level is not None:
+                    # Hold the write until the rate limit allows it; changes arriving meanwhile merge into it
+                    wait = self.last_write + self.min_interval - time.perf_counter()
+                    if wait > 0 and self.running:
+                        self.condition.wait(wait)
+                        continue
+                    level = self.level
+                    self.dirty = False
+                elif not self.running:
+                    return
+                else:
+                    level = None
+            if level is None:
+                if not self.sync():
+                    return
+                continue
+            try:
+                self.device.write(level)
+                self.writes += 1
+            except Exception as e:
+                print(f"Failed to set {self.name.lower()}: {e}")
+            self.last_write = time.perf_counter()
+
+    def report(self):
+        print(f"{self.name}: {self.requests} changes applied in {self.writes} writes, {self.reads} reads")
+
+    def close(self, timeout=1):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+class ScreenshotService:
+    extensions = {"png": ".png", "jpg": ".jpg", "webp": ".webp"}
+
+    def __init__(self, directory=".", image_format="png", quality=None, workers=2, burst=0,
+                 max_pending=8, grab=None):
+        self.directory = directory
+        self.image_format = image_format
+        self.extension = self.extensions[image_format]
+        self.params = self.encode_params(image_format, quality)
+        self.grab = grab or self.grab_screen
+        self.ring = deque(maxlen=burst) if burst else None
+        self.pending = queue.Queue()
+        self.max_pending = max_pending
+        self.sequence = 0
+        self.saved = 0
+        self.dropped = 0
+        self.latency = StageStats(window=200)
+        self.worker_count = workers
+        self.workers = []
+
+    def start(self):
+        # Encoder threads start with the first capture rather than with the app
+        if not self.workers:
+            self.workers = [threading.Thread(target=self.run, daemon=True) for _ in range(self.worker_count)]
+            for worker in self.workers:
+                worker.start()
+
+    @staticmethod
+    def encode_params(image_format, quality):
+        if image_format == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, 3 if quality is None else quality]
+        if image_format == "jpg":
+            return [cv2.IMWRITE_JPEG_QUALITY, 92 if quality is None else quality]
+        return [cv2.IMWRITE_WEBP_QUALITY, 90 if quality is None else quality]
+
+    @staticmethod
+    def grab_screen():
+        return cv2.cvtColor(np.asarray(pyautogui.screenshot()), cv2.COLOR_RGB2BGR)
+
+    def path_for(self, captured):
+        self.sequence += 1
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(captured))
+        return os.path.join(self.directory, f"screenshot_{stamp}_{self.sequence:04d}{self.extension}")
+
+    def take(self):
+        # Only the grab happens on the caller, so the pixels are from the moment the command fired
+        captured = time.time()
+        image = self.grab()
+        if self.ring is not None:
+            self.ring.append((captured, image))
+            print(f"Screenshot held in burst buffer ({len(self.ring)}/{self.ring.maxlen})")
+            return None
+        return self.submit(captured, image)
+
+    def submit(self, captured, image, limit=True):
+        if limit and self.pending.qsize() >= self.max_pending:
+            self.dropped += 1
+            print("Screenshot dropped: encoder backlog full")
+            return None
+        path = self.path_for(captured)
+        self.start()
+        self.pending.put((path, image, time.perf_counter()))
+        return path
+
+    def save_burst(self):
+        if self.ring is None:
+            return []
+        captures = list(self.ring)
+        self.ring.clear()
+        return [self.submit(captured, image, limit=False) for captured, image in captures]
+
+    def run(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            path, image, queued = job
+            temp_path = path + ".tmp"
+            try:
+                ok, data = cv2.imencode(self.extension, image, self.params)
+                if not ok:
+                    raise ValueError(f"could not encode {self.image_format}")
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                # Readers never see a half-written file
+                os.replace(temp_path, path)
+                self.saved += 1
+                print(f"Screenshot saved to {path}")
+            except Exception as e:
+                print(f"Failed to save screenshot {path}: {e}")
+            self.latency.record(self.image_format, time.perf_counter() - queued)
+
+    def report(self):
+        print(f"Screenshots: {self.saved} saved, {self.dropped} dropped")
+        self.latency.report()
+
+    def close(self, timeout=5):
+        for _ in self.workers:
+            self.pending.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+
+class SystemController:
+    app_mappings = {
+        "whatsapp": (r"C:\Program Files\WindowsApps\5319275A.WhatsAppDesktop_2*\WhatsApp.exe", "WhatsApp.exe"),
+        "notepad": (r"C:\Windows\notepad.exe", "notepad.exe"),
+        "calculator": (r"C:\Windows\System32\calc.exe", "calc.exe"),
+        "file explorer": (r"C:\Windows\explorer.exe", "explorer.exe"),
+        "chrome": (r"C:\Program Files\Google\Chrome\Application\chrome.exe", "chrome.exe"),
+        "firefox": (r"C:\Program Files\Mozilla Firefox\firefox.exe", "firefox.exe"),
+        "edge": (r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe", "msedge.exe"),
+        "microsoft edge": (r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe", "msedge.exe"),
+        "photos": (r"C:\Program Files\WindowsApps\Microsoft.Windows.Photos_*\Microsoft.Photos.exe", "Microsoft.Photos.exe"),
+        "youtube": (r"C:\Program Files\Google\Chrome\Application\chrome.exe --app=https://www.youtube.com", "chrome.exe"),
+        "copilot": (r"C:\Windows\System32\cmd.exe", "cmd.exe"),
+        "paint": (r"C:\Windows\System32\mspaint.exe", "mspaint.exe")
+    }
+
+    def __init__(self, app_index=None, app_config=None, volume_device=None, brightness_device=None,
+                 screenshot_service=None):
+        self.volume = CachedLevelController(volume_device or PycawVolumeDevice(), "Volume")
+        self.brightness = CachedLevelController(brightness_device or SbcBrightnessDevice(), "Brightness")
         self.recent_app = None
+        self.screenshots = screenshot_service or ScreenshotService()
+        self.apps = app_index or AppIndex(self.app_mappings, config_path=app_config, cache_path=APP_INDEX_CACHE)
+        self.apps_started = False
+
+    def start(self):
+        # Indexes apps in the background so the first 'open' finds them; volume, brightness and
+        # screenshots start their threads on first use
+        if not self.apps_started:
+            self.apps_started = True
+            self.apps.start()
         
     def set_volume(self, level):
-        self.volume.SetMasterVolumeLevelScalar(level / 100, None)
+        return self.volume.set(level)
         
     def increase_volume(self, amount=10):
-        current = self.volume.GetMasterVolumeLevelScalar() * 100
-        self.set_volume(min(100, current + amount))
-        print(f"Volume increased to {min(100, current + amount)}%")
+        print(f"Volume increased to {self.describe(self.volume.adjust(amount))}")
         
     def decrease_volume(self, amount=10):
-        current = self.volume.GetMasterVolumeLevelScalar() * 100
-        self.set_volume(max(0, current - amount))
-        print(f"Volume decreased to {max(0, current - amount)}%")
+        print(f"Volume decreased to {self.describe(self.volume.adjust(-amount))}")
         
     def max_volume(self):
         self.set_volume(100)
@@ -58,66 +1124,33 @@ class SystemController:
         print("Volume muted")
         
     def set_brightness(self, level):
-        sbc.set_brightness(level)
+        return self.brightness.set(level)
         
     def increase_brightness(self, amount=10):
-        current = sbc.get_brightness()[0]
-        self.set_brightness(min(100, current + amount))
-        print(f"Brightness increased to {min(100, current + amount)}%")
+        print(f"Brightness increased to {self.describe(self.brightness.adjust(amount))}")
         
     def decrease_brightness(self, amount=10):
-        current = sbc.get_brightness()[0]
-        self.set_brightness(max(0, current - amount))
-        print(f"Brightness decreased to {max(0, current - amount)}%")
+        print(f"Brightness decreased to {self.describe(self.brightness.adjust(-amount))}")
+
+    @staticmethod
+    def describe(level):
+        return "(pending first read)" if level is None else f"{level:.0f}%"
         
     def take_screenshot(self):
-        screenshot = pyautogui.screenshot()
-        screenshot.save(f"screenshot_{int(time.time())}.png")
-        print("Screenshot taken")
+        return self.screenshots.take()
+
+    def save_screenshots(self):
+        if self.screenshots.ring is None:
+            print("Burst mode is off: screenshots are already saved as they are taken")
+            return []
+        return self.screenshots.save_burst()
         
     def open_app(self, app_name):
-        app_mappings = {
-            "whatsapp": (r"C:\Program Files\WindowsApps\5319275A.WhatsAppDesktop_2*\WhatsApp.exe", "WhatsApp.exe"),
-            "notepad": (r"C:\Windows\notepad.exe", "notepad.exe"),
-            "calculator": (r"C:\Windows\System32\calc.exe", "calc.exe"),
-            "file explorer": (r"C:\Windows\explorer.exe", "explorer.exe"),
-            "chrome": (r"C:\Program Files\Google\Chrome\Application\chrome.exe", "chrome.exe"),
-            "firefox": (r"C:\Program Files\Mozilla Firefox\firefox.exe", "firefox.exe"),
-            "edge": (r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe", "msedge.exe"),
-            "microsoft edge": (r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe", "msedge.exe"),
-            "photos": (r"C:\Program Files\WindowsApps\Microsoft.Windows.Photos_*\Microsoft.Photos.exe", "Microsoft.Photos.exe"),
-            "youtube": (r"C:\Program Files\Google\Chrome\Application\chrome.exe --app=https://www.youtube.com", "chrome.exe"),
-            "copilot": (r"C:\Windows\System32\cmd.exe", "cmd.exe"),
-            "paint": (r"C:\Windows\System32\mspaint.exe", "mspaint.exe")
-        }
-        
-        app_name = app_name.lower().strip()
-        if app_name in app_mappings:
-            path, exe_name = app_mappings[app_name]
-            try:
-                if '*' in path:
-                    possible_files = glob.glob(path)
-                    if possible_files:
-                        process = subprocess.Popen(possible_files[0])
-                        self.recent_app = (exe_name, process.pid)
-                        print(f"Opened {app_name} at {possible_files[0]}")
-                        return True
-                else:
-                    process = subprocess.Popen(path)
-                    self.recent_app = (exe_name, process.pid)
-                    print(f"Opened {app_name} at {path}")
-                    return True
-            except Exception as e:
-                print(f"Failed to open {app_name} from path: {e}")
-        
-        try:
-            process = subprocess.Popen(app_name + ".exe")
-            self.recent_app = (app_name + ".exe", process.pid)
-            print(f"Opened {app_name} (fallback)")
-            return True
-        except Exception as e:
-            print(f"Failed to open {app_name} as executable: {e}")
-            return False
+        self.start()
+        launched = self.apps.launch(app_name)
+        if launched:
+            self.recent_app = launched
+        return launched is not None
             
     def close_recent_app(self):
         if self.recent_app:
@@ -140,151 +1173,579 @@ class SystemController:
             print("No recent app to close")
             return False
 
+    def close(self):
+        for controller in (self.volume, self.brightness):
+            controller.close()
+            controller.report()
+        self.screenshots.close()
+        self.screenshots.report()
+
+class RecordingSystemController:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.recent_app = None
+
+    def start(self):
+        pass
+
+    def set_volume(self, level):
+        self.recorder.record("set_volume", level)
+
+    def increase_volume(self, amount=10):
+        self.recorder.record("increase_volume", amount)
+
+    def decrease_volume(self, amount=10):
+        self.recorder.record("decrease_volume", amount)
+
+    def max_volume(self):
+        self.recorder.record("max_volume")
+
+    def min_volume(self):
+        self.recorder.record("min_volume")
+
+    def mute(self):
+        self.recorder.record("mute")
+
+    def set_brightness(self, level):
+        self.recorder.record("set_brightness", level)
+
+    def increase_brightness(self, amount=10):
+        self.recorder.record("increase_brightness", amount)
+
+    def decrease_brightness(self, amount=10):
+        self.recorder.record("decrease_brightness", amount)
+
+    def take_screenshot(self):
+        self.recorder.record("take_screenshot")
+
+    def save_screenshots(self):
+        self.recorder.record("save_screenshots")
+        return []
+
+    def open_app(self, app_name):
+        self.recorder.record("open_app", app_name)
+        self.recent_app = (app_name, None)
+        return True
+
+    def close_recent_app(self):
+        self.recorder.record("close_recent_app")
+        closed = self.recent_app is not None
+        self.recent_app = None
+        return closed
+
+    def close(self):
+        pass
+
+class MouseState(Enum):
+    IDLE = auto()
+    LEFT_PRESSED = auto()
+    RIGHT_PRESSED = auto()
+    DRAGGING = auto()
+    COOLDOWN = auto()
+
+class MouseGestureStateMachine:
+    def __init__(self, double_click_threshold=0.3, right_click_cooldown=0.2,
+                 drag_release_cooldown=0.1, scroll_cooldown=0.1):
+        self.double_click_threshold = double_click_threshold
+        self.right_click_cooldown = right_click_cooldown
+        self.drag_release_cooldown = drag_release_cooldown
+        self.scroll_cooldown = scroll_cooldown
+        self.state = MouseState.IDLE
+        self.cooldown_until = 0
+        self.last_click_time = -math.inf
+        self.last_scroll_time = -math.inf
+
+    def enter_cooldown(self, until):
+        self.cooldown_until = until
+        self.state = MouseState.COOLDOWN
+
+    def release(self, now):
+        events = []
+        if self.state == MouseState.DRAGGING:
+            events.append(("mouse_up",))
+            self.enter_cooldown(now + self.drag_release_cooldown)
+        elif self.state in (MouseState.LEFT_PRESSED, MouseState.RIGHT_PRESSED):
+            self.state = MouseState.IDLE
+        return events
+
+    def update(self, now, left_click, right_click, dragging, scrolling, scroll_amount):
+        events = []
+        if self.state == MouseState.DRAGGING and not dragging:
+            events += self.release(now)
+        elif self.state in (MouseState.LEFT_PRESSED, MouseState.RIGHT_PRESSED):
+            if dragging:
+                events.append(("mouse_down",))
+                self.state = MouseState.DRAGGING
+            elif not left_click and not right_click:
+                if self.state == MouseState.RIGHT_PRESSED and now < self.cooldown_until:
+                    self.state = MouseState.COOLDOWN
+                else:
+                    self.state = MouseState.IDLE
+        if self.state == MouseState.COOLDOWN and now >= self.cooldown_until:
+            self.state = MouseState.IDLE
+
+        if self.state == MouseState.IDLE:
+            if dragging:
+                events.append(("mouse_down",))
+                self.state = MouseState.DRAGGING
+            elif left_click:
+                double = now - self.last_click_time < self.double_click_threshold
+                events.append(("double_click",) if double else ("click",))
+                self.last_click_time = now
+                self.state = MouseState.LEFT_PRESSED
+            elif right_click:
+                events.append(("right_click",))
+                self.cooldown_until = now + self.right_click_cooldown
+                self.state = MouseState.RIGHT_PRESSED
+
+        if scrolling and now - self.last_scroll_time > self.scroll_cooldown:
+            events.append(("scroll", scroll_amount))
+            self.last_scroll_time = now
+        return events
+
+class PointerFilter:
+    # Smooths a 2D pointer in the caller's pixel space; lead extrapolates along the velocity estimate
+    # by that many seconds to hide capture-to-cursor latency
+    def __init__(self, lead=0.0):
+        self.lead = lead
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.velocity = np.zeros(2)
+        self.last_time = None
+
+    def __call__(self, point, now):
+        point = np.asarray(point, dtype=np.float64)
+        if self.value is None:
+            self.start(point)
+        else:
+            dt = now - self.last_time
+            # Repeated timestamps (replay without timing) count as one 30 fps frame
+            self.step(point, dt if dt > 0 else 1 / 30)
+        self.last_time = now
+        return self.value + self.lead * self.velocity
+
+    def start(self, point):
+        self.value = point
+
+class ExponentialFilter(PointerFilter):
+    # The original fixed step: 1/smoothening of the remaining distance per frame
+    def __init__(self, smoothening=10, lead=0.0):
+        self.smoothening = smoothening
+        super().__init__(lead)
+
+    def step(self, point, dt):
+        previous = self.value
+        self.value = previous + (point - previous) / self.smoothening
+        self.velocity = (self.value - previous) / dt
+
+class OneEuroFilter(PointerFilter):
+    # Low-pass whose cutoff rises with speed: heavy smoothing at rest, little lag in fast moves
+    def __init__(self, min_cutoff=0.3, beta=0.004, d_cutoff=1.0, lead=0.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        super().__init__(lead)
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        return 1 / (1 + 1 / (2 * math.pi * cutoff * dt))
+
+    def step(self, point, dt):
+        raw_velocity = (point - self.value) / dt
+        self.velocity = self.velocity + self.alpha(self.d_cutoff, dt) * (raw_velocity - self.velocity)
+        cutoff = self.min_cutoff + self.beta * math.hypot(*self.velocity)
+        self.value = self.value + self.alpha(cutoff, dt) * (point - self.value)
+
+class KalmanFilter(PointerFilter):
+    # Constant-velocity model; both axes share dynamics and noise, so they share one 2x2 covariance
+    def __init__(self, process_noise=1e6, measurement_noise=25.0, lead=0.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        super().__init__(lead)
+
+    def start(self, point):
+        self.value = point
+        self.covariance = np.array([[self.measurement_noise, 0.0], [0.0, 1e6]])
+
+    def step(self, point, dt):
+        transition = np.array([[1.0, dt], [0.0, 1.0]])
+        noise = self.process_noise * np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]])
+        predicted = self.value + self.velocity * dt
+        covariance = transition @ self.covariance @ transition.T + noise
+        gain = covariance[:, 0] / (covariance[0, 0] + self.measurement_noise)
+        innovation = point - predicted
+        self.value = predicted + gain[0] * innovation
+        self.velocity = self.velocity + gain[1] * innovation
+        self.covariance = covariance - np.outer(gain, covariance[0])
+
+POINTER_FILTERS = {"exponential": ExponentialFilter, "one-euro": OneEuroFilter, "kalman": KalmanFilter}
+
+def make_pointer_filter(name, **params):
+    return POINTER_FILTERS[name](**params)
+
+GESTURES = ("open", "left_click", "right_click", "drag", "scroll")
+GESTURE_PROMPTS = {
+    "open": "open hand, fingers up",
+    "left_click": "pinch thumb and index finger",
+    "right_click": "pinch thumb and middle finger",
+    "drag": "all fingertips on the thumb",
+    "scroll": "pinky up, ring finger folded",
+}
+
+@functools.lru_cache(maxsize=8)
+def hand_pair_matrix(aspect):
+    # Flat landmark coordinates to both sides of every pair, with the aspect correction folded in
+    return np.kron(HAND_PAIRS, np.diag([aspect, 1.0, aspect])).T
+
+def hand_features(landmarks, aspect=1.0):
+    # Distances over palm length plus joint bend angles: invariant to position, scale, rotation
+    # and mirroring, so one profile serves both hands at any distance from the camera.
+    # All hands go through one product and one dot per pair; numpy's per-call cost dominates at this size
+    sides = (np.asarray(landmarks, dtype=np.float64).reshape(-1, 63) @ hand_pair_matrix(aspect)).reshape(-1, 2, 55, 3)
+    dots = np.einsum('nkd,nkd->nk', sides[:, 0], sides[:, 1])
+    lengths = np.sqrt(dots[:, :40])
+    bones = np.maximum(lengths[:, 10:], 1e-9)
+    bend = np.arccos(np.minimum(np.maximum(dots[:, 40:] / (bones[:, :15] * bones[:, 15:]), -1.0), 1.0))
+    return np.concatenate([lengths[:, 1:10] / np.maximum(lengths[:, :1], 1e-6), bend], axis=1)
+
+class GestureClassifier:
+    # One diagonal Gaussian per gesture over the hand features; every hand and class is scored in one pass
+    def __init__(self, classes, means, stds, min_confidence=0.6):
+        self.classes = list(classes)
+        self.means = means
+        self.inv_stds = 1 / stds
+        # The Gaussian exponent expanded into two products with the features and a constant per class
+        precision = self.inv_stds ** 2
+        self.linear = (means * precision).T
+        self.quadratic = -0.5 * precision.T
+        self.offset = np.log(stds).sum(axis=1) + 0.5 * (means * means * precision).sum(axis=1)
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def fit(cls, landmarks, labels, aspect=1.0, min_std=0.05, **kwargs):
+        features = hand_features(landmarks, aspect)
+        labels = np.asarray(labels)
+        classes = [gesture for gesture in GESTURES if gesture in labels]
+        classes += sorted(set(labels.tolist()) - set(classes))
+        means = np.stack([features[labels == gesture].mean(axis=0) for gesture in classes])
+        stds = np.stack([features[labels == gesture].std(axis=0) for gesture in classes])
+        return cls(classes, means, np.maximum(stds, min_std), **kwargs)
+
+    def relative_likelihoods(self, features):
+        log_likelihood = features @ self.linear + (features * features) @ self.quadratic - self.offset
+        return np.exp(log_likelihood - log_likelihood.max(axis=1, keepdims=True))
+
+    def probabilities(self, features):
+        likelihood = self.relative_likelihoods(features)
+        return likelihood / likelihood.sum(axis=1, keepdims=True)
+
+    def predict(self, landmarks, aspect=1.0):
+        if not len(landmarks):
+            return []
+        likelihood = self.relative_likelihoods(hand_features(landmarks, aspect))
+        # The best class scores 1, so its probability is the reciprocal of the row sum.
+        # Unsure frames fall back to plain pointing rather than firing a click
+        return [self.classes[index] if total * self.min_confidence <= 1 else "open"
+                for index, total in zip(likelihood.argmax(axis=1).tolist(), likelihood.sum(axis=1).tolist())]
+
+    def save(self, path, landmarks=None, labels=None, aspect=1.0):
+        # The calibration samples ride along so a profile can be re-fit or evaluated later
+        extra = {} if landmarks is None else {"landmarks": landmarks, "labels": np.asarray(labels), "aspect": aspect}
+        np.savez(path, classes=np.array(self.classes), means=self.means, stds=1 / self.inv_stds,
+                 min_confidence=self.min_confidence, **extra)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls([str(gesture) for gesture in data['classes']], data['means'], data['stds'],
+                   float(data['min_confidence']))
+
 class VirtualMouse:
-    def __init__(self, mp_hands, hands, mp_draw, window_width, window_height):
+    def __init__(self, mp_hands, hands, mp_draw, window_width, window_height, input_backend=None):
         self.mp_hands = mp_hands
         self.hands = hands
         self.mp_draw = mp_draw
-        self.screen_width, self.screen_height = pyautogui.size()
+        self.input = input_backend or InputBackend()
+        self.screen_width, self.screen_height = self.input.screen_size()
         self.frame_reduction = 50
-        self.smoothening = 10
-        self.prev_x, self.prev_y = 0, 0
+        self.filter = OneEuroFilter()
         self.window_width = window_width
         self.window_height = window_height
-        self.last_click_time = 0
         self.double_click_threshold = 0.3
         self.click_distance_threshold = 0.04
         self.drag_distance_threshold = 0.06
-        self.is_dragging = False
-        self.is_scrolling = False
-        self.last_scroll_time = 0
         self.scroll_cooldown = 0.1
-        pyautogui.FAILSAFE = False
-        pyautogui.PAUSE = 0.01
+        self.gestures = MouseGestureStateMachine(self.double_click_threshold, scroll_cooldown=self.scroll_cooldown)
+        self.pixel_shape = None
+        self.pixel_scale = None
+        # Reused every frame: the points are only read before the next hand is processed
+        self.points = np.empty((21, 2), dtype=np.int64)
+        self.offsets = np.empty((len(GESTURE_OFFSETS), 2), dtype=np.int64)
 
-    def calculate_distance(self, p1, p2):
-        return math.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2)
-    
-    def get_finger_positions(self, hand_landmarks, img_shape):
-        h, w, _ = img_shape
-        landmarks = {
-            'wrist': (int(hand_landmarks.landmark[0].x * w), int(hand_landmarks.landmark[0].y * h)),
-            'thumb_tip': (int(hand_landmarks.landmark[4].x * w), int(hand_landmarks.landmark[4].y * h)),
-            'thumb_mcp': (int(hand_landmarks.landmark[2].x * w), int(hand_landmarks.landmark[2].y * h)),
-            'index_tip': (int(hand_landmarks.landmark[8].x * w), int(hand_landmarks.landmark[8].y * h)),
-            'middle_tip': (int(hand_landmarks.landmark[12].x * w), int(hand_landmarks.landmark[12].y * h)),
-            'ring_tip': (int(hand_landmarks.landmark[16].x * w), int(hand_landmarks.landmark[16].y * h)),
-            'pinky_tip': (int(hand_landmarks.landmark[20].x * w), int(hand_landmarks.landmark[20].y * h)),
-            'index_mcp': (int(hand_landmarks.landmark[5].x * w), int(hand_landmarks.landmark[5].y * h)),
-            'middle_mcp': (int(hand_landmarks.landmark[9].x * w), int(hand_landmarks.landmark[9].y * h)),
-            'ring_mcp': (int(hand_landmarks.landmark[13].x * w), int(hand_landmarks.landmark[13].y * h)),
-            'pinky_mcp': (int(hand_landmarks.landmark[17].x * w), int(hand_landmarks.landmark[17].y * h))
-        }
-        is_finger_up = {
-            'thumb': landmarks['thumb_tip'][1] < landmarks['thumb_mcp'][1],
-            'index': landmarks['index_tip'][1] < landmarks['index_mcp'][1],
-            'middle': landmarks['middle_tip'][1] < landmarks['middle_mcp'][1],
-            'ring': landmarks['ring_tip'][1] < landmarks['ring_mcp'][1],
-            'pinky': landmarks['pinky_tip'][1] < landmarks['pinky_mcp'][1]
-        }
-        return landmarks, is_finger_up
+    def get_finger_positions(self, landmarks, img_shape):
+        if img_shape[:2] != self.pixel_shape:
+            self.pixel_shape = img_shape[:2]
+            self.pixel_scale = np.array(img_shape[1::-1])
+        # Scaling straight into the integer buffer truncates like astype(np.int64) without the temporary
+        np.multiply(landmarks[:, :2], self.pixel_scale, out=self.points, casting='unsafe')
+        # Every offset detect_gestures needs comes out of one product; nine pairs are cheaper to compare as
+        # Python numbers than through further numpy calls
+        np.matmul(GESTURE_OFFSETS, self.points, out=self.offsets)
+        return self.points, self.offsets.tolist()
     
-    def detect_gestures(self, hand_landmarks, img_shape):
-        landmarks, is_finger_up = self.get_finger_positions(hand_landmarks, img_shape)
-        thumb_index_distance = self.calculate_distance(landmarks['thumb_tip'], landmarks['index_tip'])
-        thumb_middle_distance = self.calculate_distance(landmarks['thumb_tip'], landmarks['middle_tip'])
-        left_click = thumb_index_distance < self.click_distance_threshold * img_shape[1]
-        right_click = thumb_middle_distance < self.click_distance_threshold * img_shape[1]
-        scrolling = is_finger_up['pinky'] and not is_finger_up['ring']
-        all_fingers_touching = all(
-            self.calculate_distance(landmarks['thumb_tip'], landmarks[f'{finger}_tip']) < self.drag_distance_threshold * img_shape[1]
-            for finger in ['index', 'middle', 'ring', 'pinky']
-        )
-        dragging = all_fingers_touching
+    def detect_gestures(self, tip_offsets, img_shape):
+        tip_distances = [math.sqrt(dx * dx + dy * dy) for dx, dy in tip_offsets[:4]]
+        click_distance = self.click_distance_threshold * img_shape[1]
+        left_click = tip_distances[0] < click_distance
+        right_click = tip_distances[1] < click_distance
+        # A fingertip above its knuckle is up
+        scrolling = tip_offsets[8][1] < 0 and not tip_offsets[7][1] < 0
+        drag_distance = self.drag_distance_threshold * img_shape[1]
+        dragging = all(distance < drag_distance for distance in tip_distances)
         return left_click, right_click, scrolling, dragging
     
-    def move_mouse(self, finger_pos):
+    def move_mouse(self, finger_pos, now):
         frame_x = np.interp(finger_pos[0], 
                           (self.frame_reduction, self.window_width - self.frame_reduction), 
                           (0, self.screen_width))
         frame_y = np.interp(finger_pos[1], 
                           (self.frame_reduction, self.window_height - self.frame_reduction), 
                           (0, self.screen_height))
-        current_x = self.prev_x + (frame_x - self.prev_x) / self.smoothening
-        current_y = self.prev_y + (frame_y - self.prev_y) / self.smoothening
-        pyautogui.moveTo(current_x, current_y)
-        self.prev_x, self.prev_y = current_x, current_y
+        current_x, current_y = self.filter((frame_x, frame_y), now)
+        current_x = min(max(current_x, 0), self.screen_width - 1)
+        current_y = min(max(current_y, 0), self.screen_height - 1)
+        self.input.move_to(current_x, current_y)
     
-    def handle_hand_gestures(self, results, hand_index, img):
-        if not results or not results.multi_hand_landmarks or not img.size:
-            if self.is_dragging:
-                pyautogui.mouseUp()
-                self.is_dragging = False
+    @property
+    def is_dragging(self):
+        return self.gestures.state == MouseState.DRAGGING
+
+    def dispatch(self, events):
+        for action, *args in events:
+            getattr(self.input, action)(*args)
+
+    def handle_hand_gestures(self, hands, hand_index, img, now, img_shape=None):
+        # img is None on frames the preview skips: gestures are dispatched, nothing is drawn
+        img_shape = img.shape if img is not None else img_shape
+        if not hands or not img_shape[0] or not img_shape[1]:
+            self.filter.reset()
+            self.dispatch(self.gestures.release(now))
             return
 
         if hand_index is None:
-            cv2.putText(img, "No Right Hand", (70, 30), 
-                       cv2.FONT_HERSHEY_PLAIN, 1, (0,0,255), 1)
-            if self.is_dragging:
-                pyautogui.mouseUp()
-                self.is_dragging = False
+            if img is not None:
+                cv2.putText(img, "No Right Hand", (70, 30), 
+                           cv2.FONT_HERSHEY_PLAIN, 1, (0,0,255), 1)
+            self.filter.reset()
+            self.dispatch(self.gestures.release(now))
             return
         
-        hand_landmarks = results.multi_hand_landmarks[hand_index]
-        landmarks, _ = self.get_finger_positions(hand_landmarks, img.shape)
-        left_click, right_click, scrolling, dragging = self.detect_gestures(hand_landmarks, img.shape)
+        points, tip_offsets = self.get_finger_positions(hands.landmarks[hand_index], img_shape)
+        if hands.gestures is not None:
+            gesture = hands.gestures[hand_index]
+            left_click, right_click = gesture == "left_click", gesture == "right_click"
+            scrolling, dragging = gesture == "scroll", gesture == "drag"
+        else:
+            left_click, right_click, scrolling, dragging = self.detect_gestures(tip_offsets, img_shape)
         
-        self.move_mouse(landmarks['index_tip'])
+        self.move_mouse(points[INDEX_TIP], now)
         
-        if left_click:
-            current_time = time.time()
-            if current_time - self.last_click_time < self.double_click_threshold:
-                pyautogui.doubleClick()
+        scroll_amount = -15 if points[PINKY_TIP][1] < points[WRIST][1] else 15
+        events = self.gestures.update(now, left_click, right_click, dragging, scrolling, scroll_amount)
+        self.dispatch(events)
+        if img is None:
+            return
+        
+        for action, *_ in events:
+            if action == "double_click":
                 cv2.circle(img, (self.window_width//4, self.window_height//2), 
                           15, (0,255,255), -1)
-            else:
-                pyautogui.click()
+            elif action == "click":
                 cv2.circle(img, (self.window_width//4, self.window_height//2), 
                           10, (0,255,0), -1)
-            self.last_click_time = current_time
-        
-        if right_click:
-            pyautogui.rightClick()
-            cv2.circle(img, (3*self.window_width//4, self.window_height//2), 
-                      10, (255,0,0), -1)
-            time.sleep(0.2)
-        
-        if dragging:
-            if not self.is_dragging:
-                pyautogui.mouseDown()
-                self.is_dragging = True
+            elif action == "right_click":
+                cv2.circle(img, (3*self.window_width//4, self.window_height//2), 
+                          10, (255,0,0), -1)
+            elif action == "mouse_down":
                 cv2.putText(img, "DRAG MODE", (self.window_width//2 - 50, 50), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
-        elif self.is_dragging:
-            pyautogui.mouseUp()
-            self.is_dragging = False
-            time.sleep(0.1)
-        
-        current_time = time.time()
-        if scrolling and current_time - self.last_scroll_time > self.scroll_cooldown:
-            scroll_amount = -15 if landmarks['pinky_tip'][1] < landmarks['wrist'][1] else 15
-            pyautogui.scroll(scroll_amount)
-            self.last_scroll_time = current_time
-            cv2.putText(img, "SCROLLING", (self.window_width//2 - 50, 30), 
-                       cv2.FONT_HERSHEY_PLAIN, 1, (255,255,0), 1)
+            elif action == "scroll":
+                cv2.putText(img, "SCROLLING", (self.window_width//2 - 50, 30), 
+                           cv2.FONT_HERSHEY_PLAIN, 1, (255,255,0), 1)
         
         status_text = "Mouse: " + ("Left Click" if left_click else "Right Click" if right_click else 
                                   "Scrolling" if scrolling else "Dragging" if self.is_dragging else "Moving")
         cv2.putText(img, status_text, (10, 30), cv2.FONT_HERSHEY_PLAIN, 1, (0,255,0), 1)
 
+class KeyboardGeometry:
+    base_width = 960
+    base_height = 540
+
+    def __init__(self, rows, key_width, window_width, window_height, row_indents,
+                 button_height=50, button_margin=6, start_x=20, bottom_margin=20):
+        self.scale = min(window_width / self.base_width, window_height / self.base_height)
+        self.button_height = round(button_height * self.scale)
+        self.radius = max(1, round(6 * self.scale))
+        self.font_scale = 0.8 * self.scale
+        self.font_thickness = max(1, round(2 * self.scale))
+        self.start_x = round(start_x * self.scale)
+        self.start_y = window_height - round((len(rows) * (button_height + button_margin) + bottom_margin) * self.scale)
+
+        self.keys = []
+        self.row_tops = []
+        self.row_bottoms = []
+        self.lefts = []
+        self.rights = []
+        rects = []
+        for row_idx, row in enumerate(rows):
+            top = self.start_y + round(row_idx * (button_height + button_margin) * self.scale)
+            self.row_tops.append(top)
+            self.row_bottoms.append(top + self.button_height)
+            lefts, rights = [], []
+            base_x = start_x + row_indents[row_idx]
+            for key in row:
+                width = key_width(key)
+                left = round(base_x * self.scale)
+                right = round((base_x + width) * self.scale)
+                lefts.append(left)
+                rights.append(right)
+                rects.append((left, top, right, top + self.button_height))
+                base_x += width + button_margin
+            self.keys.append(list(row))
+            self.lefts.append(lefts)
+            self.rights.append(rights)
+        self.rects = np.array(rects, dtype=np.int32).reshape(-1, 4)
+        self.labels = [key for row in self.keys for key in row]
+
+    def hit_test(self, x, y):
+        row = bisect.bisect_left(self.row_tops, y) - 1
+        if row < 0 or not y < self.row_bottoms[row]:
+            return None
+        col = bisect.bisect_left(self.lefts[row], x) - 1
+        if col < 0 or not x < self.rights[row][col]:
+            return None
+        return self.keys[row][col]
+
+class TrieNode:
+    __slots__ = ("children", "count", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.count = 0
+        self.top = []
+
+class WordPredictor:
+    # Prefix trie where every node keeps its best completions, so a lookup is a walk down the prefix
+    def __init__(self, max_words=20000, suggestions=3, max_length=24):
+        self.max_words = max_words
+        self.suggestions = suggestions
+        # One spare slot so the typed word itself can be skipped without losing a suggestion
+        self.top_size = suggestions + 1
+        self.max_length = max_length
+        self.root = TrieNode()
+        self.words = {}
+        self.evicted = 0
+        self.path = None
+
+    def rank(self, entry):
+        return -entry[0], entry[1]
+
+    def learn(self, word, weight=1):
+        word = word.lower()
+        if not 1 < len(word) <= self.max_length:
+            return
+        path = [self.root]
+        for char in word:
+            path.append(path[-1].children.setdefault(char, TrieNode()))
+        path[-1].count += weight
+        # Re-inserted so dict order tracks recency; it breaks frequency ties when evicting
+        self.words.pop(word, None)
+        self.words[word] = path[-1].count
+        entry = (path[-1].count, word)
+        for node in path:
+            top = [item for item in node.top if item[1] != word]
+            if len(top) < self.top_size or self.rank(entry) < self.rank(top[-1]):
+                top.append(entry)
+                top.sort(key=self.rank)
+                del top[self.top_size:]
+            node.top = top
+        if len(self.words) > self.max_words:
+            self.evict(len(self.words) - int(self.max_words * 0.9))
+
+    def learn_text(self, text):
+        for word in re.findall(r"[a-z']+", text.lower()):
+            self.learn(word.strip("'"))
+
+    def complete(self, prefix):
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        words = [word for _, word in node.top if word != prefix.lower()][:self.suggestions]
+        if prefix[:1].isupper():
+            return [word.capitalize() for word in words]
+        return words
+
+    def evict(self, count):
+        # Least used first, oldest first among equals
+        for word, _ in sorted(self.words.items(), key=lambda item: item[1])[:count]:
+            self.remove(word)
+            self.evicted += 1
+
+    def remove(self, word):
+        path = [self.root]
+        for char in word:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].count = 0
+        self.words.pop(word, None)
+        for depth in range(len(word), -1, -1):
+            node = path[depth]
+            if depth and not node.children and not node.count:
+                del path[depth - 1].children[word[depth - 1]]
+            elif any(item[1] == word for item in node.top):
+                # Children are already fixed up, so their lists hold the best of each subtree
+                entries = [(node.count, word[:depth])] if node.count else []
+                for child in node.children.values():
+                    entries.extend(child.top)
+                entries.sort(key=self.rank)
+                node.top = entries[:self.top_size]
+
+    def save(self, path):
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.words, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write word list {path}: {e}")
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        predictor = cls(**kwargs)
+        predictor.path = path
+        try:
+            with open(path) as f:
+                words = json.load(f)
+        except (OSError, ValueError):
+            return predictor
+        for word, count in words.items():
+            predictor.learn(word, count)
+        return predictor
+
 class VirtualKeyboard:
-    def __init__(self, mp_hands, hands, mp_draw, window_width, window_height):
+    def __init__(self, mp_hands, hands, mp_draw, window_width, window_height, input_backend=None):
         self.mp_hands = mp_hands
         self.hands = hands
         self.mp_draw = mp_draw
         self.window_width = window_width
         self.window_height = window_height
-        self.keyboard = Controller()
+        self.input = input_backend or InputBackend()
         
         self.keyboard_layout = {
             'normal': [
@@ -304,9 +1765,9 @@ class VirtualKeyboard:
         }
         
         self.special_keys = {
-            '⌫': Key.backspace, 'Tab': Key.tab, 'Enter': Key.enter, 'Caps': 'Caps',
-            'Shift': 'Shift', 'Space': Key.space, 'Ctrl': Key.ctrl_l, 'Alt': Key.alt_l,
-            'Win': Key.cmd, 'Esc': Key.esc
+            '⌫': 'backspace', 'Tab': 'tab', 'Enter': 'enter', 'Caps': None,
+            'Shift': None, 'Space': 'space', 'Ctrl': 'ctrl_l', 'Alt': 'alt_l',
+            'Win': 'cmd', 'Esc': 'esc'
         }
         
         self.shift_pressed = False
@@ -322,6 +1783,8 @@ class VirtualKeyboard:
             'Ctrl': 70, 'Alt': 70, 'Win': 70, 'Space': 220, 'Esc': 60
         }
         self.default_key_width = 50
+        self.row_indents = [0, 20, 40, 60, 80]
+        self.geometries = {}
         
         self.key_color = (50, 50, 50)
         self.text_color = (255, 255, 255)
@@ -330,49 +1793,129 @@ class VirtualKeyboard:
         self.click_cooldown = 0.2
         self.last_click_time = 0
         self.prev_clicked = False
-        self.prev_finger_x, self.prev_finger_y = 0, 0
-        self.smoothening = 15
+        self.filter = OneEuroFilter()
         self.keyboard_start_x = 20
-        self.keyboard_start_y = window_height - 5 * (self.button_height + self.button_margin) - 20
+        self.keyboard_start_y = self.get_geometry('normal').start_y
+        self.keyboard_layers = {}
+        self.keyboard_layer = None
+        self.predictor = None
+        self.current_word = ""
+        self.suggestions = []
+        self.suggestion_keys = []
 
     def get_key_width(self, key):
         return self.key_widths.get(key, self.default_key_width)
+
+    def get_geometry(self, layout):
+        cache_key = (layout, self.window_width, self.window_height)
+        geometry = self.geometries.get(cache_key)
+        if geometry is None:
+            geometry = KeyboardGeometry(self.keyboard_layout[layout], self.get_key_width,
+                                        self.window_width, self.window_height, self.row_indents,
+                                        self.button_height, self.button_margin)
+            self.geometries[cache_key] = geometry
+        return geometry
+
+    def get_suggestion_geometry(self):
+        cache_key = ('suggestions', self.window_width, self.window_height)
+        geometry = self.geometries.get(cache_key)
+        if geometry is None:
+            # One row of equal slots spanning the top key row, sitting directly above the keyboard
+            rows = self.keyboard_layout['normal']
+            top_row = sum(self.get_key_width(key) for key in rows[0]) + self.button_margin * (len(rows[0]) - 1)
+            slots = len(self.suggestion_keys)
+            slot_width = (top_row - self.button_margin * (slots - 1)) // slots
+            geometry = KeyboardGeometry([self.suggestion_keys], lambda key: slot_width,
+                                        self.window_width, self.window_height, [0],
+                                        self.button_height, self.button_margin,
+                                        bottom_margin=20 + len(rows) * (self.button_height + self.button_margin))
+            self.geometries[cache_key] = geometry
+        return geometry
+
+    def enable_prediction(self, predictor):
+        self.predictor = predictor
+        self.suggestion_keys = [f"Suggestion {slot + 1}" for slot in range(predictor.suggestions)]
+        self.current_word = ""
+        self.suggestions = []
+
+    def track_word(self, key):
+        if key == '⌫':
+            self.current_word = self.current_word[:-1]
+        elif len(key) == 1 and (key.isalpha() or key == "'"):
+            self.current_word += key
+        else:
+            # Space, Enter and punctuation finish a word; anything else just abandons it
+            if key in ('Space', 'Enter') or (len(key) == 1 and not key.isalnum()):
+                self.predictor.learn(self.current_word.strip("'"))
+            self.current_word = ""
+        self.suggestions = self.predictor.complete(self.current_word) if self.current_word else []
+
+    def accept_suggestion(self, slot):
+        if slot >= len(self.suggestions):
+            return
+        word = self.suggestions[slot]
+        for char in word[len(self.current_word):]:
+            self.input.tap_char(char)
+        self.input.tap_special('space')
+        self.predictor.learn(word)
+        self.current_word = ""
+        self.suggestions = []
+
+    def draw_suggestions(self, img):
+        geometry = self.get_suggestion_geometry()
+        for word, (x1, y1, x2, y2) in zip(self.suggestions, geometry.rects.tolist()):
+            self.draw_rounded_rect(img, (x1, y1), (x2, y2), self.special_key_color, radius=geometry.radius)
+            text_size = cv2.getTextSize(word, cv2.FONT_HERSHEY_SIMPLEX,
+                                        geometry.font_scale, geometry.font_thickness)[0]
+            cv2.putText(img, word, (x1 + (x2 - x1 - text_size[0]) // 2, y1 + (y2 - y1 + text_size[1]) // 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, geometry.font_scale, self.text_color, geometry.font_thickness)
+
+    def set_window_size(self, window_width, window_height):
+        self.window_width = window_width
+        self.window_height = window_height
+        self.keyboard_start_y = self.get_geometry('normal').start_y
+        self.keyboard_layers = {}
+        self.keyboard_layer = None
     
+    def modifier_state(self):
+        layout = 'shift' if self.shift_pressed else 'normal'
+        return (layout, self.shift_pressed, self.caps_lock, self.ctrl_pressed, 
+                self.alt_pressed, self.win_pressed)
+
     def draw_keyboard(self, img):
-        current_y = self.keyboard_start_y
+        if self.keyboard_layer is None or self.keyboard_layer.shape != img.shape:
+            state = self.modifier_state()
+            layer = self.keyboard_layers.get(state)
+            if layer is None or layer.shape != img.shape:
+                layer = np.zeros_like(img)
+                self.render_keyboard(layer)
+                self.keyboard_layers[state] = layer
+            self.keyboard_layer = layer
+        np.copyto(img, self.keyboard_layer)
+        # Suggestions change with every keystroke, so they go on top of the cached layer
+        if self.suggestions:
+            self.draw_suggestions(img)
+
+    def render_keyboard(self, img):
         layout = 'shift' if self.shift_pressed else 'normal'
+        geometry = self.get_geometry(layout)
         
-        for row_idx, row in enumerate(self.keyboard_layout[layout]):
-            current_x = self.keyboard_start_x
-            if row_idx == 1:
-                current_x += 20
-            elif row_idx == 2:
-                current_x += 40
-            elif row_idx == 3:
-                current_x += 60
-            elif row_idx == 4:
-                current_x += 80
-                
-            for key in row:
-                width = self.get_key_width(key)
-                key_col = (self.active_key_color if key in ['Shift', 'Caps', 'Ctrl', 'Alt', 'Win'] and 
-                          ((key == 'Shift' and self.shift_pressed) or (key == 'Caps' and self.caps_lock) or
-                           (key == 'Ctrl' and self.ctrl_pressed) or (key == 'Alt' and self.alt_pressed) or
-                           (key == 'Win' and self.win_pressed)) 
-                          else self.special_key_color if key in self.special_keys else self.key_color)
-                
-                self.draw_rounded_rect(img, (current_x, current_y), 
-                                     (current_x + width, current_y + self.button_height), 
-                                     key_col, radius=6)
-                
-                text_size = cv2.getTextSize(key, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
-                text_x = current_x + (width - text_size[0]) // 2
-                text_y = current_y + (self.button_height + text_size[1]) // 2
-                cv2.putText(img, key, (text_x, text_y), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, self.text_color, 2)
-                
-                current_x += width + self.button_margin
-            current_y += self.button_height + self.button_margin
+        for key, (x1, y1, x2, y2) in zip(geometry.labels, geometry.rects.tolist()):
+            key_col = (self.active_key_color if key in ['Shift', 'Caps', 'Ctrl', 'Alt', 'Win'] and 
+                      ((key == 'Shift' and self.shift_pressed) or (key == 'Caps' and self.caps_lock) or
+                       (key == 'Ctrl' and self.ctrl_pressed) or (key == 'Alt' and self.alt_pressed) or
+                       (key == 'Win' and self.win_pressed)) 
+                      else self.special_key_color if key in self.special_keys else self.key_color)
+            
+            self.draw_rounded_rect(img, (x1, y1), (x2, y2), key_col, radius=geometry.radius)
+            
+            text_size = cv2.getTextSize(key, cv2.FONT_HERSHEY_SIMPLEX, 
+                                        geometry.font_scale, geometry.font_thickness)[0]
+            text_x = x1 + (x2 - x1 - text_size[0]) // 2
+            text_y = y1 + (y2 - y1 + text_size[1]) // 2
+            cv2.putText(img, key, (text_x, text_y), 
+                       cv2.FONT_HERSHEY_SIMPLEX, geometry.font_scale, self.text_color, 
+                       geometry.font_thickness)
 
     def draw_rounded_rect(self, img, pt1, pt2, color, radius=6):
         x1, y1 = pt1
@@ -385,33 +1928,22 @@ class VirtualKeyboard:
         cv2.circle(img, (x2 - radius, y2 - radius), radius, color, -1)
 
     def get_clicked_key(self, finger_pos):
-        current_y = self.keyboard_start_y
         layout = 'shift' if self.shift_pressed else 'normal'
         x, y = finger_pos
-        
-        for row_idx, row in enumerate(self.keyboard_layout[layout]):
-            current_x = self.keyboard_start_x
-            if row_idx == 1:
-                current_x += 20
-            elif row_idx == 2:
-                current_x += 40
-            elif row_idx == 3:
-                current_x += 60
-            elif row_idx == 4:
-                current_x += 80
-                
-            for key in row:
-                width = self.get_key_width(key)
-                if (current_x < x < current_x + width and 
-                    current_y < y < current_y + self.button_height):
-                    return key
-                current_x += width + self.button_margin
-            current_y += self.button_height + self.button_margin
-        return None
+        if self.suggestions:
+            slot = self.get_suggestion_geometry().hit_test(x, y)
+            if slot:
+                return slot
+        return self.get_geometry(layout).hit_test(x, y)
     
     def handle_key_press(self, key):
         if not key:
             return
+        if key in self.suggestion_keys:
+            self.accept_suggestion(self.suggestion_keys.index(key))
+            return
+        if key in ('Shift', 'Caps', 'Ctrl', 'Alt', 'Win'):
+            self.keyboard_layer = None
         if key == 'Shift':
             self.shift_pressed = not self.shift_pressed
         elif key == 'Caps':
@@ -424,71 +1956,422 @@ class VirtualKeyboard:
             self.win_pressed = not self.win_pressed
         elif key in self.special_keys:
             special_key = self.special_keys[key]
-            if not isinstance(special_key, str):
-                self.keyboard.press(special_key)
-                self.keyboard.release(special_key)
+            if special_key is not None:
+                self.input.tap_special(special_key)
+            if self.predictor:
+                self.track_word(key)
         else:
             char = key.upper() if self.caps_lock != self.shift_pressed else key.lower()
             if self.ctrl_pressed and key.lower() in 'cvxz':
-                pyautogui.hotkey('ctrl', key.lower())
+                self.input.hotkey('ctrl', key.lower())
+                if self.predictor:
+                    self.track_word('Ctrl')
             elif self.win_pressed and key.lower() == 'd':
-                pyautogui.hotkey('win', 'd')
+                self.input.hotkey('win', 'd')
+                if self.predictor:
+                    self.track_word('Win')
             else:
-                self.keyboard.press(char)
-                self.keyboard.release(char)
+                self.input.tap_char(char)
+                if self.predictor:
+                    self.track_word(char)
             if self.shift_pressed and key != 'Shift':
                 self.shift_pressed = False
+                self.keyboard_layer = None
     
-    def detect_click(self, hand_landmarks):
-        index_tip = hand_landmarks.landmark[8]
-        thumb_tip = hand_landmarks.landmark[4]
-        distance = math.sqrt((thumb_tip.x - index_tip.x) ** 2 + (thumb_tip.y - index_tip.y) ** 2)
-        return distance < 0.05
+    def detect_click(self, landmarks):
+        thumb_x, thumb_y, _ = landmarks[THUMB_TIP].tolist()
+        index_x, index_y, _ = landmarks[INDEX_TIP].tolist()
+        dx, dy = thumb_x - index_x, thumb_y - index_y
+        return math.sqrt(dx * dx + dy * dy) < 0.05
     
-    def handle_hand_gestures(self, results, hand_index, img):
-        if not results or not results.multi_hand_landmarks or not img.size:
+    def handle_hand_gestures(self, hands, hand_index, img, now):
+        if not hands or (img is not None and not img.size):
+            self.filter.reset()
             return
         if hand_index is None:
-            cv2.putText(img, "No Left Hand", (70, 30), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255), 1)
+            if img is not None:
+                cv2.putText(img, "No Left Hand", (70, 30), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255), 1)
+            self.filter.reset()
             return
         
-        hand_landmarks = results.multi_hand_landmarks[hand_index]
-        index_tip = hand_landmarks.landmark[8]
-        finger_x = int(index_tip.x * self.window_width)
-        finger_y = int(index_tip.y * self.window_height)
+        landmarks = hands.landmarks[hand_index]
+        index_tip = landmarks[INDEX_TIP]
+        finger_x = int(index_tip[0] * self.window_width)
+        finger_y = int(index_tip[1] * self.window_height)
         finger_x = max(0, min(finger_x, self.window_width-1))
         finger_y = max(0, min(finger_y, self.window_height-1))
         
-        current_x = self.prev_finger_x + (finger_x - self.prev_finger_x) / self.smoothening
-        current_y = self.prev_finger_y + (finger_y - self.prev_finger_y) / self.smoothening
-        self.prev_finger_x, self.prev_finger_y = current_x, current_y
+        current_x, current_y = self.filter((finger_x, finger_y), now)
         
-        cv2.circle(img, (int(current_x), int(current_y)), 8, (0, 255, 0), cv2.FILLED)
-        cv2.circle(img, (int(current_x), int(current_y)), 10, (0, 200, 0), 2)
+        if img is not None:
+            cv2.circle(img, (int(current_x), int(current_y)), 8, (0, 255, 0), cv2.FILLED)
+            cv2.circle(img, (int(current_x), int(current_y)), 10, (0, 200, 0), 2)
         
-        is_clicked = self.detect_click(hand_landmarks)
-        current_time = time.time()
+        if hands.gestures is not None:
+            is_clicked = hands.gestures[hand_index] == "left_click"
+        else:
+            is_clicked = self.detect_click(landmarks)
+        current_time = now
         
         if is_clicked and not self.prev_clicked and current_time - self.last_click_time > self.click_cooldown:
             clicked_key = self.get_clicked_key((current_x, current_y))
             if clicked_key:
                 self.handle_key_press(clicked_key)
                 self.last_click_time = current_time
-                cv2.circle(img, (int(current_x), int(current_y)), 12, (0, 255, 255), -1)
+                if img is not None:
+                    cv2.circle(img, (int(current_x), int(current_y)), 12, (0, 255, 255), -1)
+        self.prev_clicked = is_clicked
+        if img is None:
+            return
         
         mode = 'Shift' if self.shift_pressed else 'Caps' if self.caps_lock else 'normal'
         status_text = f"Keyboard: {mode}" + (" | Pressing" if is_clicked else "")
-        cv2.putText(img, status_text, (10, self.keyboard_start_y - 10), 
+        status_y = self.get_suggestion_geometry().start_y if self.predictor else self.keyboard_start_y
+        cv2.putText(img, status_text, (10, status_y - 10), 
                    cv2.FONT_HERSHEY_PLAIN, 1.2, (255, 255, 255), 2)
-        self.prev_clicked = is_clicked
+
+class GoogleSpeechBackend:
+    name = "google"
+    streaming = False
+
+    def recognize(self, recognizer, audio):
+        return recognizer.recognize_google(audio).lower()
+
+class VoskSpeechBackend:
+    # Offline recognizer restricted to the command vocabulary; emits partial results while audio streams in
+    name = "vosk"
+    streaming = True
+    sample_rate = 16000
+
+    def __init__(self, model_path, vocabulary):
+        import vosk
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+        self.grammar = json.dumps(sorted(set(vocabulary)) + ["[unk]"])
+
+    def new_stream(self):
+        return self.vosk.KaldiRecognizer(self.model, self.sample_rate, self.grammar)
+
+    def clean(self, text):
+        return " ".join(word for word in text.split() if word != "[unk]")
+
+    def feed(self, stream, pcm):
+        if stream.AcceptWaveform(pcm):
+            return None, self.clean(json.loads(stream.Result())["text"])
+        return self.clean(json.loads(stream.PartialResult())["partial"]), None
+
+    def finish(self, stream):
+        return self.clean(json.loads(stream.FinalResult())["text"])
+
+    def recognize(self, recognizer, audio):
+        stream = self.new_stream()
+        stream.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = self.finish(stream)
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+def make_speech_backend(name, vocabulary, model_path=None):
+    if name == "vosk":
+        if not model_path:
+            raise ValueError("The vosk backend needs --vosk-model pointing at a downloaded model directory")
+        return VoskSpeechBackend(model_path, vocabulary)
+    return GoogleSpeechBackend()
+
+class VoiceActivityDetector:
+    # Frame-level speech detection against an adaptive noise floor. A segment ends as soon as the
+    # speaker pauses for the hangover, and starts with a little audio from before the onset
+    def __init__(self, sample_rate=16000, frame_ms=20, pre_roll=0.3, hangover=0.35, min_speech=0.15,
+                 max_phrase=5.0, onset_frames=3, ratio=3.0, min_rms=150):
+        self.sample_rate = sample_rate
+        self.frame_seconds = frame_ms / 1000
+        self.frame_bytes = int(sample_rate * self.frame_seconds) * 2
+        self.pre_roll = deque(maxlen=max(1, round(pre_roll / self.frame_seconds)))
+        self.hangover_frames = max(1, round(hangover / self.frame_seconds))
+        self.min_speech_frames = max(1, round(min_speech / self.frame_seconds))
+        self.max_phrase_frames = round(max_phrase / self.frame_seconds)
+        self.onset_frames = onset_frames
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.noise = None
+        self.pending = b""
+        self.segment = None
+        self.levels = []
+        self.onset = 0
+        self.voiced = 0
+        self.silent = 0
+        self.frames = 0
+        self.segment_frames = 0
+        self.segments = 0
+        self.dropped = 0
+
+    def threshold(self):
+        return max(self.min_rms, self.noise * self.ratio)
+
+    def feed(self, pcm):
+        # Returns ("speech", pcm) while a segment is open, then ("end", segment) or ("drop", None)
+        events = []
+        data = self.pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self.pending = data[usable:]
+        for offset in range(0, usable, self.frame_bytes):
+            self.process_frame(data[offset:offset + self.frame_bytes], events)
+        return events
+
+    def process_frame(self, frame, events):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        rms = float(np.sqrt((samples * samples).mean()))
+        self.frames += 1
+        if self.noise is None:
+            self.noise = rms
+        if self.segment is None:
+            self.pre_roll.append(frame)
+            if rms > self.threshold():
+                self.onset += 1
+            else:
+                self.onset = 0
+                # The floor follows the room outside speech: quickly down, slowly up
+                self.noise += (0.5 if rms < self.noise else 0.05) * (rms - self.noise)
+            if self.onset >= self.onset_frames:
+                self.segment = list(self.pre_roll)
+                self.pre_roll.clear()
+                self.levels = []
+                self.voiced, self.silent, self.onset = self.onset, 0, 0
+                events.append(("speech", b"".join(self.segment)))
+            return
+        self.segment.append(frame)
+        self.levels.append(rms)
+        events.append(("speech", frame))
+        # A lower bar inside speech keeps quiet word endings in the segment
+        if rms > 0.7 * self.threshold():
+            self.voiced += 1
+            self.silent = 0
+        else:
+            self.silent += 1
+        if self.silent >= self.hangover_frames:
+            self.finish(events)
+        elif len(self.segment) >= self.max_phrase_frames:
+            # Loud for the whole phrase limit is more likely a new noise source than speech: raise the floor to it
+            self.noise = max(self.noise, float(np.percentile(self.levels, 20)))
+            self.finish(events)
+
+    def finish(self, events):
+        segment, voiced = self.segment, self.voiced
+        self.segment = None
+        self.segment_frames += len(segment)
+        if voiced >= self.min_speech_frames:
+            self.segments += 1
+            events.append(("end", b"".join(segment)))
+        else:
+            self.dropped += 1
+            events.append(("drop", None))
+
+    def report(self):
+        skipped = 1 - self.segment_frames / self.frames if self.frames else 0
+        print(f"Voice activity: {self.segments} segments recognized, {self.dropped} too short and dropped, "
+              f"{skipped * 100:.0f}% of audio never reached the recognizer")
+
+class CommandMatcher:
+    # Token trie over the normalized command phrases; None keys mark the end of a phrase
+    suffixes = ("s", "es", "d", "ed", "ing", "ly")
+
+    def __init__(self, commands, argument_commands=(), fuzzy_cutoff=0.8, cache_size=1024):
+        self.argument_commands = set(argument_commands)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        # Plural and suffixed forms of each command word map back to it ('screenshots', 'recently'); shorter
+        # words claim their forms first so 'save screenshots' compiles to 'save screenshot'
+        self.forms = {}
+        for token in sorted({token for command in commands for token in command.split()}, key=len):
+            stem = token[:-1] if token.endswith("e") else token
+            for form in [token] + [token + suffix for suffix in self.suffixes] + [stem + "ing"]:
+                self.forms.setdefault(form, self.forms.get(token, token))
+        self.root = {}
+        for command in commands:
+            node = self.root
+            for token in self.normalize(command.split()):
+                node = node.setdefault(token, {})
+            node[None] = command
+        self.vocabulary = {}
+        for token in set(self.forms.values()):
+            self.vocabulary.setdefault(len(token), []).append(token)
+        self.correct_token = functools.lru_cache(maxsize=cache_size)(self.closest_token)
+        self.match_fuzzy = functools.lru_cache(maxsize=cache_size)(self.match_corrected)
+
+    def normalize(self, tokens):
+        return tuple(self.forms.get(token, token) for token in tokens)
+
+    def closest_token(self, token):
+        if token in self.forms:
+            return self.forms[token]
+        # Only words of about the same length are misrecognitions; 'dragon' is not 'drag'
+        candidates = [word for length in range(len(token) - 1, len(token) + 2)
+                      for word in self.vocabulary.get(length, ())]
+        close = difflib.get_close_matches(token, candidates, n=1, cutoff=self.fuzzy_cutoff)
+        return close[0] if close else token
+
+    def longest_match(self, tokens):
+        best, best_length = None, 0
+        for start in range(len(tokens)):
+            node = self.root
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                command = node.get(None)
+                if command is None:
+                    continue
+                # An argument command also covers the argument that follows it
+                length = (len(tokens) if command in self.argument_commands and end + 1 < len(tokens)
+                          else end + 1) - start
+                if length > best_length:
+                    best, best_length = (command, end + 1, node), length
+        return best
+
+    def resolve(self, words, match):
+        if match is None:
+            return None
+        command, end, _ = match
+        # Arguments keep the words as spoken; only command words are normalized
+        argument = " ".join(words[end:]) if command in self.argument_commands else ""
+        return command, argument, match[2]
+
+    def match_corrected(self, words):
+        return self.resolve(words, self.longest_match(tuple(self.correct_token(word) for word in words)))
+
+    def lookup(self, text):
+        words = tuple(re.findall(r"[\w']+", text.lower()))
+        found = self.resolve(words, self.longest_match(self.normalize(words)))
+        return found if found is not None else self.match_fuzzy(words)
+
+    def match(self, text):
+        found = self.lookup(text)
+        return found[:2] if found is not None else None
+
+    def is_complete(self, text):
+        # True when no longer phrase or argument could still extend the match
+        found = self.lookup(text)
+        if found is None or found[0] in self.argument_commands:
+            return False
+        return len(found[2]) == 1
+
+class CommandExecutor:
+    def __init__(self, default_timeout=3.0, synchronous=False, watchdog_interval=0.1):
+        self.default_timeout = default_timeout
+        self.synchronous = synchronous
+        self.watchdog_interval = watchdog_interval
+        self.condition = threading.Condition()
+        self.lanes = {}
+        self.generations = {}
+        self.active = {}
+        self.results = deque()
+        self.durations = StageStats(window=200)
+        self.timeouts = 0
+        self.running = True
+        if not synchronous:
+            self.watchdog = threading.Thread(target=self.watch, daemon=True)
+            self.watchdog.start()
+
+    def submit(self, command, action, lane="default", timeout=None):
+        if self.synchronous:
+            self.finish(command, *self.call(command, action))
+            return
+        with self.condition:
+            if lane not in self.lanes:
+                self.lanes[lane] = deque()
+                self.spawn(lane)
+            self.lanes[lane].append((command, action, timeout or self.default_timeout))
+            self.condition.notify_all()
+
+    def spawn(self, lane):
+        # Caller holds the condition; a bumped generation retires the lane's previous worker
+        self.generations[lane] = self.generations.get(lane, 0) + 1
+        threading.Thread(target=self.run_lane, args=(lane, self.generations[lane]), daemon=True).start()
+
+    def run_lane(self, lane, generation):
+        pending = self.lanes[lane]
+        while True:
+            with self.condition:
+                while self.running and not pending and self.generations[lane] == generation:
+                    self.condition.wait()
+                if self.generations[lane] != generation or not pending:
+                    return
+                command, action, timeout = pending.popleft()
+                self.active[lane] = (command, time.perf_counter(), timeout)
+            status, detail, seconds = self.call(command, action)
+            with self.condition:
+                if self.generations[lane] != generation:
+                    return
+                del self.active[lane]
+            self.finish(command, status, detail, seconds)
+
+    def call(self, command, action):
+        start = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            print(f"Error executing command '{command}': {e}")
+            return "failed", str(e), time.perf_counter() - start
+        return "done", None, time.perf_counter() - start
+
+    def finish(self, command, status, detail, seconds):
+        self.durations.record(command, seconds)
+        self.results.append((command, status, detail, seconds))
+
+    def watch(self):
+        with self.condition:
+            while self.running:
+                now = time.perf_counter()
+                for lane, (command, started, timeout) in list(self.active.items()):
+                    if now - started > timeout:
+                        # A Python call cannot be interrupted, so the stuck worker is abandoned
+                        # and the rest of its lane carries on in a fresh one
+                        del self.active[lane]
+                        self.timeouts += 1
+                        print(f"Command '{command}' timed out after {timeout:g} s")
+                        self.results.append((command, "timed out", f"after {timeout:g} s", now - started))
+                        self.spawn(lane)
+                self.condition.wait(self.watchdog_interval)
+
+    def poll_results(self):
+        results = []
+        while self.results:
+            results.append(self.results.popleft())
+        return results
+
+    def in_flight(self):
+        now = time.perf_counter()
+        with self.condition:
+            return [(command, now - started) for command, started, _ in self.active.values()]
+
+    def report(self):
+        print(f"Voice commands: {self.timeouts} timed out")
+        self.durations.report()
+
+    def close(self, timeout=1):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if not self.synchronous:
+            self.watchdog.join(timeout)
 
 class VoiceCommandHandler:
-    def __init__(self, system_controller):
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
+    def __init__(self, system_controller, input_backend=None, backend=None, executor=None):
+        self.speech_recognizer = None
+        self.microphone = None
+        self.vad_options = None
+        self.vad = None
         self.command_queue = queue.Queue()
         self.listening = False
         self.system_controller = system_controller
+        self.input = input_backend or InputBackend()
+        self.backend = backend or GoogleSpeechBackend()
+        self.stream_fired = False
+        self.last_command = None
+        self.last_queued = None
+        self.executor = executor or CommandExecutor()
+        self.last_result = None
+        self.status_seconds = 4
         
         self.commands = {
             "open": self.handle_open_app,
@@ -500,63 +2383,202 @@ class VoiceCommandHandler:
             "increase brightness": lambda: self.system_controller.increase_brightness(10),
             "decrease brightness": lambda: self.system_controller.decrease_brightness(10),
             "screenshot": lambda: self.system_controller.take_screenshot(),
-            "close": lambda: pyautogui.hotkey('alt', 'f4'),
+            "save screenshots": lambda: self.system_controller.save_screenshots(),
+            "close": lambda: self.input.hotkey('alt', 'f4'),
             "close recent": lambda: self.system_controller.close_recent_app(),
-            "scroll up": lambda: pyautogui.scroll(100),
-            "scroll down": lambda: pyautogui.scroll(-100),
-            "left click": lambda: pyautogui.click(),
-            "right click": lambda: pyautogui.rightClick(),
-            "double click": lambda: pyautogui.doubleClick(),
-            "drag": lambda: pyautogui.mouseDown(),
-            "drop": lambda: pyautogui.mouseUp(),
-            "minimize": lambda: pyautogui.hotkey('win', 'down'),
-            "maximize": lambda: pyautogui.hotkey('win', 'up'),
-            "desktop": lambda: pyautogui.hotkey('win', 'd'),
-            "task manager": lambda: pyautogui.hotkey('ctrl', 'shift', 'esc'),
+            "scroll up": lambda: self.input.scroll(100),
+            "scroll down": lambda: self.input.scroll(-100),
+            "left click": lambda: self.input.click(),
+            "right click": lambda: self.input.right_click(),
+            "double click": lambda: self.input.double_click(),
+            "drag": lambda: self.input.mouse_down(),
+            "drop": lambda: self.input.mouse_up(),
+            "minimize": lambda: self.input.hotkey('win', 'down'),
+            "maximize": lambda: self.input.hotkey('win', 'up'),
+            "desktop": lambda: self.input.hotkey('win', 'd'),
+            "task manager": lambda: self.input.hotkey('ctrl', 'shift', 'esc'),
             "help": self.show_help
         }
+        self.argument_commands = {"open"}
+        # Commands sharing a lane run in order; mouse and keyboard commands share one so drag/drop never reorder
+        self.command_lanes = {
+            "open": "apps", "close recent": "apps", "help": "ui",
+            "screenshot": "screenshot", "save screenshots": "screenshot",
+            "increase volume": "volume", "decrease volume": "volume", "max volume": "volume",
+            "min volume": "volume", "mute": "volume",
+            "increase brightness": "brightness", "decrease brightness": "brightness",
+        }
+        self.command_timeouts = {"open": 10, "close recent": 5, "screenshot": 5}
+        self.compile_commands()
+
+    def compile_commands(self):
+        self.matcher = CommandMatcher(self.commands, self.argument_commands)
+
+    @property
+    def recognizer(self):
+        # Created on first use so building the handler doesn't import speech_recognition
+        if self.speech_recognizer is None:
+            self.speech_recognizer = sr.Recognizer()
+        return self.speech_recognizer
         
-    def handle_open_app(self, text):
-        app_name = text.replace("open", "").strip()
+    def handle_open_app(self, app_name):
+        app_name = app_name.strip()
         if app_name:
             self.system_controller.open_app(app_name)
         
     def show_help(self):
         print("Available commands: open [app name], increase/decrease volume, max/min volume, mute, "
-              "increase/decrease brightness, screenshot, close, close recent, scroll up/down, "
+              "increase/decrease brightness, screenshot, save screenshots, close, close recent, scroll up/down, "
               "left/right/double click, drag/drop, minimize, maximize, desktop, task manager, help")
         
-    def listen_in_background(self):
-        def callback(recognizer, audio):
+    def vocabulary(self):
+        return list(self.commands) + [f"open {app}" for app in SystemController.app_mappings]
+
+    def match_command(self, text):
+        result = self.matcher.match(text)
+        return result[0] if result else None
+
+    def is_unambiguous(self, text):
+        # A partial transcript may fire early only if no longer command could still follow from it
+        return self.matcher.is_complete(text)
+
+    def handle_transcript(self, text):
+        print(f"Recognized command: '{text}'")
+        
+        result = self.matcher.match(text)
+        if result is None:
+            print(f"Unrecognized command: '{text}'")
+            return False
+        
+        command, argument = result
+        action = self.commands[command]
+        if command in self.argument_commands:
+            self.command_queue.put((command, lambda: action(argument)))
+        else:
+            self.command_queue.put((command, action))
+        self.last_command = command
+        self.last_queued = time.perf_counter()
+        return True
+
+    def feed_stream(self, stream, pcm):
+        partial, final = self.backend.feed(stream, pcm)
+        if final is not None:
+            if final and not self.stream_fired:
+                self.handle_transcript(final)
+            self.stream_fired = False
+        elif partial and not self.stream_fired and self.is_unambiguous(partial):
+            self.handle_transcript(partial)
+            self.stream_fired = True
+
+    def listen_streaming(self):
+        self.listening = True
+        try:
+            if self.microphone is None:
+                self.microphone = sr.Microphone(sample_rate=self.backend.sample_rate)
+        except Exception as e:
+            print(f"Error starting voice listener: {e}")
+            return None
+
+        def run():
             try:
-                text = recognizer.recognize_google(audio).lower()
-                print(f"Recognized command: '{text}'")
-                
-                if "open" in text:
-                    self.command_queue.put(lambda: self.commands["open"](text))
-                    return
-                
-                for command, action in self.commands.items():
-                    if command in text:
-                        self.command_queue.put(action if command != "open" else lambda: action(text))
-                        return
-                
-                print(f"Unrecognized command: '{text}'")
-            except sr.UnknownValueError:
-                print("Could not understand audio")
-            except sr.RequestError as e:
-                print(f"Voice recognition error: {e}")
+                with self.microphone as source:
+                    stream = self.backend.new_stream()
+                    while self.listening:
+                        self.feed_stream(stream, source.stream.read(source.CHUNK))
+            except Exception as e:
+                print(f"Error in streaming voice listener: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        print(f"Started streaming {self.backend.name} listener")
+
+        def stop_listening(wait_for_stop=True):
+            self.listening = False
+            if wait_for_stop:
+                thread.join(1)
+        return stop_listening
+        
+    def recognize_phrase(self, recognizer, audio):
+        try:
+            self.handle_transcript(self.backend.recognize(recognizer, audio))
+        except sr.UnknownValueError:
+            print("Could not understand audio")
+        except sr.RequestError as e:
+            print(f"Voice recognition error: {e}")
+        except Exception as e:
+            print(f"Unexpected error in voice recognition: {e}")
+
+    def listen_with_vad(self):
+        sample_rate = getattr(self.backend, "sample_rate", 16000)
+        self.listening = True
+        try:
+            if self.microphone is None:
+                self.microphone = sr.Microphone(sample_rate=sample_rate)
+        except Exception as e:
+            print(f"Error starting voice listener: {e}")
+            return None
+        self.vad = VoiceActivityDetector(sample_rate, **self.vad_options)
+        segments = queue.Queue()
+
+        def capture():
+            try:
+                with self.microphone as source:
+                    stream = self.backend.new_stream() if self.backend.streaming else None
+                    while self.listening:
+                        for kind, pcm in self.vad.feed(source.stream.read(source.CHUNK)):
+                            if stream is None:
+                                if kind == "end":
+                                    segments.put(pcm)
+                            elif kind == "speech":
+                                self.feed_stream(stream, pcm)
+                            else:
+                                # Endpointed here rather than waiting for the recognizer's own silence timeout
+                                final = self.backend.finish(stream) if kind == "end" else ""
+                                if final and not self.stream_fired:
+                                    self.handle_transcript(final)
+                                stream = self.backend.new_stream()
+                                self.stream_fired = False
             except Exception as e:
-                print(f"Unexpected error in voice recognition: {e}")
+                print(f"Error in voice activity listener: {e}")
+            segments.put(None)
+
+        def recognize():
+            # Network recognition runs here so a slow request never stalls the capture loop
+            while True:
+                pcm = segments.get()
+                if pcm is None:
+                    return
+                self.recognize_phrase(self.recognizer, sr.AudioData(pcm, sample_rate, 2))
+
+        threads = [threading.Thread(target=capture, daemon=True), threading.Thread(target=recognize, daemon=True)]
+        for thread in threads:
+            thread.start()
+        print(f"Started {self.backend.name} listener with voice activity detection")
+
+        def stop_listening(wait_for_stop=True):
+            self.listening = False
+            if wait_for_stop:
+                for thread in threads:
+                    thread.join(1)
+        return stop_listening
+
+    def listen_in_background(self):
+        if self.vad_options is not None:
+            return self.listen_with_vad()
+        if self.backend.streaming:
+            return self.listen_streaming()
         
         self.listening = True
         try:
+            if self.microphone is None:
+                self.microphone = sr.Microphone()
             with self.microphone as source:
                 self.recognizer.adjust_for_ambient_noise(source, duration=1)  # Reduced duration for faster startup
                 self.recognizer.energy_threshold = 300
                 self.recognizer.dynamic_energy_threshold = True  # Adapt to noise levels
                 print("Adjusted for ambient noise")
-            stop_listening = self.recognizer.listen_in_background(self.microphone, callback, phrase_time_limit=5)
+            stop_listening = self.recognizer.listen_in_background(self.microphone, self.recognize_phrase,
+                                                                  phrase_time_limit=5)
             print("Started listening in background")
             return stop_listening
         except Exception as e:
@@ -564,110 +2586,1153 @@ class VoiceCommandHandler:
             return None
         
     def process_commands(self):
+        # Called once per frame: hands queued commands to the executor and collects finished ones without waiting
         while not self.command_queue.empty():
-            command_action = self.command_queue.get()
-            try:
-                command_action()
-            except Exception as e:
-                print(f"Error executing command: {e}")
+            command, action = self.command_queue.get()
+            self.executor.submit(command, action, self.command_lanes.get(command, "input"),
+                                 self.command_timeouts.get(command))
+        for result in self.executor.poll_results():
+            self.last_result = result + (time.perf_counter(),)
+
+    def status_line(self):
+        running = self.executor.in_flight()
+        if running:
+            command, elapsed = max(running, key=lambda item: item[1])
+            return f"Voice: running '{command}' ({elapsed:.1f} s)", (0, 255, 255)
+        if self.last_result and time.perf_counter() - self.last_result[4] < self.status_seconds:
+            command, status, detail, seconds, _ = self.last_result
+            if status == "done":
+                return f"Voice: '{command}' done in {seconds * 1000:.0f} ms", (0, 255, 0)
+            return f"Voice: '{command}' {status}: {detail}", (0, 0, 255)
+        return "Voice: Listening | Say 'open [app]', 'increase volume', or 'help'", (0, 255, 255)
+
+class LatestFrameQueue:
+    def __init__(self, lossless=False):
+        self.condition = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.dropped = 0
+        # A lossless queue makes the producer wait for the slot instead of displacing a stale frame
+        self.lossless = lossless
+
+    def put(self, item):
+        with self.condition:
+            while self.lossless and self.item is not None and not self.closed:
+                self.condition.wait()
+            displaced = self.item
+            if displaced is not None:
+                self.dropped += 1
+            self.item = item
+            self.condition.notify_all()
+        return displaced
+
+    def get(self, timeout=None):
+        with self.condition:
+            if self.item is None and not self.closed:
+                self.condition.wait(timeout)
+            item, self.item = self.item, None
+            if item is not None:
+                self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class StageStats:
+    def __init__(self, window=300):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+            self.samples[stage].append(seconds)
+            self.counts[stage] += 1
+
+    def percentiles(self, stage, qs=(50, 95, 99)):
+        with self.lock:
+            samples = list(self.samples.get(stage, ()))
+        if not samples:
+            return None
+        return np.percentile(samples, qs) * 1000
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        for stage in list(self.samples):
+            p50, p95, p99 = self.percentiles(stage)
+            print(f"{stage:>17}: {self.counts[stage] / elapsed:6.1f} fps | "
+                  f"p50 {p50:6.1f} ms | p95 {p95:6.1f} ms | p99 {p99:6.1f} ms")
+
+class FrameProfiler:
+    def __init__(self, overlay=False, jsonl_path=None, window=300, overlay_every=15, overlay_lines=10):
+        self.stats = StageStats(window)
+        self.overlay = overlay
+        self.overlay_every = overlay_every
+        self.overlay_lines = overlay_lines
+        self.overlay_text = []
+        self.committed = 0
+        self.jsonl = open(jsonl_path, 'w') if jsonl_path else None
+
+    def commit(self, frame):
+        for stage, seconds in frame.timings.items():
+            self.stats.record(stage, seconds)
+        if self.jsonl:
+            record = {"frame": frame.index, "t": frame.timestamp,
+                      "ms": {stage: round(seconds * 1000, 3) for stage, seconds in frame.timings.items()}}
+            self.jsonl.write(json.dumps(record) + "\n")
+        self.committed += 1
+        if self.overlay and self.committed % self.overlay_every == 0:
+            self.refresh_overlay()
+
+    def refresh_overlay(self):
+        rows = []
+        for stage in list(self.stats.samples):
+            p50, p95, p99 = self.stats.percentiles(stage)
+            rows.append((p95, f"{stage}: {p50:.1f}/{p95:.1f}/{p99:.1f} ms"))
+        rows.sort(reverse=True)
+        self.overlay_text = [text for _, text in rows[:self.overlay_lines]]
+
+    def draw_overlay(self, img, origin):
+        x, y = origin
+        for line in ["p50/p95/p99"] + self.overlay_text:
+            cv2.putText(img, line, (x, y), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 255), 1)
+            y += 16
+
+    def report(self):
+        print("Per-stage latency:")
+        self.stats.report()
+
+    def close(self):
+        if self.jsonl:
+            self.jsonl.close()
+            self.jsonl = None
+
+class FrameBuffers:
+    def __init__(self, shape):
+        self.shape = shape
+        self.capture = np.empty(shape, dtype=np.uint8)
+        self.flipped = np.empty(shape, dtype=np.uint8)
+        self.bgr = np.empty(shape, dtype=np.uint8)
+        self.rgb = np.empty(shape, dtype=np.uint8)
+
+class FrameBufferPool:
+    # One buffer set per frame in flight; sets come back after render or when a frame is dropped
+    def __init__(self, alpha=1.3, beta=30):
+        self.lock = threading.Lock()
+        self.free = deque()
+        self.shape = None
+        self.allocated = 0
+        # Same saturate(|x * alpha + beta|) as cv2.convertScaleAbs, as a 256-entry table
+        scaled = np.abs(np.arange(256, dtype=np.float32) * np.float32(alpha) + np.float32(beta))
+        self.lut = np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+
+    def acquire(self):
+        with self.lock:
+            if self.shape is None:
+                return None
+            if self.free:
+                return self.free.popleft()
+            self.allocated += 1
+            return FrameBuffers(self.shape)
+
+    def release(self, buffers):
+        if buffers is None:
+            return
+        with self.lock:
+            if buffers.shape == self.shape:
+                self.free.append(buffers)
+
+    def set_shape(self, shape):
+        with self.lock:
+            if shape != self.shape:
+                self.shape = shape
+                self.free.clear()
+
+class FrameCompositor:
+    def __init__(self, window_width, window_height):
+        self.window_width = window_width
+        self.window_height = window_height
+        self.output = None
+        self.camera_pane = None
+        self.keyboard_pane = None
+
+    def panes(self, camera_shape):
+        pane_width = int(self.window_height * camera_shape[1] / camera_shape[0])
+        if self.output is None or self.camera_pane.shape[1] != pane_width:
+            self.output = np.zeros((self.window_height, self.window_width + pane_width, 3), dtype=np.uint8)
+            self.camera_pane = self.output[:, :pane_width]
+            self.keyboard_pane = self.output[:, pane_width:]
+        return self.output, self.camera_pane, self.keyboard_pane
+
+class Frame:
+    def __init__(self, index, image, timestamp=None):
+        self.index = index
+        self.image = image
+        self.captured = time.perf_counter()
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.rgb = None
+        self.hands = DetectedHands()
+        self.inferred = False
+        self.transcripts = []
+        self.timings = None
+        self.mark = self.captured
+        self.buffers = None
+
+    def lap(self, stage):
+        # Only profiled frames carry a timings dict, so this is one attribute check when disabled
+        if self.timings is not None:
+            now = time.perf_counter()
+            self.timings[stage] = now - self.mark
+            self.mark = now
+
+class CameraSource:
+    def __init__(self, camera_index, width, height, fps=30):
+        self.cap = cv2.VideoCapture(camera_index)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
+        self.fps = fps
+        self.frame_index = 0
+        self.finished = False
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def pace(self):
+        pass
+
+    def read(self, out=None):
+        success, camera_img = self.cap.read() if out is None else self.cap.read(out)
+        if not success:
+            print("Failed to capture image")
+            return None
+        frame = Frame(self.frame_index, camera_img)
+        self.frame_index += 1
+        return frame
+
+    def skip(self, count):
+        # grab() takes frames off the driver without decoding them, so the next read is fresh
+        for _ in range(count):
+            self.cap.grab()
+        self.frame_index += count
+
+    def release(self):
+        self.cap.release()
+
+class ReplaySource:
+    def __init__(self, fps, realtime=False, transcripts=None):
+        self.fps = fps
+        self.realtime = realtime
+        self.transcripts = transcripts or {}
+        self.frame_index = 0
+        self.finished = False
+        self.started = None
+
+    def is_opened(self):
+        return True
+
+    def pace(self):
+        if not self.realtime:
+            return
+        if self.started is None:
+            self.started = time.perf_counter()
+        delay = self.started + self.frame_index / self.fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def skip(self, count):
+        self.frame_index += count
+
+    def make_frame(self, image, timestamp):
+        frame = Frame(self.frame_index, image, timestamp)
+        frame.transcripts = self.transcripts.get(self.frame_index, [])
+        self.frame_index += 1
+        return frame
+
+    def release(self):
+        pass
+
+class VideoFileSource(ReplaySource):
+    def __init__(self, path, realtime=False, transcripts=None):
+        self.cap = cv2.VideoCapture(path)
+        super().__init__(self.cap.get(cv2.CAP_PROP_FPS) or 30, realtime, transcripts)
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read(self, out=None):
+        success, camera_img = self.cap.read() if out is None else self.cap.read(out)
+        if not success:
+            self.finished = True
+            return None
+        return self.make_frame(camera_img, self.frame_index / self.fps)
+
+    def skip(self, count):
+        for _ in range(count):
+            if not self.cap.grab():
+                self.finished = True
+                return
+            self.frame_index += 1
+
+    def release(self):
+        self.cap.release()
+
+class LandmarkFileSource(ReplaySource):
+    # .npz with timestamps (n,), landmarks (n, hands, 21, 3), labels (n, hands) where '' marks
+    # an empty slot, and optional scores (n, hands) and frame_size (height, width)
+    def __init__(self, path, realtime=False, transcripts=None):
+        data = np.load(path)
+        self.timestamps = data['timestamps']
+        self.landmarks = data['landmarks']
+        self.labels = data['labels']
+        self.scores = data['scores'] if 'scores' in data else np.ones(self.labels.shape, dtype=np.float32)
+        self.frame_size = tuple(data['frame_size']) if 'frame_size' in data else (540, 960)
+        fps = (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0]) if len(self.timestamps) > 1 else 30
+        super().__init__(fps, realtime, transcripts)
+
+    def read(self, out=None):
+        if self.frame_index >= len(self.timestamps):
+            self.finished = True
+            return None
+        present = self.labels[self.frame_index] != ''
+        hands = DetectedHands(self.landmarks[self.frame_index][present].astype(np.float64),
+                              [str(label) for label in self.labels[self.frame_index][present]],
+                              [float(score) for score in self.scores[self.frame_index][present]])
+        frame = self.make_frame(np.zeros(self.frame_size + (3,), dtype=np.uint8),
+                                float(self.timestamps[self.frame_index]))
+        frame.hands = hands
+        frame.inferred = True
+        return frame
+
+HAND_LABELS = ["", "Left", "Right"]
+
+def landmark_record_dtype(max_hands):
+    # float64 like the live frames and .npz replays, so replaying a recording injects the same events
+    return np.dtype([("timestamp", "<f8"), ("count", "u1"), ("labels", "u1", (max_hands,)),
+                     ("scores", "<f8", (max_hands,)), ("landmarks", "<f8", (max_hands, 21, 3))])
+
+def store_hands(records, row, hands):
+    count = min(len(hands), records.dtype["labels"].shape[0])
+    records["count"][row] = count
+    records["labels"][row] = 0
+    records["landmarks"][row, :count] = hands.landmarks[:count]
+    for slot in range(count):
+        records["labels"][row, slot] = HAND_LABELS.index(hands.labels[slot])
+        records["scores"][row, slot] = hands.scores[slot]
+
+def load_hands(record):
+    count = int(record["count"])
+    return DetectedHands(record["landmarks"][:count], [HAND_LABELS[code] for code in record["labels"][:count]],
+                         record["scores"][:count])
+
+class LandmarkRecorder:
+    # Fixed-size records after a JSON header padded to 64 bytes, so a reader can memory-map them
+    magic = b"LMKREC01"
+
+    def __init__(self, path, max_hands=2, block_size=64):
+        self.path = path
+        self.max_hands = max_hands
+        self.block = np.zeros(block_size, dtype=landmark_record_dtype(max_hands))
+        self.filled = 0
+        self.frames = 0
+        self.file = None
+
+    @staticmethod
+    def header_size(length):
+        return -(-(len(LandmarkRecorder.magic) + 4 + length) // 64) * 64
+
+    def open(self, frame_size):
+        header = json.dumps({"version": 1, "max_hands": self.max_hands, "frame_size": list(frame_size),
+                             "labels": HAND_LABELS}).encode()
+        self.file = open(self.path, 'wb')
+        self.file.write(self.magic + len(header).to_bytes(4, 'little') + header)
+        self.file.write(b"\0" * (self.header_size(len(header)) - len(self.magic) - 4 - len(header)))
+
+    def append(self, timestamp, hands, frame_size):
+        if self.file is None:
+            self.open(frame_size)
+        # A handful of field writes into a preallocated block; the file only sees whole blocks
+        self.block["timestamp"][self.filled] = timestamp
+        store_hands(self.block, self.filled, hands)
+        self.filled += 1
+        self.frames += 1
+        if self.filled == len(self.block):
+            self.flush()
+
+    def flush(self):
+        if self.file is not None and self.filled:
+            self.block[:self.filled].tofile(self.file)
+            self.file.flush()
+            self.filled = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            print(f"Recorded {self.frames} frames of landmarks to {self.path}")
+
+class LandmarkRecording:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(LandmarkRecorder.magic)) != LandmarkRecorder.magic:
+                raise ValueError(f"{path} is not a landmark recording")
+            length = int.from_bytes(f.read(4), 'little')
+            self.header = json.loads(f.read(length))
+        self.dtype = landmark_record_dtype(self.header["max_hands"])
+        offset = LandmarkRecorder.header_size(length)
+        # A partially written trailing record (crash mid-block) is ignored
+        count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+        self.records = (np.memmap(path, dtype=self.dtype, mode='r', offset=offset, shape=(count,)) if count
+                        else np.zeros(0, dtype=self.dtype))
+        self.frame_size = tuple(self.header["frame_size"])
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def hands(self, index):
+        # Landmarks and scores are views into the mapped file, nothing is copied
+        return load_hands(self.records[index])
+
+    def chunks(self, size=4096):
+        for start in range(0, len(self.records), size):
+            yield self.records[start:start + size]
+
+class LandmarkRecordingSource(ReplaySource):
+    def __init__(self, path, realtime=False, transcripts=None):
+        self.recording = LandmarkRecording(path)
+        timestamps = self.recording.timestamps
+        fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 30
+        super().__init__(fps, realtime, transcripts)
+
+    def read(self, out=None):
+        if self.frame_index >= len(self.recording):
+            self.finished = True
+            return None
+        hands = self.recording.hands(self.frame_index)
+        frame = self.make_frame(np.zeros(self.recording.frame_size + (3,), dtype=np.uint8),
+                                float(self.recording.timestamps[self.frame_index]))
+        frame.hands = hands
+        frame.inferred = True
+        return frame
+
+class BackgroundTask:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self.value = self.factory()
+        except Exception as e:
+            self.error = e
+            print(f"Failed to initialize {self.name}: {e}")
+        self.seconds = time.perf_counter() - start
+        self.done.set()
+
+    def ready(self):
+        return self.done.is_set() and self.error is None
+
+    def result(self, timeout=None):
+        self.done.wait(timeout)
+        return self.value
 
 class MouseAndKeyboard:
-    def __init__(self):
-        self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
-            max_num_hands=2,
-            min_detection_confidence=0.8,
-            min_tracking_confidence=0.8
-        )
-        self.mp_draw = mp.solutions.drawing_utils
+    def __init__(self, input_backend=None, system_controller=None, enable_voice=True, async_input=True,
+                 preallocate=True, speech_backend="google", vosk_model=None, system_options=None):
+        # The Hands graph, the voice listener and the system controls are built by initialize(),
+        # off the path to the first frame
+        self.hands = None
+        self.hands_init = None
+        self.voice_init = None
+        self.system_init = None
+        self.system_options = system_options or {}
+        self.enable_voice = enable_voice
+        self.speech_backend = speech_backend
+        self.vosk_model = vosk_model
+        self.stop_listening = None
+        self.startup = {"created": time.perf_counter()}
         self.window_width = 960
         self.window_height = 540
-        self.system_controller = SystemController()
-        self.mouse = VirtualMouse(self.mp_hands, self.hands, self.mp_draw, 
-                                self.window_width, self.window_height)
-        self.keyboard = VirtualKeyboard(self.mp_hands, self.hands, self.mp_draw, 
-                                      self.window_width, self.window_height)
-        self.voice_handler = VoiceCommandHandler(self.system_controller)
+        self.window_name = "Virtual Mouse and Keyboard with Voice Control"
+        self.stats = StageStats()
+        self.running = False
+        self.display = True
+        self.display_every = 1
+        self.display_fps = None
+        self.frames_since_display = 0
+        self.last_display = 0
+        self.current_frame = None
+        self.profiler = None
+        self.tracker = None
+        self.classifier = None
+        self.idle_gate = None
+        self.landmark_recorder = None
+        self.buffer_pool = FrameBufferPool() if preallocate else None
+        self.compositor = FrameCompositor(self.window_width, self.window_height)
+        self.input = input_backend or InputBackend()
+        if async_input:
+            self.input = InputInjectionWorker(self.input)
+        # Only voice commands reach the system controls, so without voice they are never built
+        self.system_controller = system_controller
+        self.mouse = VirtualMouse(None, None, None, self.window_width, self.window_height, self.input)
+        self.keyboard = VirtualKeyboard(None, None, None, self.window_width, self.window_height, self.input)
+        # Replay runs commands inline so their events stay on the frame that triggered them
+        self.voice_handler = VoiceCommandHandler(self.system_controller, self.input,
+                                                 executor=CommandExecutor(synchronous=not async_input))
+
+    def initialize(self, wait=False):
+        if self.hands_init is None and not isinstance(self.tracker, ProcessHandTracker):
+            self.hands_init = BackgroundTask("hand tracking", lambda: mp.solutions.hands.Hands(**HAND_OPTIONS))
+        if self.system_init is None and self.system_controller is None and self.enable_voice:
+            self.system_init = BackgroundTask("system controls", self.build_system_controller)
+        if self.voice_init is None and self.enable_voice:
+            self.voice_init = BackgroundTask("voice commands", self.start_voice)
+        if wait and self.hands_init:
+            self.hands_init.result()
+            self.hand_model()
+
+    def build_system_controller(self):
+        self.system_controller = SystemController(**self.system_options)
+        self.voice_handler.system_controller = self.system_controller
+        self.mark_startup("system_ready")
+        return self.system_controller
+
+    def start_voice(self):
+        if self.system_init is not None and self.system_init.result() is None:
+            raise RuntimeError("system controls are unavailable")
+        # Listening starts once recognized commands have somewhere to go
+        self.system_controller.start()
+        self.voice_handler.backend = make_speech_backend(self.speech_backend, self.voice_handler.vocabulary(),
+                                                         self.vosk_model)
+        # Includes the ambient-noise calibration, which is why this runs in the background
         self.stop_listening = self.voice_handler.listen_in_background()
+        self.mark_startup("voice_ready")
 
-    def start(self):
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
+    def hand_model(self):
+        if self.hands is None and self.hands_init is not None and self.hands_init.ready():
+            self.hands = self.hands_init.value
+            if isinstance(self.tracker, AdaptiveHandTracker):
+                self.tracker.hands = self.hands
+            self.mark_startup("hands_ready")
+        return self.hands
+
+    def mark_startup(self, name):
+        self.startup.setdefault(name, time.perf_counter())
+
+    def startup_report(self):
+        origin = self.startup.get("start", self.startup["created"])
+        marks = sorted((when, name) for name, when in self.startup.items() if when >= origin and name != "start")
+        print("Startup: " + ", ".join(f"{name} {(when - origin) * 1000:.0f} ms" for when, name in marks))
+        loaded = sorted(IMPORT_TIMES.items(), key=lambda item: -item[1])
+        if loaded:
+            print("Deferred imports: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in loaded))
+
+    def open_camera(self):
+        source = CameraSource(0, self.window_width, self.window_height)
+        if not source.is_opened():
             print("Error: Could not open webcam")
-            return
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.window_width)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.window_height)
-        cap.set(cv2.CAP_PROP_FPS, 30)
-        
-        screen_width, screen_height = pyautogui.size()
+            return None
+        return source
+
+    def setup_window(self):
+        screen_width, screen_height = self.input.screen_size()
         window_x = 0
         window_y = screen_height - self.window_height - 40
         
-        WINDOW_NAME = "Virtual Mouse and Keyboard with Voice Control"
-        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
-        cv2.setWindowProperty(WINDOW_NAME, cv2.WND_PROP_TOPMOST, 1)
-        cv2.moveWindow(WINDOW_NAME, window_x, window_y)
-        cv2.resizeWindow(WINDOW_NAME, self.window_width, self.window_height)
+        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        cv2.setWindowProperty(self.window_name, cv2.WND_PROP_TOPMOST, 1)
+        cv2.moveWindow(self.window_name, window_x, window_y)
+        cv2.resizeWindow(self.window_name, self.window_width, self.window_height)
 
-        while True:
-            success, camera_img = cap.read()
-            if not success:
-                print("Failed to capture image")
-                continue
+    def enable_adaptive_inference(self, target_fps=30):
+        self.tracker = AdaptiveHandTracker(self.hands, target_fps=target_fps)
 
-            camera_img = cv2.flip(camera_img, 1)
-            camera_img = cv2.convertScaleAbs(camera_img, alpha=1.3, beta=30)
-            rgb_camera_img = cv2.cvtColor(camera_img, cv2.COLOR_BGR2RGB)
-            results = self.hands.process(rgb_camera_img)
-            
-            img = np.zeros((self.window_height, self.window_width, 3), dtype=np.uint8)
+    def enable_process_inference(self, timeout=1.0):
+        self.tracker = ProcessHandTracker(HAND_OPTIONS, timeout=timeout)
+
+    def start_recording(self, path):
+        self.landmark_recorder = LandmarkRecorder(path)
+
+    def configure_display(self, every=1, fps=None, headless=False):
+        self.display = not headless
+        self.display_every = max(1, every)
+        self.display_fps = fps
+
+    def enable_idle_gate(self, idle_after=5.0, idle_fps=4, **params):
+        self.idle_gate = IdleGate(idle_after, idle_fps, **params)
+
+    def set_pointer_filter(self, name, **params):
+        self.mouse.filter = make_pointer_filter(name, **params)
+        self.keyboard.filter = make_pointer_filter(name, **params)
+
+    def enable_word_prediction(self, path=WORD_PROFILE, seed_text=None, max_words=20000):
+        predictor = WordPredictor.load(path, max_words=max_words)
+        if seed_text and not predictor.words:
+            with open(seed_text, encoding="utf-8", errors="ignore") as f:
+                predictor.learn_text(f.read())
+        self.keyboard.enable_prediction(predictor)
+        print(f"Word prediction: {len(predictor.words)} words")
+
+    def enable_vad(self, **options):
+        self.voice_handler.vad_options = options
+
+    def load_gesture_profile(self, path):
+        self.classifier = GestureClassifier.load(path)
+        print(f"Loaded gesture profile {path}")
+
+    def calibrate(self, path, seconds=3.0, settle=1.5):
+        self.initialize()
+        source = self.open_camera()
+        if source is None:
+            return False
+        self.setup_window()
+        self.initialize(wait=True)
+        samples, labels, aspect = [], [], 1.0
+        try:
+            for gesture in GESTURES:
+                start = time.perf_counter()
+                while time.perf_counter() - start < settle + seconds:
+                    frame = self.capture_frame(source)
+                    if frame is None:
+                        continue
+                    self.infer_frame(frame)
+                    aspect = frame.image.shape[1] / frame.image.shape[0]
+                    # The settle period gives the user time to form the pose before samples count
+                    recording = time.perf_counter() - start >= settle
+                    if recording and len(frame.hands):
+                        samples.extend(frame.hands.landmarks)
+                        labels.extend([gesture] * len(frame.hands))
+                    draw_hands(frame.image, frame.hands)
+                    cv2.putText(frame.image, f"{'Recording' if recording else 'Get ready'}: {GESTURE_PROMPTS[gesture]}",
+                                (10, 30), cv2.FONT_HERSHEY_PLAIN, 1.5, (0, 0, 255) if recording else (0, 255, 255), 2)
+                    cv2.imshow(self.window_name, frame.image)
+                    self.release_frame_buffers(frame.buffers)
+                    if cv2.waitKey(1) == ord('q'):
+                        print("Calibration cancelled")
+                        return False
+        finally:
+            source.release()
+            cv2.destroyAllWindows()
+
+        missing = [gesture for gesture in GESTURES if gesture not in labels]
+        if missing:
+            print(f"Calibration failed: no hand seen for {', '.join(missing)}")
+            return False
+        samples = np.array(samples)
+        classifier = GestureClassifier.fit(samples, labels, aspect)
+        classifier.save(path, samples, labels, aspect)
+        self.classifier = classifier
+        print(f"Saved gesture profile {path} from {len(samples)} samples")
+        return True
+
+    def enable_profiling(self, overlay=False, jsonl_path=None):
+        self.profiler = FrameProfiler(overlay=overlay, jsonl_path=jsonl_path)
+
+    def capture_frame(self, source):
+        if self.idle_gate:
+            source.skip(self.idle_gate.frames_to_skip(source.fps))
+        source.pace()
+        buffers = self.buffer_pool.acquire() if self.buffer_pool else None
+        start = time.perf_counter()
+        frame = source.read(buffers.capture if buffers else None)
+        if frame is None:
+            self.release_frame_buffers(buffers)
+            return None
+        self.stats.record("capture", frame.captured - start)
+        if self.profiler:
+            frame.timings = {"capture": frame.captured - start}
+        if self.buffer_pool:
+            if buffers is not None and frame.image is buffers.capture:
+                frame.buffers = buffers
+            else:
+                # First frame, or the source changed resolution: size the pool from it
+                self.release_frame_buffers(buffers)
+                self.buffer_pool.set_shape(frame.image.shape)
+        return frame
+
+    def release_frame_buffers(self, buffers):
+        if self.buffer_pool:
+            self.buffer_pool.release(buffers)
+
+    def observe_hands(self, frame):
+        if self.idle_gate:
+            self.idle_gate.observe(frame.timestamp, len(frame.hands))
+        if self.landmark_recorder:
+            self.landmark_recorder.append(frame.timestamp, frame.hands, frame.image.shape[:2])
+
+    def infer_frame(self, frame):
+        if frame.inferred:
+            self.observe_hands(frame)
+            return
+        start = time.perf_counter()
+        frame.lap("inference_queue")
+        buffers = frame.buffers
+        if buffers is not None:
+            cv2.flip(frame.image, 1, dst=buffers.flipped)
+            frame.lap("flip")
+            frame.image = cv2.LUT(buffers.flipped, self.buffer_pool.lut, dst=buffers.bgr)
+            frame.lap("brightness")
+            frame.rgb = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB, dst=buffers.rgb)
+            frame.lap("cvtColor")
+        else:
+            camera_img = cv2.flip(frame.image, 1)
+            frame.lap("flip")
+            frame.image = cv2.convertScaleAbs(camera_img, alpha=1.3, beta=30)
+            frame.lap("brightness")
+            frame.rgb = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+            frame.lap("cvtColor")
+        if self.idle_gate and not self.idle_gate.should_infer(frame.rgb):
+            frame.lap("idle_gate")
+        elif isinstance(self.tracker, ProcessHandTracker):
+            frame.hands = self.tracker.process(frame.rgb)
+            frame.lap("hands_process")
+        elif self.hand_model() is None:
+            # Still loading in the background: the preview runs, gestures start once the model is in
+            frame.lap("hands_loading")
+        elif self.tracker:
+            frame.hands = self.tracker.process(frame.rgb)
+            frame.lap("hands_process")
+        else:
+            results = self.hands.process(frame.rgb)
+            frame.lap("hands_process")
+            frame.hands = DetectedHands.from_results(results)
+            frame.lap("landmark_arrays")
+        frame.inferred = True
+        self.observe_hands(frame)
+        self.stats.record("inference", time.perf_counter() - start)
+
+    def display_due(self):
+        if not self.display:
+            return False
+        self.frames_since_display += 1
+        if self.frames_since_display < self.display_every:
+            return False
+        now = time.perf_counter()
+        if self.display_fps and now - self.last_display < 1 / self.display_fps:
+            return False
+        self.frames_since_display = 0
+        self.last_display = now
+        return True
+
+    def process_frame(self, frame):
+        camera_img = frame.image
+        hands = frame.hands
+        self.current_frame = frame
+        # Gestures and voice run on every frame; the preview is only drawn when it is due
+        draw = self.display_due()
+
+        img = None
+        if draw:
+            if self.buffer_pool:
+                combined_img, camera_pane, img = self.compositor.panes(camera_img.shape)
+            else:
+                img = np.zeros((self.window_height, self.window_width, 3), dtype=np.uint8)
             self.keyboard.draw_keyboard(img)
+            frame.lap("draw_keyboard")
+            draw_hands(camera_img, hands)
+            frame.lap("draw_landmarks")
+        if self.classifier and len(hands):
+            # Every detected hand is classified in one vectorized call
+            hands.gestures = self.classifier.predict(hands.landmarks, camera_img.shape[1] / camera_img.shape[0])
+            frame.lap("classify_gestures")
 
-            right_hand_index = None
-            left_hand_index = None
-
-            if results.multi_hand_landmarks:
-                for idx, hand_landmarks in enumerate(results.multi_hand_landmarks):
-                    self.mp_draw.draw_landmarks(
-                        camera_img, hand_landmarks, self.mp_hands.HAND_CONNECTIONS,
-                        self.mp_draw.DrawingSpec(color=(255,0,255), thickness=2, circle_radius=4),
-                        self.mp_draw.DrawingSpec(color=(0,255,0), thickness=2)
-                    )
-                    hand_type = results.multi_handedness[idx].classification[0].label
-                    if hand_type == "Right":
-                        right_hand_index = idx
-                    elif hand_type == "Left":
-                        left_hand_index = idx
-
-            if right_hand_index is not None:
-                self.mouse.handle_hand_gestures(results, right_hand_index, camera_img)
-            if left_hand_index is not None:
-                self.keyboard.handle_hand_gestures(results, left_hand_index, img)
-                
-            self.voice_handler.process_commands()
+        right_hand_index = hands.index_of("Right")
+        left_hand_index = hands.index_of("Left")
+        if len(hands):
+            self.mark_startup("first_gesture")
+
+        # Called without a hand too, so a drag in progress is released and the pointer filters
+        # restart from wherever the hand comes back
+        self.mouse.handle_hand_gestures(hands, right_hand_index, camera_img if draw else None,
+                                        frame.timestamp, camera_img.shape)
+        frame.lap("mouse_gestures")
+        self.keyboard.handle_hand_gestures(hands, left_hand_index, img, frame.timestamp)
+        frame.lap("keyboard_gestures")
+            
+        for text in frame.transcripts:
+            self.voice_handler.handle_transcript(text)
+        self.voice_handler.process_commands()
+        frame.lap("process_commands")
+        if not draw:
+            return None
 
+        if self.buffer_pool:
+            cv2.resize(camera_img, (camera_pane.shape[1], camera_pane.shape[0]), dst=camera_pane)
+            frame.lap("resize")
+        else:
             camera_img = cv2.resize(camera_img, 
                                   (int(self.window_height * camera_img.shape[1] / camera_img.shape[0]), 
                                   self.window_height))
+            frame.lap("resize")
             combined_img = np.zeros((self.window_height, self.window_width + camera_img.shape[1], 3), 
                                   dtype=np.uint8)
             combined_img[:, :camera_img.shape[1]] = camera_img
             combined_img[:, camera_img.shape[1]:] = img
-            
-            cv2.putText(combined_img, "Voice: Listening | Say 'open [app]', 'increase volume', or 'help'", 
-                       (10, 20), cv2.FONT_HERSHEY_PLAIN, 1.5, (0, 255, 255), 2)
+        
+        if self.idle_gate and not self.idle_gate.active:
+            cv2.putText(combined_img, "Idle: waiting for motion", (10, self.window_height - 15),
+                        cv2.FONT_HERSHEY_PLAIN, 1.2, (0, 165, 255), 2)
+        if self.hands_init and not self.hands_init.done.is_set():
+            cv2.putText(combined_img, "Loading hand tracking...", (10, self.window_height - 40),
+                        cv2.FONT_HERSHEY_PLAIN, 1.2, (0, 165, 255), 2)
+        if self.voice_init and not self.voice_init.done.is_set():
+            status, color = "Voice: starting up", (0, 165, 255)
+        else:
+            status, color = self.voice_handler.status_line()
+        cv2.putText(combined_img, status, (10, 20), cv2.FONT_HERSHEY_PLAIN, 1.5, color, 2)
+        if self.profiler and self.profiler.overlay:
+            self.profiler.draw_overlay(combined_img, (combined_img.shape[1] - self.window_width + 10, 45))
+        frame.lap("composite")
+        return combined_img
+
+    def render_frame(self, frame):
+        start = time.perf_counter()
+        frame.lap("render_queue")
+        combined_img = self.process_frame(frame)
 
-            cv2.imshow(WINDOW_NAME, combined_img)
-            if cv2.waitKey(1) == ord('q') or cv2.getWindowProperty(WINDOW_NAME, cv2.WND_PROP_VISIBLE) < 1:
+        keep_running = True
+        if combined_img is not None:
+            cv2.imshow(self.window_name, combined_img)
+            frame.lap("imshow")
+            key = cv2.waitKey(1)
+            frame.lap("waitKey")
+            keep_running = not (key == ord('q') or 
+                                cv2.getWindowProperty(self.window_name, cv2.WND_PROP_VISIBLE) < 1)
+        self.mark_startup("first_frame")
+        self.release_frame_buffers(frame.buffers)
+        frame.buffers = None
+        end = time.perf_counter()
+        self.stats.record("render", end - start)
+        self.stats.record("end_to_end", end - frame.captured)
+        if frame.timings is not None:
+            frame.timings["end_to_end"] = end - frame.captured
+            self.profiler.commit(frame)
+        return keep_running
+
+    def run_serial(self, source):
+        while True:
+            frame = self.capture_frame(source)
+            if frame is None:
+                if source.finished:
+                    break
+                continue
+            self.infer_frame(frame)
+            if not self.render_frame(frame):
                 break
-                
-        cap.release()
-        if self.stop_listening:
-            self.stop_listening()
-        cv2.destroyAllWindows()
+
+    def run_pipelined(self, source):
+        # Unpaced replay has no stale frames, only a backlog: every frame is dispatched, so the
+        # injected events do not depend on thread timing
+        lossless = isinstance(source, ReplaySource) and not source.realtime
+        captured = LatestFrameQueue(lossless)
+        inferred = LatestFrameQueue(lossless)
+        self.running = True
+
+        def capture_worker():
+            while self.running and not source.finished:
+                frame = self.capture_frame(source)
+                if frame is not None:
+                    dropped = captured.put(frame)
+                    if dropped is not None:
+                        self.release_frame_buffers(dropped.buffers)
+            captured.close()
+
+        def inference_worker():
+            while self.running:
+                frame = captured.get(timeout=0.1)
+                if frame is None:
+                    if captured.closed:
+                        break
+                    continue
+                self.infer_frame(frame)
+                dropped = inferred.put(frame)
+                if dropped is not None:
+                    self.release_frame_buffers(dropped.buffers)
+            inferred.close()
+
+        workers = [threading.Thread(target=capture_worker, daemon=True),
+                   threading.Thread(target=inference_worker, daemon=True)]
+        for worker in workers:
+            worker.start()
+        try:
+            while self.running:
+                frame = inferred.get(timeout=0.1)
+                if frame is None:
+                    if inferred.closed:
+                        break
+                    # Keep the window responsive while inference catches up
+                    if self.display and cv2.waitKey(1) == ord('q'):
+                        break
+                    continue
+                if not self.render_frame(frame):
+                    break
+        finally:
+            self.running = False
+            # Wakes a producer waiting on a lossless queue
+            captured.close()
+            inferred.close()
+            for worker in workers:
+                worker.join(timeout=1)
+            print(f"Dropped stale frames: {captured.dropped} before inference, "
+                  f"{inferred.dropped} before render")
+
+    def start(self, pipelined=False, source=None):
+        self.startup["start"] = time.perf_counter()
+        # Model loading and voice calibration overlap the camera open instead of preceding it
+        self.initialize()
+        source = source or self.open_camera()
+        if source is None:
+            return
+        self.mark_startup("camera_open")
+        if self.display:
+            self.setup_window()
+        else:
+            print("Running headless: press Ctrl+C to stop")
+        self.stats = StageStats()
+
+        try:
+            if pipelined:
+                self.run_pipelined(source)
+            else:
+                self.run_serial(source)
+        finally:
+            source.release()
+            if self.voice_init:
+                self.voice_init.result(timeout=2)
+            if self.stop_listening:
+                self.stop_listening()
+            if self.voice_handler.vad:
+                self.voice_handler.vad.report()
+            # Headless OpenCV builds raise here, which would skip the reports below
+            if self.display:
+                cv2.destroyAllWindows()
+            print("Pipelined mode:" if pipelined else "Serial mode:")
+            self.startup_report()
+            self.stats.report()
+            self.voice_handler.executor.close()
+            self.voice_handler.executor.report()
+            if self.system_controller is not None:
+                self.system_controller.close()
+            if isinstance(self.input, InputInjectionWorker):
+                self.input.close()
+                self.input.report()
+            if self.profiler:
+                self.profiler.report()
+                self.profiler.close()
+            if self.idle_gate:
+                self.idle_gate.report()
+            if self.landmark_recorder:
+                self.landmark_recorder.close()
+            if isinstance(self.tracker, ProcessHandTracker):
+                self.tracker.close()
+            if self.keyboard.predictor:
+                self.keyboard.predictor.save(self.keyboard.predictor.path)
+
+class ReplayHarness:
+    def __init__(self, path, realtime=False, transcripts=None, screen_size=(1920, 1080)):
+        # Events are stamped with the frame being dispatched, not the frame being captured
+        self.recorder = EventRecorder(lambda: self.app.current_frame)
+        self.app = MouseAndKeyboard(input_backend=RecordingInputBackend(self.recorder, screen_size),
+                                    system_controller=RecordingSystemController(self.recorder),
+                                    enable_voice=False, async_input=False)
+        self.app.display = False
+        if path.endswith('.npz'):
+            self.source = LandmarkFileSource(path, realtime, transcripts)
+        elif path.endswith('.lmk'):
+            self.source = LandmarkRecordingSource(path, realtime, transcripts)
+        else:
+            self.source = VideoFileSource(path, realtime, transcripts)
+
+    def run(self, pipelined=False):
+        if not self.source.is_opened():
+            raise IOError("Could not open replay input")
+        # Landmark recordings never touch the model; video replay waits for it so no frame goes undetected
+        if isinstance(self.source, VideoFileSource):
+            self.app.initialize(wait=True)
+        self.app.stats = StageStats(window=None)
+        if self.app.profiler:
+            self.app.profiler.stats = StageStats(window=None)
+        self.recorder.events = []
+        start = time.perf_counter()
+        try:
+            if pipelined:
+                self.app.run_pipelined(self.source)
+            else:
+                self.app.run_serial(self.source)
+        finally:
+            self.source.release()
+            if self.app.profiler:
+                self.app.profiler.close()
+        elapsed = time.perf_counter() - start
+
+        frames = self.app.stats.counts.get("end_to_end", 0)
+        latency = self.app.stats.percentiles("end_to_end")
+        return {
+            "frames": frames,
+            "fps": frames / elapsed if elapsed else 0.0,
+            "latency_ms": dict(zip(("p50", "p95", "p99"), latency.tolist())) if latency is not None else {},
+            "events": self.recorder.events,
+        }
+
+def load_transcripts(path):
+    # JSON object mapping a frame index to the transcripts heard at that frame
+    with open(path) as f:
+        return {int(index): texts if isinstance(texts, list) else [texts] for index, texts in json.load(f).items()}
+
+def parse_filter_params(args):
+    params = {"lead": args.pointer_lead}
+    for item in args.filter_param:
+        key, _, value = item.partition("=")
+        params[key.replace("-", "_")] = float(value)
+    return params
+
+def run_replay(args):
+    transcripts = load_transcripts(args.transcripts) if args.transcripts else None
+    harness = ReplayHarness(args.replay, realtime=args.realtime, transcripts=transcripts)
+    harness.app.set_pointer_filter(args.pointer_filter, **parse_filter_params(args))
+    if args.gesture_profile:
+        harness.app.load_gesture_profile(args.gesture_profile)
+    if args.idle_after:
+        harness.app.enable_idle_gate(args.idle_after, args.idle_fps)
+    if args.record:
+        harness.app.start_recording(args.record)
+    if args.adaptive_inference:
+        harness.app.enable_adaptive_inference(args.target_fps)
+    if args.profile or args.profile_jsonl:
+        harness.app.enable_profiling(jsonl_path=args.profile_jsonl)
+    report = harness.run(pipelined=args.pipelined)
+    if harness.app.landmark_recorder:
+        harness.app.landmark_recorder.close()
+    latency = report["latency_ms"]
+    print(f"Replayed {report['frames']} frames at {report['fps']:.1f} fps")
+    if latency:
+        print(f"Per-frame latency: p50 {latency['p50']:.1f} ms | p95 {latency['p95']:.1f} ms | p99 {latency['p99']:.1f} ms")
+    print(f"Injected input events: {len(report['events'])}")
+    if harness.app.profiler:
+        harness.app.profiler.report()
+
+    if args.events_out:
+        with open(args.events_out, 'w') as f:
+            json.dump(report["events"], f, indent=1)
+    if args.expect:
+        with open(args.expect) as f:
+            expected = json.load(f)
+        for position, (got, want) in enumerate(zip(report["events"], expected)):
+            if got != want:
+                print(f"Event {position} differs: expected {want}, got {got}")
+                return False
+        if len(report["events"]) != len(expected):
+            print(f"Expected {len(expected)} events, got {len(report['events'])}")
+            return False
+        print("Event sequence matches")
+    return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vision-driven virtual mouse and keyboard with voice control")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="run capture, hand inference and rendering as separate stages")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="headless replay of a video file or .npz/.lmk landmark recording instead of the webcam")
+    parser.add_argument("--record", metavar="LMK", help="append every frame's detected hands to a landmark recording")
+    parser.add_argument("--realtime", action="store_true", help="pace replay at the recording's frame rate")
+    parser.add_argument("--transcripts", metavar="JSON", help="voice transcripts to inject during replay, keyed by frame")
+    parser.add_argument("--events-out", metavar="JSON", help="write the injected input events of a replay")
+    parser.add_argument("--expect", metavar="JSON", help="fail if the replay's input events differ from this file")
+    parser.add_argument("--adaptive-inference", action="store_true",
+                        help="run hand inference on a fixed crop around the tracked hands, re-anchored on full frames")
+    parser.add_argument("--inference-process", action="store_true",
+                        help="run hand detection in a worker process fed through shared memory (replaces --adaptive-inference)")
+    parser.add_argument("--target-fps", type=float, default=30, help="frame rate adaptive inference tries to hold by re-anchoring less often")
+    parser.add_argument("--pointer-filter", choices=sorted(POINTER_FILTERS), default="one-euro",
+                        help="smoothing for the mouse and keyboard cursors; exponential is the old fixed step")
+    parser.add_argument("--pointer-lead", type=float, default=0.0, metavar="SECONDS",
+                        help="extrapolate the cursor this far ahead along its velocity")
+    parser.add_argument("--filter-param", action="append", default=[], metavar="KEY=VALUE",
+                        help="pointer filter parameter, e.g. min_cutoff=0.3, beta=0.004, process_noise=1e6")
+    parser.add_argument("--gesture-profile", metavar="NPZ",
+                        help=f"calibrated gesture classifier to use instead of fixed thresholds (default {GESTURE_PROFILE} if present)")
+    parser.add_argument("--calibrate", nargs="?", const=GESTURE_PROFILE, metavar="NPZ",
+                        help="record each gesture from the webcam and save a personal gesture profile")
+    parser.add_argument("--idle-after", type=float, metavar="SECONDS",
+                        help="drop to a low polling rate with motion-gated inference after this long without a hand")
+    parser.add_argument("--idle-fps", type=float, default=4, help="polling rate while idle")
+    parser.add_argument("--predict-words", nargs="?", const=WORD_PROFILE, metavar="JSON",
+                        help="suggest word completions above the keyboard, learning from what is typed")
+    parser.add_argument("--word-seed", metavar="TEXT", help="text file to learn an initial vocabulary from")
+    parser.add_argument("--max-words", type=int, default=20000, help="vocabulary size kept by word prediction")
+    parser.add_argument("--headless", action="store_true",
+                        help="no preview window; gestures and voice keep working")
+    parser.add_argument("--display-every", type=int, default=1, metavar="N", help="draw the preview every Nth frame")
+    parser.add_argument("--display-fps", type=float, help="cap the preview at this frame rate")
+    parser.add_argument("--speech-backend", choices=["google", "vosk"], default="google",
+                        help="speech recognizer for voice commands; vosk runs offline")
+    parser.add_argument("--vosk-model", metavar="DIR", help="path to a downloaded vosk model")
+    parser.add_argument("--vad", action="store_true",
+                        help="detect speech in the microphone stream and only recognize complete utterances")
+    parser.add_argument("--vad-hangover", type=float, default=0.35, metavar="SECONDS",
+                        help="silence that ends an utterance")
+    parser.add_argument("--vad-pre-roll", type=float, default=0.3, metavar="SECONDS",
+                        help="audio kept from before speech onset")
+    parser.add_argument("--app-config", metavar="JSON",
+                        help="extra voice-launchable apps and directories to index for 'open [app]'")
+    parser.add_argument("--screenshot-dir", default=".", help="where voice screenshots are written")
+    parser.add_argument("--screenshot-format", choices=sorted(ScreenshotService.extensions), default="png")
+    parser.add_argument("--screenshot-quality", type=int,
+                        help="PNG compression 0-9 or JPEG/WebP quality 0-100")
+    parser.add_argument("--screenshot-burst", type=int, default=0, metavar="N",
+                        help="keep the last N screenshots in memory until 'save screenshots' is said")
+    parser.add_argument("--profile", action="store_true", help="collect per-stage latency percentiles")
+    parser.add_argument("--profile-overlay", action="store_true", help="show per-stage latency in the preview window")
+    parser.add_argument("--profile-jsonl", metavar="PATH", help="stream per-frame stage timings to a JSONL file")
+    args = parser.parse_args()
+    if args.replay:
+        sys.exit(0 if run_replay(args) else 1)
+    if args.calibrate:
+        sys.exit(0 if MouseAndKeyboard(enable_voice=False).calibrate(args.calibrate) else 1)
     try:
-        MouseAndKeyboard().start()
+        screenshots = ScreenshotService(args.screenshot_dir, args.screenshot_format, args.screenshot_quality,
+                                        burst=args.screenshot_burst)
+        app = MouseAndKeyboard(speech_backend=args.speech_backend, vosk_model=args.vosk_model,
+                               system_options={"app_config": args.app_config, "screenshot_service": screenshots})
+        app.set_pointer_filter(args.pointer_filter, **parse_filter_params(args))
+        app.configure_display(args.display_every, args.display_fps, args.headless)
+        if args.record:
+            app.start_recording(args.record)
+        profile = args.gesture_profile or (GESTURE_PROFILE if os.path.exists(GESTURE_PROFILE) else None)
+        if profile:
+            app.load_gesture_profile(profile)
+        if args.adaptive_inference:
+            app.enable_adaptive_inference(args.target_fps)
+        if args.inference_process:
+            app.enable_process_inference()
+        if args.idle_after:
+            app.enable_idle_gate(args.idle_after, args.idle_fps)
+        if args.vad:
+            app.enable_vad(hangover=args.vad_hangover, pre_roll=args.vad_pre_roll)
+        if args.predict_words:
+            app.enable_word_prediction(args.predict_words, args.word_seed, args.max_words)
+        if args.profile or args.profile_overlay or args.profile_jsonl:
+            app.enable_profiling(overlay=args.profile_overlay, jsonl_path=args.profile_jsonl)
+        app.start(pipelined=args.pipelined)
+    except KeyboardInterrupt:
+        print("Stopped")
     except Exception as e:
         print(f"Error: {e}")
\ No newline at end of file